@@ -857,7 +857,9 @@ def context(fname, node):
 class ValidatingXmlParser(object):
     """
     Validating XML Parser based on Expat. It has two methods `.parse_file`
-    and `.parse_bytes` returning a validated :class:`Node` object.
+    and `.parse_bytes` returning a validated :class:`Node` object and
+    a method `.iterparse` yielding the validated nodes as soon as they
+    are closed.
 
     :param validators: a dictionary of validation functions
     :param stop: the tag where to stop the parsing (if any)
@@ -868,6 +870,8 @@ class ValidatingXmlParser(object):
     def __init__(self, validators, stop=None):
         self.validators = validators
         self.stop = stop
+        self.depths = ()
+        self.closed = []
 
     @contextmanager
     def _context(self):
@@ -921,6 +925,33 @@ class ValidatingXmlParser(object):
                     self.p.ParseFile(f)
         return self._root
 
+    def iterparse(self, file_or_fname, depths, bufsize=1024 * 1024):
+        """
+        Parse a file or a filename incrementally, yielding pairs
+        (depth, node) for the validated nodes at the given depths
+        (0 for the root node) as soon as their closing tag is parsed.
+        The nodes are still attached to their parent, so the caller can
+        free memory by clearing their subnodes.
+        """
+        self.depths = set(depths)
+        self.closed = []
+        f = (file_or_fname if hasattr(file_or_fname, 'read')
+             else open(file_or_fname, 'rb'))
+        try:
+            with self._context():
+                self.filename = getattr(f, 'name', f.__class__.__name__)
+                for chunk in iter(lambda: f.read(bufsize), b''):
+                    self.p.Parse(chunk, False)
+                    yield from self.closed
+                    self.closed.clear()
+                self.p.Parse(b'', True)
+                yield from self.closed
+        finally:
+            self.closed = []
+            self.depths = ()
+            if f is not file_or_fname:
+                f.close()
+
     def _start_element(self, longname, attrs):
         try:
             _xmlns, name = longname.split('}')
@@ -944,6 +975,9 @@ class ValidatingXmlParser(object):
         del self._ancestors[-1]
         if self._ancestors:
             self._ancestors[-1].append(self._root)
+        depth = len(self._ancestors)
+        if depth in self.depths:
+            self.closed.append((depth, self._root))
 
     def _char_data(self, data):
         if data:
@@ -194,6 +194,7 @@ import logging
 import operator
 import tempfile
 import traceback
+import copyreg
 import collections
 from unittest import mock
 import multiprocessing.dummy
@@ -216,6 +217,8 @@ sys.setrecursionlimit(2000)  # raised to make pickle happier
 submit = CallableDict()
 MB = 1024 ** 2
 GB = 1024 ** 3
+OOB_MIN = 64 * 1024  # buffers smaller than that are pickled in-band
+DYNAMIC_FACTOR = 4  # number of chunks per task in dynamic mode
 host_cores = config.zworkers.host_cores.split(',')
 
 
@@ -283,36 +286,66 @@ class Pickled(object):
     """
     An utility to manually pickling/unpickling objects. Pickled instances
     have a nice string representation and length giving the size
-    of the pickled bytestring.
+    of the pickled bytestring (including the out-of-band buffers).
+
+    With oob=True the large buffers (i.e. the data of numpy arrays)
+    are not copied inside the bytestring: they are kept as PickleBuffers
+    and sent as separate zmq frames by :class:`Socket`, without copies.
 
     :param obj: the object to pickle
+    :param oob: if True, keep the buffers bigger than OOB_MIN out-of-band
     """
     compressed = False
+    buffers = ()
 
-    def __init__(self, obj):
+    def __init__(self, obj, oob=False):
         self.clsname = obj.__class__.__name__
         self.calc_id = str(getattr(obj, 'calc_id', ''))  # for monitors
+        oob = oob and not config.distribution.compress
+        buffers = []
         try:
-            self.pik = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+            self.pik = pickle.dumps(
+                obj, 5, buffer_callback=_oob(buffers) if oob else None)
         except TypeError as exc:  # can't pickle, show the obj in the message
             raise TypeError('%s: %s' % (exc, obj))
+        if buffers:
+            self.buffers = buffers
         self.compressed = len(self.pik) > MB and config.distribution.compress
         if self.compressed:
             self.pik = compress(self.pik)
 
+    def __reduce_ex__(self, protocol):
+        # PickleBuffers can be pickled only with protocol 5 (the one used
+        # by zeromq.Socket); convert them into bytes for lower protocols
+        state = self.__dict__.copy()
+        if protocol < 5 and self.buffers:
+            state['buffers'] = [bytes(buf) for buf in self.buffers]
+        return copyreg.__newobj__, (self.__class__,), state
+
     def __repr__(self):
         """String representation of the pickled object"""
         return '<Pickled %s #%s %s>' % (
             self.clsname, self.calc_id, humansize(len(self)))
 
     def __len__(self):
-        """Length of the pickled bytestring"""
-        return len(self.pik)
+        """Length of the pickled bytestring plus the out-of-band buffers"""
+        return len(self.pik) + sum(
+            memoryview(buf).nbytes for buf in self.buffers)
 
     def unpickle(self):
         """Unpickle the underlying object"""
         pik = decompress(self.pik) if self.compressed else self.pik
-        return pickle.loads(pik)
+        return pickle.loads(pik, buffers=self.buffers)
+
+
+def _oob(buffers):
+    # returns a buffer_callback keeping the large buffers out-of-band;
+    # a true return value means that the buffer is pickled in-band
+    def callback(buf):
+        if buf.raw().nbytes < OOB_MIN:
+            return True
+        buffers.append(buf)
+    return callback
 
 
 def get_pickled_sizes(obj):
@@ -381,7 +414,7 @@ class Result(object):
 
     def __init__(self, val, mon, tb_str='', msg=''):
         if isinstance(val, dict):
-            self.pik = Pickled(val)
+            self.pik = Pickled(val, oob=True)
             self.nbytes = {k: len(Pickled(v)) for k, v in val.items()}
         elif isinstance(val, tuple) and callable(val[0]):
             self.func = val[0]
@@ -391,7 +424,7 @@ class Result(object):
             self.pik = Pickled(None)
             self.nbytes = {}
         else:
-            self.pik = Pickled(val)
+            self.pik = Pickled(val, oob=True)
             self.nbytes = {'tot': len(self.pik)}
         self.mon = mon
         self.tb_str = tb_str
@@ -471,6 +504,8 @@ DEBUG = False
 def sendback(res, zsocket):
     """
     Send back to the master node the result by using the zsocket.
+    Since the out-of-band buffers are sent without copies, wait until
+    zmq has released them, so that the task can safely modify its arrays.
 
     :returns: the accumulated number of bytes sent
     """
@@ -479,6 +514,7 @@ def sendback(res, zsocket):
     nbytes = len(res.pik)
     try:
         zsocket.send(res)
+        zsocket.wait_sent()
         if DEBUG:
             from openquake.commonlib.logs import dblog
             if calc_id:  # None when building the png maps
@@ -494,6 +530,14 @@ def sendback(res, zsocket):
     return nbytes
 
 
+def _flush_logs():
+    # store the log records of the task before sending TASK_ENDED, so
+    # that they are in the database before the job is marked as finished
+    if DEBUG:
+        from openquake.commonlib.logs import LOG_BUFFER
+        LOG_BUFFER.flush(sync=True)
+
+
 def safely_call(func, args, task_no=0, mon=dummy_mon):
     """
     Call the given function with the given arguments safely, i.e.
@@ -534,6 +578,7 @@ def safely_call(func, args, task_no=0, mon=dummy_mon):
                 res = Result.new(next, (it,), mon, sentbytes)
                 # StopIteration -> TASK_ENDED
                 if res.msg == 'TASK_ENDED':
+                    _flush_logs()
                     zsocket.send(res)
                     break
                 sentbytes += sendback(res, zsocket)
@@ -542,6 +587,7 @@ def safely_call(func, args, task_no=0, mon=dummy_mon):
         # send back a single result and a TASK_ENDED
         with Socket(mon.backurl, zmq.PUSH, 'connect') as zsocket:
             sentbytes += sendback(res, zsocket)
+            _flush_logs()
             end = Result(None, mon, msg='TASK_ENDED')
             end.pik = FakePickle(sentbytes)
             zsocket.send(end)
@@ -661,9 +707,10 @@ class SharedArray(object):
         self.sm = shmem.SharedMemory(create=True, size=int(nbytes))
         self.shape = shape
         self.dtype = dtype
-        # fill the SharedMemory buffer with the value
-        arr = numpy.ndarray(shape, dtype, buffer=self.sm.buf)
-        arr[:] = value
+        if value is not None:
+            # fill the SharedMemory buffer with the value
+            arr = numpy.ndarray(shape, dtype, buffer=self.sm.buf)
+            arr[:] = value
 
     def __enter__(self):
         # this is called in the workers
@@ -737,13 +784,19 @@ class Starmap(object):
     def apply(cls, task, allargs, concurrent_tasks=None,
               maxweight=None, weight=lambda item: 1,
               key=lambda item: 'Unspecified',
-              distribute=None, progress=logging.info, h5=None):
+              distribute=None, progress=logging.info, h5=None,
+              dynamic=False):
         r"""
         Apply a task to a tuple of the form (sequence, \*other_args)
         by first splitting the sequence in chunks, according to the weight
         of the elements and possibly to a key (see :func:
         `openquake.baselib.general.split_in_blocks`).
 
+        In dynamic mode the sequence is split in DYNAMIC_FACTOR times more
+        chunks, which are kept in the task queue of the master and
+        submitted heaviest first as the workers free up; in this way a
+        bad weight estimate produces a small straggler, not a big one.
+
         :param task: a task to run in parallel
         :param args: the arguments to be passed to the task function
         :param concurrent_tasks: hint about how many tasks to generate
@@ -753,30 +806,43 @@ class Starmap(object):
         :param distribute: if not given, inferred from OQ_DISTRIBUTE
         :param progress: logging function to use (default logging.info)
         :param h5: an open hdf5.File where to store the performance info
+        :param dynamic: if True, use many small chunks (default False)
         :returns: an :class:`IterResult` object
         """
         arg0, *args = allargs
-        if maxweight:  # block_splitter is lazy
+        if maxweight and not dynamic:  # block_splitter is lazy
             taskargs = ([blk] + args for blk in block_splitter(
                 arg0, maxweight, weight, key))
+        elif maxweight:  # dynamic mode, smaller blocks, heaviest first
+            blocks = block_splitter(
+                arg0, maxweight / DYNAMIC_FACTOR, weight, key)
+            taskargs = [[blk] + args for blk in _heaviest_first(blocks)]
         else:  # split_in_blocks is eager
             if concurrent_tasks is None:
                 concurrent_tasks = cls.CT
-            taskargs = [[blk] + args for blk in split_in_blocks(
-                arg0, concurrent_tasks or 1, weight, key)]
+            if dynamic:
+                nblocks = (concurrent_tasks or 1) * DYNAMIC_FACTOR
+                blocks = _heaviest_first(split_in_blocks(
+                    arg0, nblocks, weight, key))
+            else:
+                blocks = split_in_blocks(
+                    arg0, concurrent_tasks or 1, weight, key)
+            taskargs = [[blk] + args for blk in blocks]
         return cls(task, taskargs, distribute, progress, h5)
 
     def apply_split(cls, task, allargs, concurrent_tasks=None,
                     maxweight=None, weight=lambda item: 1,
                     key=lambda item: 'Unspecified',
                     distribute=None, progress=logging.info, h5=None,
-                    duration=300, outs_per_task=5):
+                    duration=300, outs_per_task=5, dynamic=False):
         """
-        Same as Starmap.apply, but possibly produces subtasks
+        Same as Starmap.apply, but possibly produces subtasks; in dynamic
+        mode the chunks slower than `duration` are split further on the fly
         """
         args = (allargs[0], task, allargs[1:], duration, outs_per_task)
         return cls.apply(split_task, args, concurrent_tasks or 2*cls.num_cores,
-                         maxweight, weight, key, distribute, progress, h5)
+                         maxweight, weight, key, distribute, progress, h5,
+                         dynamic)
 
     def __init__(self, task_func, task_args=(), distribute=None,
                  progress=logging.info, h5=None):
@@ -807,6 +873,7 @@ class Starmap(object):
             self.num_tasks = None
         self.argnames = getargnames(task_func)
         self.sent = AccumDict(accum=AccumDict())  # fname -> argname -> nbytes
+        self.task_sent = {}  # task_no -> nbytes
         self.monitor.inject = (self.argnames[-1].startswith('mon') or
                                self.argnames[-1].endswith('mon'))
         self.receiver = 'tcp://0.0.0.0:%s' % config.dbserver.receiver_ports
@@ -820,6 +887,7 @@ class Starmap(object):
         self.task_no = 0
         self._shared = {}
         self.n_out = 0
+        self.max_running = 0  # maximum number of running tasks, 0=no limit
 
     def log_percent(self):
         """
@@ -862,6 +930,11 @@ class Starmap(object):
                 self.return_ip, self.socket.port)
             if self.distribute == 'slurm':
                 self.init_slurm()
+        if (self.max_running and len(self.tasks) >= self.max_running
+                and self.distribute != 'slurm'):
+            # submitted later by ._loop, when a running task ends
+            self.task_queue.append((func, args))
+            return
         OQ_TASK_NO = os.environ.get('OQ_TASK_NO')
         if OQ_TASK_NO is not None and self.task_no != int(OQ_TASK_NO):
             self.task_no += 1
@@ -879,6 +952,7 @@ class Starmap(object):
                 fname = func.__name__
                 argnames = getargnames(func)[:-1]
             self.sent[fname] += {a: len(p) for a, p in zip(argnames, args)}
+            self.task_sent[self.task_no] = sum(len(p) for p in args)
         submit[dist](self, func, args, self.monitor)
         self.tasks.append(self.task_no)
         self.task_no += 1
@@ -900,8 +974,8 @@ class Starmap(object):
             for args in self.task_args:
                 self.submit(args)
         else:  # build a task queue in advance
-            self.task_queue = [(self.task_func, args)
-                               for args in self.task_args]
+            self.task_queue.extend((self.task_func, args)
+                                   for args in self.task_args)
         dist = 'no' if self.num_tasks == 1 else self.distribute
         if dist == 'slurm':
             # submit the tasks via zmq
@@ -939,9 +1013,12 @@ class Starmap(object):
     # the event_based calculator
     def share(self, **dictarray):
         """
-        Apply SharedArray.new to a dictionary of arrays
+        Apply SharedArray.new to a dictionary of arrays (SharedArray
+        instances are shared as they are)
         """
-        self._shared = {k: SharedArray.new(a) for k, a in dictarray.items()}
+        self._shared = {k: a if isinstance(a, SharedArray)
+                        else SharedArray.new(a)
+                        for k, a in dictarray.items()}
 
     def unlink(self):
         """
@@ -959,10 +1036,10 @@ class Starmap(object):
             #sbatch(self.monitor)
 
         elif self.task_queue:
-            first_args = self.task_queue[:self.CT]
-            self.task_queue[:] = self.task_queue[self.CT:]
-            for func, args in first_args:
-                self.submit(args, func=func)
+            if self.max_running:
+                self._submit_many(self.max_running - len(self.tasks))
+            else:
+                self._submit_many(self.CT)
 
         if not hasattr(self, 'socket'):  # no submit was ever made
             return ()
@@ -1009,7 +1086,8 @@ class Starmap(object):
                     mem_gb = memory_gb()
                 else:
                     mem_gb = memory_gb(Starmap.pids)
-                res.mon.save_task_info(self.h5, res, n, mem_gb)
+                sent = self.task_sent.pop(res.mon.task_no, 0)
+                res.mon.save_task_info(self.h5, res, n, mem_gb, sent)
                 res.mon.flush(self.h5)
             elif res.func:  # add subtask
                 self.task_queue.append((res.func, res.pik))
@@ -1028,6 +1106,15 @@ class Starmap(object):
                 times.mean(), times.std(), times.min(), times.max())
 
 
+def _heaviest_first(blocks):
+    # sort the blocks by decreasing weight (longest processing time first);
+    # slices and DataFrames have no weight and are left in the same order
+    blocks = list(blocks)
+    if blocks and hasattr(blocks[0], 'weight'):
+        blocks.sort(key=operator.attrgetter('weight'), reverse=True)
+    return blocks
+
+
 def sequential_apply(task, args, concurrent_tasks=Starmap.CT,
                      maxweight=None, weight=lambda item: 1,
                      key=lambda item: 'Unspecified',
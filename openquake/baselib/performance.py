@@ -49,7 +49,8 @@ perf_dt = numpy.dtype([('operation', '<S50'), ('time_sec', float),
 task_info_dt = numpy.dtype(
     [('taskname', '<S50'), ('task_no', numpy.uint32),
      ('weight', numpy.float32), ('duration', numpy.float32),
-     ('received', numpy.int64), ('mem_gb', numpy.float32)])
+     ('sent', numpy.int64), ('received', numpy.int64),
+     ('mem_gb', numpy.float32)])
 
 F16= numpy.float16
 F64= numpy.float64
@@ -311,7 +312,7 @@ class Monitor(object):
         if self.h5:
             self.flush(self.h5)
 
-    def save_task_info(self, h5, res, name, mem_gb=0):
+    def save_task_info(self, h5, res, name, mem_gb=0, sent=0):
         """
         Called by parallel.IterResult.
 
@@ -319,9 +320,10 @@ class Monitor(object):
         :param res: a :class:`Result` object
         :param name: name of the task function
         :param mem_gb: memory consumption at the saving time (optional)
+        :param sent: number of bytes of the task arguments (optional)
         """
-        t = (name, self.task_no, self.weight, self.duration, len(res.pik),
-             mem_gb)
+        t = (name, self.task_no, self.weight, self.duration, sent,
+             len(res.pik), mem_gb)
         data = numpy.array([t], task_info_dt)
         hdf5.extend(h5['task_info'], data)
         h5['task_info'].flush()  # notify the reader
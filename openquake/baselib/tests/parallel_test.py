@@ -17,6 +17,7 @@
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import pickle
 import sys
 import platform
 import unittest.mock as mock
@@ -151,6 +152,31 @@ class StarmapTestCase(unittest.TestCase):
         smap = parallel.Starmap(countletters, data)
         self.assertEqual(smap.reduce(), {'n': 19})
 
+    def test_apply_dynamic(self):
+        data = list(range(100))
+        res = list(parallel.Starmap.apply(
+            get_length, (data,), concurrent_tasks=2, dynamic=True))
+        self.assertGreaterEqual(len(res), 2 * parallel.DYNAMIC_FACTOR)
+        self.assertEqual(sum(r['n'] for r in res), 100)
+
+        # the heaviest blocks come first
+        smap = parallel.Starmap.apply(
+            get_length, (data,), maxweight=1000, weight=lambda x: x + 1,
+            dynamic=True)
+        weights = [args[0].weight for args in smap.task_args]
+        self.assertEqual(weights, sorted(weights, reverse=True))
+        self.assertEqual(sum(r['n'] for r in smap), 100)
+
+    def test_max_running(self):
+        smap = parallel.Starmap(get_length)
+        smap.max_running = 2
+        for data in ('a', 'bb', 'ccc', 'dddd', 'eeeee'):
+            smap.submit((data,))
+        self.assertEqual(len(smap.tasks), 2)
+        self.assertEqual(len(smap.task_queue), 3)
+        self.assertEqual(smap.reduce(), {'n': 15})
+        self.assertEqual(smap.task_no, 5)
+
     def test_apply_to_dataframe(self):
         orig_df = pandas.DataFrame(dict(mag=[5.0, 5.1, 5.2, 5.3],
                                         dist=[100., 110., 120., 99.]))
@@ -277,3 +303,39 @@ class SharedArrayTestCase(unittest.TestCase):
         ).reduce()
         with self.s_array as arr:
             numpy.testing.assert_allclose(arr, [[.1, .1], [.2, .2]])
+
+
+def double(arr, monitor):
+    return {'arr': arr * 2}
+
+
+class OutOfBandTestCase(unittest.TestCase):
+    def test_pickled(self):
+        arr = numpy.arange(100_000.)
+        pik = parallel.Pickled({'arr': arr, 'small': numpy.arange(3)},
+                               oob=True)
+        self.assertEqual(len(pik.buffers), 1)  # only the big array
+        self.assertGreater(len(pik), arr.nbytes)
+        # roundtrip with protocol 4, as in multiprocessing
+        for p in (pickle.loads(pickle.dumps(pik, 4)), pik):
+            dic = p.unpickle()
+            numpy.testing.assert_equal(dic['arr'], arr)
+            numpy.testing.assert_equal(dic['small'], [0, 1, 2])
+
+    def test_starmap(self):
+        tmpdir = tempfile.mkdtemp()
+        tmp = os.path.join(tmpdir, 'calc_1.hdf5')
+        arr = numpy.arange(100_000.)
+        with hdf5.File(tmp, 'w') as h5:
+            performance.init_performance(h5)
+            smap = parallel.Starmap(double, [(arr,), (arr,)], h5=h5)
+            results = list(smap)
+            task_info = h5['task_info'][()]
+        for res in results:
+            res['arr'] += 1  # the received arrays must be writable
+            numpy.testing.assert_equal(res['arr'], arr * 2 + 1)
+        self.assertEqual(len(task_info), 2)
+        self.assertTrue((task_info['received'] > arr.nbytes).all())
+        if smap.distribute != 'no':
+            self.assertTrue((task_info['sent'] > arr.nbytes).all())
+        shutil.rmtree(tmpdir)
@@ -21,9 +21,15 @@ import csv
 import tempfile
 import numpy  # this is needed by the doctests, don't remove it
 import pandas
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 from openquake.baselib.node import scientificformat
 
 FIVEDIGITS = '%.5E'
+PARQUET_ROWS = 1_000_000  # rows per row group in the Parquet exporters
 
 
 # recursive function used internally by build_header
@@ -224,6 +230,48 @@ class CsvWriter(object):
         return sorted(self.fnames)
 
 
+class ParquetWriter(object):
+    """
+    Class used in the exporters to save a Parquet file, one row group
+    at the time, so that large datasets can be streamed without reading
+    them fully in memory. Requires pyarrow. Use it as a context manager:
+
+    with ParquetWriter(fname, comment) as writer:
+        for slc in slices:
+            writer.save_block({'col1': arr1[slc], 'col2': arr2[slc]})
+
+    :param fname: path name
+    :param comment: optional dictionary stored in the schema metadata
+    """
+    def __init__(self, fname, comment=None):
+        if pyarrow is None:
+            raise ImportError('pyarrow is required to export in Parquet '
+                              'format, please install it')
+        self.fname = fname
+        self.metadata = {k: str(v) for k, v in (comment or {}).items()}
+        self.writer = None
+
+    def save_block(self, dic):
+        """
+        Save a row group
+
+        :param dic: a dictionary column name -> 1D array
+        """
+        table = pyarrow.table(dic)
+        if self.writer is None:
+            table = table.replace_schema_metadata(self.metadata)
+            self.writer = pyarrow.parquet.ParquetWriter(
+                self.fname, table.schema)
+        self.writer.write_table(table, row_group_size=len(table) or None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self.writer is not None:
+            self.writer.close()
+
+
 def castable_to_int(s):
     """
     Return True if the string `s` can be interpreted as an integer
@@ -32,6 +32,7 @@ with Socket('tcp://0.0.0.0:8000', zmq.REP, 'bind') as sock:
 import re
 import zmq
 import time
+import pickle
 import logging
 
 context = zmq.Context()
@@ -46,6 +47,32 @@ class TimeoutError(RuntimeError):
     pass
 
 
+def send_pyobj(zsocket, obj):
+    """
+    Send a Python object as a multipart message: the first frame is
+    the pickle (protocol 5) and the other frames are the out-of-band
+    buffers, sent without copies.
+
+    :returns: a MessageTracker if there are out-of-band buffers or None
+    """
+    buffers = []
+    pik = pickle.dumps(obj, 5, buffer_callback=buffers.append)
+    if not buffers:
+        zsocket.send(pik)
+        return
+    frames = [pik] + [buf.raw() for buf in buffers]
+    return zsocket.send_multipart(frames, copy=False, track=True)
+
+
+def recv_pyobj(zsocket):
+    """
+    Receive a multipart message sent by :func:`send_pyobj` and unpickle it;
+    the out-of-band buffers are not copied.
+    """
+    first, *others = zsocket.recv_multipart(copy=False)
+    return pickle.loads(first.buffer, buffers=[f.buffer for f in others])
+
+
 def bind(end_point, socket_type):
     """
     Bind to a zmq URL; raise a proper error if the URL is invalid; return
@@ -135,6 +162,7 @@ class Socket(object):
             self.port = int(port.group(1))
         self.zsocket.__enter__()
         self.num_sent = 0
+        self.tracker = None
         return self
 
     def __exit__(self, *args):
@@ -153,7 +181,7 @@ class Socket(object):
         while self.running:
             try:
                 if self.zsocket.poll(self.timeout):
-                    yield self.zsocket.recv_pyobj()
+                    yield recv_pyobj(self.zsocket)
                 elif self.socket_type == zmq.PULL:
                     logging.debug('Waiting on %s:%d', self, self.port)
             except zmq.ZMQError:
@@ -169,7 +197,7 @@ class Socket(object):
             the Python object to send
         """
         try:
-            self.zsocket.send_pyobj(obj)
+            self.tracker = send_pyobj(self.zsocket, obj)
         except Exception as exc:
             # usual for objects bigger than 4 GB
             raise exc.__class__('%s: %r' % (exc, obj))
@@ -179,7 +207,16 @@ class Socket(object):
             if not ok:
                 raise TimeoutError('While sending %r to %s' %
                                    (obj, self.end_point))
-            return self.zsocket.recv_pyobj()
+            return recv_pyobj(self.zsocket)
+
+    def wait_sent(self):
+        """
+        Wait until zmq has finished sending the out-of-band buffers of
+        the last message, i.e. until the underlying arrays can be modified
+        """
+        if self.tracker is not None:
+            self.tracker.wait()
+            self.tracker = None
 
     def __repr__(self):
         return '<%s %s %s>' % (self.__class__.__name__,
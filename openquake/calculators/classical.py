@@ -21,22 +21,24 @@ import os
 import time
 import zlib
 import pickle
+import collections
 import psutil
 import logging
 import operator
+import threading
 import numpy
 import pandas
 from PIL import Image
 from openquake.baselib import parallel, hdf5, config, python3compat
 from openquake.baselib.general import (
-    AccumDict, DictArray, groupby, humansize, block_splitter)
-from openquake.hazardlib import valid, InvalidFile
-from openquake.hazardlib.contexts import read_cmakers
+    AccumDict, DictArray, groupby, humansize, block_splitter, gen_slices)
+from openquake.hazardlib import valid, site, InvalidFile
+from openquake.hazardlib.contexts import read_cmakers, NONGEOM
 from openquake.hazardlib.calc.hazard_curve import classical as hazclassical
 from openquake.hazardlib.calc import disagg
 from openquake.hazardlib.map_array import (
     RateMap, MapArray, rates_dt, check_hmaps)
-from openquake.commonlib import calc
+from openquake.commonlib import calc, datastore
 from openquake.calculators import base, getters, preclassical, views
 
 get_weight = operator.attrgetter('weight')
@@ -53,6 +55,11 @@ BUFFER = 1.5  # enlarge the pointsource_distance sphere to fix the weight;
 # with BUFFER = 1 we would have lots of apparently light sources
 # collected together in an extra-slow task, as it happens in SHARE
 # with ps_grid_spacing=50
+STATS_BLOCK_MB = 100  # max size of the (N, L, R) block used in postclassical
+# source attributes not affecting the rates, including the timing `dt` set
+# in ContextMaker.estimate_weight and the caches of the rupture counts
+BOOKKEEPING = (NONGEOM - {'mfd', 'probs_occur'}) | {
+    'dt', '_nr', '_rupture_count', '_rupture_rates'}
 
 
 def _store(rates, num_chunks, h5, mon=None, gzip=GZIP):
@@ -89,10 +96,80 @@ def _store(rates, num_chunks, h5, mon=None, gzip=GZIP):
         return fname
 
 
+class TilePlanner(object):
+    """
+    Determine the number of tiles of the source groups from the memory
+    measured in the tiling tasks, so that the memory required by a task
+    stays close to `target_mb`. The 75th percentile of the measurements
+    is used, so that a few outliers do not over-tile all the groups.
+
+    :param L: the number of intensity levels
+    :param target_mb: the target memory per task in MB
+    """
+    def __init__(self, L, target_mb):
+        self.target_mb = target_mb
+        # lower limit, the memory required to store the rates
+        self.mb_per_gsim_site = L * 4 / 1024**2
+        self.measured = []
+
+    def update(self, mb_per_gsim_site):
+        """
+        Record the memory per gsim and site measured in a task
+        """
+        self.measured.append(mb_per_gsim_site)
+
+    def get_mb(self):
+        """
+        :returns: the estimated memory per gsim and site in MB
+        """
+        if not self.measured:
+            return self.mb_per_gsim_site
+        return max(numpy.percentile(self.measured, 75),
+                   self.mb_per_gsim_site)
+
+    def num_tiles(self, G, N, hint=1):
+        """
+        :param G: number of gsims in the source group
+        :param N: number of sites
+        :param hint: minimum number of tiles, determined by the weight
+        :returns: the number of tiles to use for the source group
+        """
+        return max(hint, G * N * self.get_mb() / self.target_mb)
+
+    def __repr__(self):
+        return '<%s mb_per_gsim_site=%.6f, %d measurements>' % (
+            self.__class__.__name__, self.get_mb(), len(self.measured))
+
+
 class Set(set):
     __iadd__ = set.__ior__
 
 
+def get_grp_checksum(cmaker, srcs, sitecrc):
+    """
+    :param cmaker: the ContextMaker of a source group
+    :param srcs: the sources of the group
+    :param sitecrc: the checksum of the complete site collection
+    :returns: a 32 bit checksum of everything determining the rates
+              of the group, i.e. sources, gsims, sites and parameters
+    """
+    crcs = sorted(zlib.crc32(pickle.dumps(
+        {k: v for k, v in vars(src).items() if k not in BOOKKEEPING},
+        protocol=4)) for src in srcs)
+    mdist = cmaker.maximum_distance
+    if hasattr(mdist, 'x'):  # interp1d
+        mdist = list(mdist.x), list(mdist.y)
+    params = (cmaker.trt, [str(gsim) for gsim in cmaker.gsims],
+              {imt: list(imls) for imt, imls in cmaker.imtls.items()},
+              cmaker.truncation_level, mdist,
+              cmaker.minimum_distance, cmaker.investigation_time,
+              cmaker.pointsource_distance, cmaker.ps_grid_spacing,
+              cmaker.collapse_level, cmaker.horiz_comp, str(cmaker.reqv),
+              cmaker.split_sources, cmaker.poes_dt.__name__,
+              cmaker.sf_table is not None)
+    return zlib.crc32(repr((crcs, sitecrc, params)).encode('utf8'))
+
+
 def get_heavy_gids(source_groups, cmakers):
     """
     :returns: the g-indices associated to the heavy groups
@@ -130,8 +207,90 @@ def store_ctxs(dstore, rupdata_list, grp_id):
                 hdf5.extend(dstore['rup/' + par], numpy.full(nr, numpy.nan))
 
 
-#  ########################### task functions ############################ #
-    
+def share_srcs_sitecol(smap, ds, grp_ids):
+    """
+    Store the complete site collection and the decompressed source groups
+    in shared memory, so that the tasks running on the master node do not
+    need to read and decompress them from the datastore. Groups are shared
+    until config.memory.shared_csm_gb is reached.
+
+    :param smap: a Starmap instance (not yet started)
+    :param ds: the datastore containing the sitecol and the _csm
+    :param grp_ids: the IDs of the source groups read by the tasks
+    """
+    if smap.distribute not in ('processpool', 'threadpool'):
+        return  # on a cluster the shared memory is not shared
+    maxbytes = float(config.memory.shared_csm_gb) * 1024**3
+    nbytes = 0
+    with ds:  # the parent datastore is closed
+        shared = {'sitecol': ds['sitecol'].complete.array}
+        csm = ds.getitem('_csm')
+        for grp_id in sorted(grp_ids):
+            data = zlib.decompress(csm[grp_id].tobytes())
+            nbytes += len(data)
+            if nbytes > maxbytes:
+                break
+            shared['csm%d' % grp_id] = numpy.frombuffer(data, numpy.uint8)
+    logging.info('Sharing %s of decompressed sources', humansize(nbytes))
+    smap.share(**shared)
+
+
+_decoded = threading.local()  # objects decoded from the shared memory
+
+
+def _get_decoded(calc_id, key, decode):
+    # decode the shared object only once per worker (per thread in the
+    # threadpool, since the sources are mutated by the tasks)
+    if getattr(_decoded, 'calc_id', None) != calc_id:
+        _decoded.calc_id = calc_id
+        _decoded.cache = {}
+    if key not in _decoded.cache:
+        _decoded.cache[key] = decode()
+    return _decoded.cache[key]
+
+
+def _unpickle(shared):
+    with shared as buf:
+        return pickle.loads(buf)
+
+
+def _build_sitecol(shared):
+    with shared as arr:
+        sitecol = site.SiteCollection.__new__(site.SiteCollection)
+        # copying since the shared memory is closed at the exit
+        sitecol.array = arr.copy()
+        sitecol.complete = sitecol
+    return sitecol
+
+
+def read_srcs_sitecol(sources, grp_id, dstore, shared):
+    """
+    :param sources: a list of sources or None
+    :param grp_id: the source group ID
+    :param dstore: the datastore containing the sitecol and the _csm
+    :param shared: a dictionary of SharedArrays, possibly empty
+    :returns: the sources (read if None) and the complete site collection
+    """
+    key = 'csm%d' % grp_id
+    if sources is None and key in shared:
+        sources = _get_decoded(
+            dstore.calc_id, key, lambda: _unpickle(shared[key]))
+    if 'sitecol' in shared:
+        sitecol = _get_decoded(
+            dstore.calc_id, 'sitecol',
+            lambda: _build_sitecol(shared['sitecol']))
+    else:
+        sitecol = None
+    if sources is None or sitecol is None:
+        with dstore:
+            if sources is None:  # read the full group from the datastore
+                arr = dstore.getitem('_csm')[grp_id]
+                sources = pickle.loads(zlib.decompress(arr.tobytes()))
+            if sitecol is None:
+                sitecol = dstore['sitecol'].complete  # super-fast
+    return sources, sitecol
+
+
 def save_rates(g, N, jid, num_chunks, mon):
     """
     Store the rates for the given g on a file scratch/calc_id/task_no.hdf5
@@ -153,11 +312,8 @@ def classical(sources, tilegetters, cmaker, dstore, monitor):
     """
     # NB: removing the yield would cause terrible slow tasks
     cmaker.init_monitoring(monitor)
-    with dstore:
-        if sources is None:  # read the full group from the datastore
-            arr = dstore.getitem('_csm')[cmaker.grp_id]
-            sources = pickle.loads(zlib.decompress(arr.tobytes()))
-        sitecol = dstore['sitecol'].complete  # super-fast
+    sources, sitecol = read_srcs_sitecol(
+        sources, cmaker.grp_id, dstore, monitor.shared)
 
     if cmaker.disagg_by_src and not cmaker.atomic:
         # in case_27 (Japan) we do NOT enter here;
@@ -198,16 +354,25 @@ def classical(sources, tilegetters, cmaker, dstore, monitor):
         yield result
 
 
+_warm = set()  # IDs of the processes which already ran a tiling task
+
+
 def tiling(tilegetter, cmaker, dstore, monitor):
     """
     Tiling calculator
     """
     cmaker.init_monitoring(monitor)
-    with dstore:
-        arr = dstore.getitem('_csm')[cmaker.grp_id]
-        sources = pickle.loads(zlib.decompress(arr.tobytes()))
-        sitecol = dstore['sitecol'].complete  # super-fast
-    result = hazclassical(sources, tilegetter(sitecol), cmaker)
+    sources, sitecol = read_srcs_sitecol(
+        None, cmaker.grp_id, dstore, monitor.shared)
+    tile = tilegetter(sitecol)
+    mem0 = monitor.measure_mem()
+    result = hazclassical(sources, tile, cmaker)
+    # the first task in a process is not measured, since its memory
+    # includes the imports and the numba compilation
+    if mem0 is not None and os.getpid() in _warm:  # used by the TilePlanner
+        mem_mb = (monitor.measure_mem() - mem0) / 1024**2
+        result['mb_per_gsim_site'] = mem_mb / len(cmaker.gsims) / len(tile)
+    _warm.add(os.getpid())
     rmap = result.pop('rmap').remove_zeros()
     if config.directory.custom_tmp:
         rates = rmap.to_array(cmaker.gid)
@@ -286,27 +451,35 @@ def postclassical(pgetter, wget, hstats, individual_rlzs,
     compute_mon = monitor('compute stats', measuremem=False)
     hmaps_mon = monitor('make_hmaps', measuremem=False)
     sidx = MapArray(sids, 1, 1).fill(0).sidx
-    for sid in sids:
-        idx = sidx[sid]
+    if amplifier:  # slow lane, one site at the time
+        blocks = ([sid] for sid in sids)
+    else:
+        nbytes = L * R * pgetter.dtype.itemsize
+        blocksize = max(1, STATS_BLOCK_MB * 1024**2 // nbytes)
+        blocks = (sids[slc] for slc in gen_slices(0, len(sids), blocksize))
+    for block in blocks:
+        idxs = sidx[block]
         with combine_mon:
-            pc = pgetter.get_hcurve(sid)  # shape (L, R)
             if amplifier:
-                pc = amplifier.amplify(ampcode[sid], pc)
                 # NB: the hcurve have soil levels != IMT levels
-        if pc.sum() == 0:  # no data
+                [sid] = block
+                pcs = amplifier.amplify(
+                    ampcode[sid], pgetter.get_hcurve(sid))[None]
+            else:
+                pcs = pgetter.get_hcurves(block)  # shape (N, L, R)
+        if pcs.sum() == 0:  # no data
             continue
         with compute_mon:
             if R == 1 or individual_rlzs:
                 for r in range(R):
-                    pmap_by_kind['hcurves-rlzs'][r].array[idx] = (
-                        pc[:, r].reshape(M, L1))
-            if hstats:
-                for s, (statname, stat) in enumerate(hstats.items()):
-                    sc = getters.build_stat_curve(
-                        pc, imtls, stat, pgetter.weights, wget,
-                        pgetter.use_rates)
-                    arr = sc.reshape(M, L1)
-                    pmap_by_kind['hcurves-stats'][s].array[idx] = arr
+                    pmap_by_kind['hcurves-rlzs'][r].array[idxs] = (
+                        pcs[:, :, r].reshape(-1, M, L1))
+            for s, stat in enumerate(hstats.values()):
+                sc = getters.build_stat_curves(
+                    pcs, imtls, stat, pgetter.weights, wget,
+                    pgetter.use_rates)
+                pmap_by_kind['hcurves-stats'][s].array[idxs] = (
+                    sc.reshape(-1, M, L1))
 
     if poes and (R == 1 or individual_rlzs):
         with hmaps_mon:
@@ -407,6 +580,9 @@ class ClassicalCalculator(base.HazardCalculator):
             raise MemoryError('You ran out of memory!')
 
         grp_id = dic.pop('grp_id')
+        mb = dic.pop('mb_per_gsim_site', None)
+        if mb is not None:
+            self.tiler.update(mb)
         sdata = dic.pop('source_data', None)
         if sdata is not None:
             self.source_data += sdata
@@ -467,6 +643,11 @@ class ClassicalCalculator(base.HazardCalculator):
     def init_poes(self):
         oq = self.oqparam
         self.cmakers = read_cmakers(self.datastore, self.csm)
+        with self.monitor('computing grp_checksums'):
+            sitecrc = zlib.crc32(self.sitecol.complete.array.tobytes())
+            self.datastore['grp_checksums'] = self.grp_checksums = U32([
+                get_grp_checksum(cm, self.csm.src_groups[cm.grp_id], sitecrc)
+                for cm in self.cmakers])
         parent = self.datastore.parent
         if parent:
             # tested in case_43
@@ -493,6 +674,74 @@ class ClassicalCalculator(base.HazardCalculator):
         self.datastore.create_df(
             '_rates', [(n, rates_dt[n]) for n in rates_dt.names])
         self.datastore.create_dset('_rates/slice_by_idx', getters.slice_dt)
+        self.reused = {}  # grp_id -> grp_id in the calculation to reuse
+        if oq.reuse_rates_from:
+            self.reuse_rates(oq.reuse_rates_from)
+
+    def reuse_rates(self, calc_id):
+        """
+        Copy the rates of the source groups with the same checksum
+        as in the calculation `calc_id`, by converting the gids
+        """
+        with datastore.read(calc_id, read_parent=False) as old:
+            if 'grp_checksums' not in old:
+                logging.warning('Calculation #%d has no grp_checksums, '
+                                'the rates cannot be reused', calc_id)
+                return
+            attrs = old.hdf5.attrs
+            if 'scratch_dir' in attrs and 'scratch_files' not in attrs:
+                logging.warning('Calculation #%d did not complete, its '
+                                'rates cannot be reused', calc_id)
+                return
+            try:
+                fnames = getters.rates_fnames(old)
+            except FileNotFoundError as exc:
+                logging.warning('%s: the rates of calculation #%d cannot '
+                                'be reused, recomputing them', exc, calc_id)
+                return
+            old_chks = old['grp_checksums'][:]
+            old_grp = {chk: g for g, chk in enumerate(old_chks)}
+            # groups with the same checksum cannot be told apart
+            dupl = {chk for chks in (old_chks, self.grp_checksums)
+                    for chk, cnt in collections.Counter(chks).items()
+                    if cnt > 1}
+            if dupl:
+                logging.warning('%d source groups have the same checksum '
+                                'of another group, their rates will be '
+                                'recomputed', len(dupl))
+            _, _, old_gids = getters.get_pmaps_gb(old)
+            gidmap = numpy.full(sum(len(gs) for gs in old_gids), -1)
+            for cm in self.cmakers:
+                chk = self.grp_checksums[cm.grp_id]
+                g = None if chk in dupl else old_grp.get(chk)
+                if g is not None and len(old_gids[g]) == len(cm.gid):
+                    gidmap[old_gids[g]] = cm.gid
+                    self.reused[cm.grp_id] = g
+            if 'est_rups_by_grp' in old:
+                est_rups = old['est_rups_by_grp'][:]
+                for grp_id, g in self.reused.items():
+                    self.rel_ruptures[grp_id] = est_rups[g]
+        logging.info('Reusing the rates of %d source groups out of %d from '
+                     'calculation #%d', len(self.reused), len(self.cmakers),
+                     calc_id)
+        if not self.reused:
+            return
+        with self.monitor('reusing rates', measuremem=True):
+            for fname in fnames:
+                with hdf5.File(fname, 'r') as h5:
+                    if '_rates' not in h5:
+                        continue
+                    slices = h5['_rates/slice_by_idx'][:]
+                    for start, stop in zip(slices['start'], slices['stop']):
+                        df = h5.read_df('_rates', slc=slice(start, stop))
+                        gids = gidmap[df.gid.to_numpy()]
+                        ok = gids >= 0
+                        rates = numpy.zeros(ok.sum(), rates_dt)
+                        rates['sid'] = df.sid.to_numpy()[ok]
+                        rates['lid'] = df.lid.to_numpy()[ok]
+                        rates['gid'] = gids[ok]
+                        rates['rate'] = df.rate.to_numpy()[ok]
+                        _store(rates, self.num_chunks, self.datastore)
 
     def check_memory(self, N, L, maxw):
         """
@@ -513,6 +762,9 @@ class ClassicalCalculator(base.HazardCalculator):
         tectonic region type.
         """
         oq = self.oqparam
+        if oq.reuse_rates_from and oq.disagg_by_src:
+            raise InvalidFile('%(job_ini)s: reuse_rates_from is not '
+                              'supported with disagg_by_src', oq.inputs)
         if oq.hazard_calculation_id:
             logging.info('Reading from parent calculation')
             parent = self.datastore.parent
@@ -545,7 +797,7 @@ class ClassicalCalculator(base.HazardCalculator):
             self._execute_tiling(sgs, ds)
         else:
             self._execute_regular(sgs, ds)
-        if self.cfactor[0] == 0:
+        if self.cfactor[0] == 0 and len(self.reused) < len(self.cmakers):
             if self.N == 1:
                 logging.error('The site is far from all seismic sources'
                               ' included in the hazard model')
@@ -555,6 +807,17 @@ class ClassicalCalculator(base.HazardCalculator):
         else:
             logging.info('cfactor = {:_d}'.format(int(self.cfactor[0])))
         self.store_info()
+        scratch_files = getters.rates_fnames(self.datastore)[1:]
+        if scratch_files:  # make the rates memory-mappable
+            parallel.Starmap(
+                getters.compact_rates, [(f,) for f in scratch_files],
+                h5=self.datastore.hdf5).reduce()
+            # record the scratch files, to check them when reading later
+            attrs = self.datastore.hdf5.attrs
+            attrs['scratch_files'] = ' '.join(
+                os.path.basename(f) for f in scratch_files)
+            attrs['scratch_sizes'] = [os.path.getsize(f)
+                                      for f in scratch_files]
         self.build_curves_maps()
         return True
 
@@ -581,19 +844,30 @@ class ClassicalCalculator(base.HazardCalculator):
         allargs = []
         n_out = []
         splits = {}
+        dynamic = self.oqparam.dynamic_tasks
+        # in dynamic mode use lighter blocks, like Starmap.apply(dynamic=1)
+        maxw = self.max_weight / (parallel.DYNAMIC_FACTOR if dynamic else 1)
         for cmaker, tilegetters, blocks, nsplits in self.csm.split(
-                self.cmakers, self.sitecol, self.max_weight, self.num_chunks):
+                self.cmakers, self.sitecol, maxw, self.num_chunks):
+            if cmaker.grp_id in self.reused:
+                continue
             for block in blocks:
                 for tgetters in block_splitter(tilegetters, nsplits):
                     allargs.append((block, tgetters, cmaker, ds))
                     n_out.append(len(tgetters))
             splits[cmaker.grp_id] = nsplits
+        if not allargs:  # all the rates were reused
+            return
+        if dynamic:  # heaviest blocks first, the others wait in the queue
+            allargs.sort(key=lambda args: getattr(
+                args[0], 'weight', args[2].weight), reverse=True)
         logging.warning('This is a regular calculation with %d outputs, '
                         '%d tasks, min_tiles=%d, max_tiles=%d',
                         sum(n_out), len(allargs), min(n_out), max(n_out))
 
         # log info about the heavy sources
-        srcs = [src for src in self.csm.get_sources() if src.weight]
+        srcs = [src for src in self.csm.get_sources()
+                if src.weight and src.grp_id in splits]
         maxsrc = max(srcs, key=lambda s: s.weight / splits[s.grp_id])
         logging.info('Heaviest: %s', maxsrc)
 
@@ -603,29 +877,56 @@ class ClassicalCalculator(base.HazardCalculator):
 
         self.datastore.swmr_on()  # must come before the Starmap
         smap = parallel.Starmap(classical, allargs, h5=self.datastore.hdf5)
+        share_srcs_sitecol(smap, ds, {args[2].grp_id for args in allargs
+                                      if args[0] is None})
         if not self.oqparam.disagg_by_src:
             smap.expected_outputs = sum(n_out)
         acc = smap.reduce(self.agg_dicts, AccumDict(accum=0.))
         self._post_regular(acc)
 
     def _execute_tiling(self, sgs, ds):
-        allargs = []
+        # the source groups are submitted heavy groups first, keeping about
+        # num_cores tasks running; the number of tiles of a group is planned
+        # when it is submitted, by using the memory measured in the tasks
+        # already completed
+        oq = self.oqparam
+        max_mb = float(config.memory.pmap_max_mb)
+        self.tiler = TilePlanner(oq.imtls.size, max_mb)
+        todo = [(cmaker, blocks) for cmaker, _tgetters, blocks, _splits
+                in self.csm.split(self.cmakers, self.sitecol,
+                                  self.max_weight, self.num_chunks, True)
+                if cmaker.grp_id not in self.reused]
+        if not todo:  # all the rates were reused
+            return
         n_out = []
-        for cmaker, tilegetters, blocks, splits in self.csm.split(
-                self.cmakers, self.sitecol, self.max_weight, self.num_chunks,
-                True):
-            for block in blocks:
-                for tgetter in tilegetters:
-                    allargs.append((tgetter, cmaker, ds))
-                n_out.append(len(tilegetters))
-        logging.warning('This is a tiling calculation with '
-                        '%d tasks, min_tiles=%d, max_tiles=%d',
-                        len(allargs), min(n_out), max(n_out))
-
         t0 = time.time()
         self.datastore.swmr_on()  # must come before the Starmap
-        smap = parallel.Starmap(tiling, allargs, h5=self.datastore.hdf5)
-        smap.reduce(self.agg_dicts, AccumDict(accum=0.))
+        smap = parallel.Starmap(tiling, h5=self.datastore.hdf5)
+        share_srcs_sitecol(smap, ds, {cm.grp_id for cm, _ in todo})
+
+        def submit_tiles():
+            while todo and len(smap.tasks) <= parallel.Starmap.num_cores:
+                cmaker, blocks = todo.pop(0)
+                tiles = self.tiler.num_tiles(
+                    len(cmaker.gsims), self.N,
+                    cmaker.weight / self.max_weight)
+                tilegetters = self.sitecol.split(tiles, oq.max_sites_disagg)
+                for block in blocks:
+                    for tgetter in tilegetters:
+                        smap.submit((tgetter, cmaker, ds))
+                    n_out.append(len(tilegetters))
+
+        def agg(acc, dic):
+            acc = self.agg_dicts(acc, dic)
+            submit_tiles()
+            return acc
+
+        submit_tiles()
+        smap.reduce(agg, AccumDict(accum=0.))
+        logging.warning('This is a tiling calculation with '
+                        '%d tasks, min_tiles=%d, max_tiles=%d',
+                        sum(n_out), min(n_out), max(n_out))
+        logging.info('%s', self.tiler)
 
         fraction = os.environ.get('OQ_SAMPLE_SOURCES')
         if fraction:
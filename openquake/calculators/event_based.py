@@ -22,7 +22,6 @@ import time
 import os.path
 import logging
 import numpy
-import pandas
 from shapely import geometry
 from openquake.baselib import (
     config, hdf5, parallel, python3compat, performance)
@@ -36,7 +35,7 @@ from openquake.hazardlib.calc.stochastic import sample_ruptures
 from openquake.hazardlib.contexts import ContextMaker, FarAwayRupture
 from openquake.hazardlib.calc.filters import (
     close_ruptures, magstr, nofilter, getdefault, get_distances, SourceFilter)
-from openquake.hazardlib.calc.gmf import GmfComputer
+from openquake.hazardlib.calc.gmf import GmfComputer, compute_gmfs_batch
 from openquake.hazardlib.calc.conditioned_gmfs import ConditionedGmfComputer
 from openquake.hazardlib.calc.stochastic import get_rup_array, rupture_dt
 from openquake.hazardlib.source.rupture import (
@@ -62,6 +61,9 @@ F32 = numpy.float32
 F64 = numpy.float64
 TWO24 = 2 ** 24
 TWO32 = numpy.float64(2 ** 32)
+# max number of affected sites in a batch of ruptures sent to
+# compute_gmfs_batch; limits the memory occupied by the mean_stds
+GMF_BATCH_SITES = 50_000
 rup_dt = numpy.dtype(
     [('rup_id', I64), ('rrup', F32), ('time', F32), ('task_no', U16)])
 
@@ -210,6 +212,26 @@ def _event_based(proxies, cmaker, stations, srcfilter, shr,
     max_iml = oq.get_max_iml()
     se_dt = sig_eps_dt(oq.imtls)
     mea_tau_phi = []
+    batch = []  # triples (GmfComputer, rup_id, instantiation time)
+    nsites = 0  # number of affected sites in the batch
+
+    def compute_batch():
+        # compute the GMFs for the ruptures in the batch; the time spent
+        # is distributed across the ruptures proportionally to N * E
+        t0 = time.time()
+        computers = [computer for computer, _, _ in batch]
+        alldata.append(
+            compute_gmfs_batch(computers, max_iml, mmon, cmon, umon))
+        dt = time.time() - t0
+        weights = numpy.array([comp.N * comp.E for comp in computers])
+        for (computer, rup_id, dt0), w in zip(batch, weights / weights.sum()):
+            if oq.mea_tau_phi:
+                mtp = numpy.array(computer.mea_tau_phi, GmfComputer.mtp_dt)
+                mea_tau_phi.append(mtp)
+            sig_eps.append(computer.build_sig_eps(se_dt))
+            times.append((rup_id, computer.ctx.rrup.min(), dt0 + dt * w))
+        batch.clear()
+
     for proxy in proxies:
         t0 = time.time()
         with fmon:
@@ -225,23 +247,27 @@ def _event_based(proxies, cmaker, stations, srcfilter, shr,
             with shr['mea'] as mea, shr['tau'] as tau, shr['phi'] as phi:
                 df = computer.compute_all(
                     [mea, tau, phi], max_iml, mmon, cmon, umon)
-        else:  # regular GMFs
-            df = computer.compute_all(None, max_iml, mmon, cmon, umon)
-            if oq.mea_tau_phi:
-                mtp = numpy.array(computer.mea_tau_phi, GmfComputer.mtp_dt)
-                mea_tau_phi.append(mtp)
-        sig_eps.append(computer.build_sig_eps(se_dt))
-        dt = time.time() - t0
-        times.append((proxy['id'], computer.ctx.rrup.min(), dt))
-        alldata.append(df)
+            sig_eps.append(computer.build_sig_eps(se_dt))
+            dt = time.time() - t0
+            times.append((proxy['id'], computer.ctx.rrup.min(), dt))
+            alldata.append({k: df[k].to_numpy() for k in df.columns})
+        else:  # regular GMFs, computed in batches
+            batch.append((computer, proxy['id'], time.time() - t0))
+            nsites += computer.N
+            if nsites >= GMF_BATCH_SITES:
+                compute_batch()
+                nsites = 0
+    if batch:
+        compute_batch()
     times = numpy.array([tup + (fmon.task_no,) for tup in times], rup_dt)
     times.sort(order='rup_id')
-    if sum(len(df) for df in alldata) == 0:
+    if sum(len(data['eid']) for data in alldata) == 0:
         return dict(gmfdata={}, times=times, sig_eps=())
 
-    gmfdata = pandas.concat(alldata)  # ~40 MB
-    dic = dict(gmfdata={k: gmfdata[k].to_numpy() for k in gmfdata.columns},
-               times=times, sig_eps=numpy.concatenate(sig_eps, dtype=se_dt))
+    gmfdata = {k: numpy.concatenate([data[k] for data in alldata])
+               for k in alldata[0]}  # ~40 MB
+    dic = dict(gmfdata=gmfdata, times=times,
+               sig_eps=numpy.concatenate(sig_eps, dtype=se_dt))
     if oq.mea_tau_phi:
         mtpdata = numpy.concatenate(mea_tau_phi, dtype=GmfComputer.mtp_dt)
         dic['mea_tau_phi'] = {col: mtpdata[col] for col in mtpdata.dtype.names}
@@ -301,6 +327,14 @@ def filter_stations(station_df, complete, rup, maxdist):
     return station_data, station_sites
 
 
+def max_running_tasks():
+    """
+    :returns: the maximum number of event based tasks running at the same
+              time, or 0 (no limit besides the usual Starmap.CT)
+    """
+    return int(config.memory.max_gmf_tasks or 0)
+
+
 def starmap_from_rups_hdf5(oq, sitecol, dstore):
     """
     :returns: a Starmap instance sending event_based tasks
@@ -328,6 +362,7 @@ def starmap_from_rups_hdf5(oq, sitecol, dstore):
     extra = sitecol.array.dtype.names
     dstore.swmr_on()
     smap = parallel.Starmap(event_based, h5=dstore.hdf5)
+    smap.max_running = max_running_tasks()
     logging.info('Computing the GMFs')
     for (model, trt_smr), rups in rups_dic.items():
         model = model.decode('ascii')
@@ -403,6 +438,7 @@ def starmap_from_rups(func, oq, full_lt, sitecol, dstore, save_tmp=None):
 
     dstore.swmr_on()
     smap = parallel.Starmap(func, h5=dstore.hdf5)
+    smap.max_running = max_running_tasks()
     if save_tmp:
         save_tmp(smap.monitor)
 
@@ -644,25 +680,17 @@ class EventBasedCalculator(base.HazardCalculator):
         with sav_mon:
             gmfdata = result.pop('gmfdata')
             if len(gmfdata):
-                df = pandas.DataFrame(gmfdata)
-                dset = self.datastore['gmf_data/sid']
                 times = result.pop('times')
                 hdf5.extend(self.datastore['gmf_data/rup_info'], times)
                 if self.N >= SLICE_BY_EVENT_NSITES:
-                    sbe = build_slice_by_event(
-                        df.eid.to_numpy(), self.offset)
+                    sbe = build_slice_by_event(gmfdata['eid'], self.offset)
                     hdf5.extend(self.datastore['gmf_data/slice_by_event'], sbe)
-                hdf5.extend(dset, df.sid.to_numpy())
-                hdf5.extend(self.datastore['gmf_data/eid'], df.eid.to_numpy())
-                for imt in primary:
-                    hdf5.extend(self.datastore[f'gmf_data/{imt}'],
-                                df[imt].to_numpy())
-                for sec_imt in sec_imts:
-                    hdf5.extend(self.datastore[f'gmf_data/{sec_imt}'],
-                                df[sec_imt].to_numpy())
+                for col in ['sid', 'eid', *primary, *sec_imts]:
+                    hdf5.extend(self.datastore[f'gmf_data/{col}'],
+                                gmfdata[col])
                 sig_eps = result.pop('sig_eps')
                 hdf5.extend(self.datastore['gmf_data/sigma_epsilon'], sig_eps)
-                self.offset += len(df)
+                self.offset += len(gmfdata['sid'])
 
             # optionally save mea_tau_phi
             mtp = result.pop('mea_tau_phi', None)
@@ -57,11 +57,12 @@ def damage_from_gmfs(gmfslices, oqparam, dstore, monitor):
     """
     if dstore.parent:
         dstore.parent.open('r')
+    gmfcols = oqparam.gmf_data_dt().names
     dfs = []
-    with dstore, monitor('reading data', measuremem=True):
+    with monitor('reading data', measuremem=True):
         for gmfslice in gmfslices:
-            slc = slice(gmfslice[0], gmfslice[1])
-            dfs.append(dstore.read_df('gmf_data', slc=slc))
+            dfs.append(calc.read_gmfs(dstore, gmfslice[0], gmfslice[1],
+                                      gmfcols, monitor.shared))
         df = pandas.concat(dfs)
     return event_based_damage(df, oqparam, dstore, monitor)
 
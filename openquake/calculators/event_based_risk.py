@@ -16,7 +16,6 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 
-import time
 import os.path
 import logging
 import operator
@@ -27,7 +26,8 @@ from scipy import sparse
 
 from openquake.baselib import hdf5, performance, general, python3compat, config
 from openquake.hazardlib import stats, InvalidFile
-from openquake.commonlib.calc import starmap_from_gmfs, compactify3
+from openquake.commonlib.calc import (
+    starmap_from_gmfs, compactify3, read_gmfs)
 from openquake.risklib.scientific import (
     total_losses, insurance_losses, MultiEventRNG, LOSSID)
 from openquake.calculators import base, event_based
@@ -41,23 +41,92 @@ U64 = numpy.uint64
 F32 = numpy.float32
 F64 = numpy.float64
 TWO16 = 2 ** 16
+TWO20 = 2 ** 20
 TWO32 = U64(2 ** 32)
 get_n_occ = operator.itemgetter(1)
 
 
-def fast_agg(keys, values, correl, li, acc):
+class AggLossTable(object):
     """
-    :param keys: an array of N uint64 numbers encoding (event_id, agg_id)
-    :param values: an array of (N, D) floats
-    :param correl: True if there is asset correlation
-    :param li: loss type index
-    :param acc: dictionary unique key -> array(L, D)
+    Columnar accumulator of losses keyed by uint64 numbers encoding
+    (event_id, agg_id). The keys are stored in a list of uint64 arrays and
+    the values in a list of (N, L, 2) arrays containing variance and loss
+    for each loss type; they are reduced by sorting on demand, without
+    building Python dictionaries.
+
+    >>> acc = AggLossTable(['structural'])
+    >>> keys = U64([1, 0, 1]) * TWO32 + U64(5)
+    >>> acc.add(keys, numpy.array([[0, .1], [0, .2], [0, .3]]), 0, 0)
+    >>> acc.to_dframe()
+       event_id  agg_id  loss_id  variance  loss
+    0         0       5        3       0.0   0.2
+    1         1       5        3       0.0   0.4
     """
-    ukeys, avalues = general.fast_agg2(keys, values)
-    if correl:  # restore the variances
-        avalues[:, 0] = avalues[:, 0] ** 2
-    for ukey, avalue in zip(ukeys, avalues):
-        acc[ukey][li] += avalue
+    def __init__(self, xtypes):
+        self.xtypes = xtypes
+        self.keys = []
+        self.values = []
+        self.nrows = 0  # number of buffered rows
+        self.nuniq = 0  # number of unique keys after the last reduce
+
+    def add(self, keys, values, correl, li):
+        """
+        :param keys: an array of N uint64 numbers encoding (event_id, agg_id)
+        :param values: an array of (N, 2) floats (variance, loss)
+        :param correl: True if there is asset correlation
+        :param li: loss type index
+        """
+        ukeys, avalues = general.fast_agg2(keys, values)
+        if correl:  # restore the variances
+            avalues[:, 0] = avalues[:, 0] ** 2
+        vals = numpy.zeros((len(ukeys), len(self.xtypes), 2))
+        vals[:, li] = avalues
+        self.keys.append(ukeys)
+        self.values.append(vals)
+        self.nrows += len(ukeys)
+        if self.nrows > max(TWO20, 2 * self.nuniq):
+            # compact the buffers to keep the memory under control
+            self.reduce()
+
+    def reduce(self):
+        """
+        Sum the values with the same key with a single sort-reduce
+
+        :returns: the number of unique keys
+        """
+        if len(self.keys) > 1:
+            ukeys, avalues = general.fast_agg2(
+                numpy.concatenate(self.keys), numpy.concatenate(self.values))
+            self.keys[:] = [ukeys]
+            self.values[:] = [avalues]
+        self.nuniq = self.nrows = sum(len(keys) for keys in self.keys)
+        return self.nuniq
+
+    def __iadd__(self, other):
+        assert other.xtypes == self.xtypes, (other.xtypes, self.xtypes)
+        self.keys.extend(other.keys)
+        self.values.extend(other.values)
+        self.reduce()
+        return self
+
+    def to_dframe(self):
+        """
+        :returns: a DataFrame event_id, agg_id, loss_id, variance, loss,
+                  sorted by (event_id, agg_id, loss type index), not in
+                  the order of insertion as with the former AccumDict
+        """
+        if self.reduce() == 0:
+            dic = {col: [] for col in
+                   ['event_id', 'agg_id', 'loss_id', 'variance', 'loss']}
+        else:
+            [keys], [vals] = self.keys, self.values
+            idx, lis = numpy.nonzero(vals.any(axis=2))  # nonzero losses
+            eids, kids = numpy.divmod(keys[idx], TWO32)
+            lossids = numpy.array([LOSSID[lt] for lt in self.xtypes])
+            dic = dict(event_id=eids, agg_id=kids, loss_id=lossids[lis],
+                       variance=vals[idx, lis, 0], loss=vals[idx, lis, 1])
+        fix_dtypes(dic)
+        return pandas.DataFrame(dic)
 
 
 def average_losses(ln, alt, rlz_id, AR, collect_rlzs):
@@ -104,8 +173,8 @@ def aggreg(outputs, crmodel, ARK, aggids, rlz_id, ideduc, monitor):
         xtypes.append('claim')
     loss_by_AR = {ln: [] for ln in xtypes}
     correl = int(oq.asset_correlation)
-    (A, R, K), L = ARK, len(xtypes)
-    acc = general.AccumDict(accum=numpy.zeros((L, 2)))  # u8idx->array
+    (A, R, K) = ARK
+    acc = AggLossTable(xtypes)
     value_cols = ['variance', 'loss']
     for out in outputs:
         for li, ln in enumerate(xtypes):
@@ -123,26 +192,14 @@ def aggreg(outputs, crmodel, ARK, aggids, rlz_id, ideduc, monitor):
                 eids = alt.eid.to_numpy() * TWO32  # U64
                 values = numpy.array([alt[col] for col in value_cols]).T
                 # aggregate all assets
-                fast_agg(eids + U64(K), values, correl, li, acc)
+                acc.add(eids + U64(K), values, correl, li)
                 if len(aggids):
                     # aggregate assets for each tag combination
                     aids = alt.aid.to_numpy()
                     for kids in aggids[:, aids]:
-                        fast_agg(eids + U64(kids), values, correl, li, acc)
-    lis = range(len(xtypes))
+                        acc.add(eids + U64(kids), values, correl, li)
     with monitor('building event loss table', measuremem=True):
-        dic = general.AccumDict(accum=[])
-        for ukey, arr in acc.items():
-            eid, kid = divmod(ukey, TWO32)
-            for li in lis:
-                if arr[li].any():
-                    dic['event_id'].append(eid)
-                    dic['agg_id'].append(kid)
-                    dic['loss_id'].append(LOSSID[xtypes[li]])
-                    for c, col in enumerate(['variance', 'loss']):
-                        dic[col].append(arr[li, c])
-        fix_dtypes(dic)
-    return loss_by_AR, pandas.DataFrame(dic)
+        return loss_by_AR, acc.to_dframe()
 
 
 def ebr_from_gmfs(sbe, oqparam, dstore, monitor):
@@ -156,29 +213,12 @@ def ebr_from_gmfs(sbe, oqparam, dstore, monitor):
     if dstore.parent:
         dstore.parent.open('r')
     gmfcols = oqparam.gmf_data_dt().names
-    with dstore:
-        # this is fast compared to reading the GMFs
-        risk_sids = monitor.read('sids')
-        s0, s1 = sbe[0]['start'], sbe[-1]['stop']
-        t0 = time.time()
-        haz_sids = dstore['gmf_data/sid'][s0:s1]
-    dt = time.time() - t0
-    idx, = numpy.where(numpy.isin(haz_sids, risk_sids))
-    if len(idx) == 0:
+    risk_sids = monitor.read('sids')
+    s0, s1 = sbe[0]['start'], sbe[-1]['stop']
+    with monitor('reading GMFs', measuremem=True):
+        df = read_gmfs(dstore, s0, s1, gmfcols, monitor.shared, risk_sids)
+    if len(df) == 0:
         return {}
-    # print('waiting %.1f' % dt)
-    time.sleep(dt)
-    with dstore, monitor('reading GMFs', measuremem=True):
-        start, stop = idx.min(), idx.max() + 1
-        dic = {}
-        for col in gmfcols:
-            if col == 'sid':
-                dic[col] = haz_sids[idx]
-            else:
-                dset = dstore['gmf_data/' + col]
-                dic[col] = dset[s0+start:s0+stop][idx - start]
-    df = pandas.DataFrame(dic)
-    del dic
     # if max_gmvs_chunk is too small, there is a huge data transfer in
     # avg_losses and the calculation may hang; if too large, run out of memory
     slices = performance.split_slices(
@@ -25,7 +25,7 @@ import collections
 import numpy
 import pandas
 
-from openquake.baselib.general import DictArray, AccumDict
+from openquake.baselib.general import DictArray, AccumDict, gen_slices
 from openquake.baselib import hdf5, writers
 from openquake.baselib.python3compat import decode
 from openquake.calculators.views import view, text_table
@@ -464,6 +464,38 @@ def export_gmf_data_csv(ekey, dstore):
         return [fname, f]
 
 
+@export.add(('gmf_data', 'parquet'))
+def export_gmf_data_parquet(ekey, dstore):
+    """
+    Export gmf_data with the same columns of the CSV exporter, streaming
+    over the HDF5 datasets; the rows are kept in the storage order, i.e.
+    they are not sorted by event ID
+    """
+    oq = dstore['oqparam']
+    if 'complete' in dstore:
+        complete = dstore['complete']
+    else:
+        complete = dstore['sitecol']
+    if 'custom_site_id' in complete.array.dtype.names:
+        ren = {'sid': 'custom_site_id', 'eid': 'event_id'}
+    else:
+        ren = {'sid': 'site_id', 'eid': 'event_id'}
+    for imt in oq.imtls:
+        ren[imt] = 'gmv_' + imt
+    for imt in oq.sec_imts:
+        ren[imt] = imt
+    gmf_data = dstore['gmf_data']
+    fname = dstore.build_fname('gmf', 'data', 'parquet')
+    with writers.ParquetWriter(fname, dstore.metadata) as writer:
+        for slc in gen_slices(0, len(gmf_data['sid']), writers.PARQUET_ROWS):
+            dic = {ren[col]: gmf_data[col][slc] for col in ren}
+            if 'custom_site_id' in dic:
+                dic['custom_site_id'] = decode(
+                    complete.custom_site_id[dic['custom_site_id']])
+            writer.save_block(dic)
+    return [fname]
+
+
 @export.add(('site_model', 'csv'))
 def export_site_model_csv(ekey, dstore):
     sitecol = dstore['sitecol']
@@ -182,7 +182,7 @@ def export_mmi_tags(ekey, dstore):
     return [dest]
 
 
-def _get_data(dstore, dskey, loss_types, stats):
+def _get_data(dstore, dskey, loss_types, stats, slc=slice(None)):
     name, kind = dskey.split('-')  # i.e. ('avg_losses', 'stats')
     if kind == 'stats':
         try:
@@ -193,16 +193,17 @@ def _get_data(dstore, dskey, loss_types, stats):
         if dskey in set(dstore):  # precomputed
             rlzs_or_stats = list(stats)
             statfuncs = [stats[ros] for ros in stats]
-            value = avglosses(dstore, loss_types, 'stats')  # shape (A, S, L)
+            # shape (A, S, L)
+            value = avglosses(dstore, loss_types, 'stats', slc)
         elif dstore['oqparam'].collect_rlzs:
             rlzs_or_stats = list(stats)
-            value = avglosses(dstore, loss_types, 'rlzs')
+            value = avglosses(dstore, loss_types, 'rlzs', slc)
         else:  # compute on the fly
             rlzs_or_stats, statfuncs = zip(*stats.items())
             value = compute_stats2(
-                avglosses(dstore, loss_types, 'rlzs'), statfuncs, weights)
+                avglosses(dstore, loss_types, 'rlzs', slc), statfuncs, weights)
     else:  # rlzs
-        value = avglosses(dstore, loss_types, kind)  # shape (A, R, L)
+        value = avglosses(dstore, loss_types, kind, slc)  # shape (A, R, L)
         R = value.shape[1]
         rlzs_or_stats = ['rlz-%03d' % r for r in range(R)]
     return name, value, rlzs_or_stats
@@ -236,6 +237,44 @@ def export_avg_losses(ekey, dstore):
     return writer.getsaved()
 
 
+@export.add(('avg_losses-rlzs', 'parquet'), ('avg_losses-stats', 'parquet'))
+def export_avg_losses_parquet(ekey, dstore):
+    """
+    Export the average losses of all realizations (or statistics) in
+    a single Parquet file with a column rlz (or stat), streaming over
+    blocks of assets
+
+    :param ekey: export key, i.e. a pair (datastore key, fmt)
+    :param dstore: datastore object
+    """
+    dskey = ekey[0]
+    oq = dstore['oqparam']
+    assets = get_assets(dstore)
+    md = dstore.metadata
+    md.update(dict(investigation_time=oq.investigation_time,
+                   risk_investigation_time=oq.risk_investigation_time
+                   or oq.investigation_time))
+    rlz_or_stat = 'stat' if dskey.endswith('stats') else 'rlz'
+    dest = dstore.build_fname(dskey, '', 'parquet')
+    with writers.ParquetWriter(dest, md) as writer:
+        for slc in general.gen_slices(
+                0, len(assets), writers.PARQUET_ROWS):
+            _name, value, rlzs_or_stats = _get_data(
+                dstore, dskey, oq.ext_loss_types, oq.hazard_stats(), slc)
+            adic = {}
+            for col in assets.dtype.names:
+                arr = assets[col][slc]
+                adic['asset_id' if col == 'id' else col] = (
+                    arr if col in ('lon', 'lat') else decode(arr))
+            for ros, values in zip(rlzs_or_stats, value.transpose(1, 0, 2)):
+                dic = adic.copy()
+                dic[rlz_or_stat] = [ros] * len(values)
+                for li, ln in enumerate(oq.ext_loss_types):
+                    dic[ln] = values[:, li]
+                writer.save_block(dic)
+    return [dest]
+
+
 @export.add(('src_loss_table', 'csv'))
 def export_src_loss_table(ekey, dstore):
     """
@@ -317,6 +356,50 @@ def export_event_loss_table(ekey, dstore):
     return writer.getsaved()
 
 
+@export.add(('risk_by_event', 'parquet'))
+def export_event_loss_table_parquet(ekey, dstore):
+    """
+    Export the event loss table with the same columns of the CSV exporter,
+    streaming over risk_by_event; unlike the CSV exporter the rows are not
+    sorted and the post loss amplification is not computed
+
+    :param ekey: export key, i.e. a pair (datastore key, fmt)
+    :param dstore: datastore object
+    """
+    oq = dstore['oqparam']
+    dest = dstore.build_fname('risk_by_event', '', 'parquet')
+    md = dstore.metadata
+    if 'scenario' not in oq.calculation_mode:
+        md.update(dict(investigation_time=oq.investigation_time,
+                       risk_investigation_time=oq.risk_investigation_time
+                       or oq.investigation_time))
+    events = dstore['events'][()]
+    skip = {'id', 'ses_id', 'rlz_id'}
+    if 'scenario' in oq.calculation_mode:
+        skip |= {'rup_id', 'year'}
+    evcols = [col for col in events.dtype.names if col not in skip]
+    K = dstore.get_attr('risk_by_event', 'K', 0)
+    try:
+        lstates = dstore.get_attr('risk_by_event', 'limit_states').split()
+    except KeyError:  # ebrisk, no limit states
+        lstates = []
+    ren = {'dmg_%d' % i: lstate for i, lstate in enumerate(lstates, 1)}
+    rbe = dstore['risk_by_event']
+    cols = [col for col in rbe.attrs['__pdcolumns__'].split()
+            if col not in ('agg_id', 'loss_id', 'variance')]
+    with writers.ParquetWriter(dest, md) as writer:
+        for slc in general.gen_slices(
+                0, len(rbe['agg_id']), writers.PARQUET_ROWS):
+            ok = rbe['agg_id'][slc] == K
+            dic = {ren.get(col, col): rbe[col][slc][ok] for col in cols}
+            dic['loss_type'] = scientific.LOSSTYPE[rbe['loss_id'][slc][ok]]
+            idx = numpy.searchsorted(events['id'], dic['event_id'])
+            for col in evcols:
+                dic[col] = events[col][idx]
+            writer.save_block(dic)
+    return [dest]
+
+
 def _compact(array):
     # convert an array of shape (a, e) into an array of shape (a,)
     dt = array.dtype
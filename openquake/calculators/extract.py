@@ -161,13 +161,13 @@ def barray(iterlines):
     return arr
 
 
-def avglosses(dstore, loss_types, kind):
+def avglosses(dstore, loss_types, kind, slc=slice(None)):
     """
     :returns: an array of average losses of shape (A, R, L)
     """
     lst = []
     for loss_type in loss_types:
-        lst.append(dstore['avg_losses-%s/%s' % (kind, loss_type)][()])
+        lst.append(dstore['avg_losses-%s/%s' % (kind, loss_type)][slc])
     # shape L, A, R -> A, R, L
     return numpy.array(lst).transpose(1, 2, 0)
 
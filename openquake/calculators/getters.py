@@ -20,8 +20,8 @@ import operator
 import collections
 import numpy
 
-from openquake.baselib import general, hdf5
-from openquake.hazardlib.map_array import MapArray
+from openquake.baselib import general, hdf5, performance
+from openquake.hazardlib.map_array import MapArray, rates_dt
 from openquake.hazardlib.calc.disagg import to_rates, to_probs
 from openquake.hazardlib.source.rupture import BaseRupture, get_ebr
 from openquake.commonlib.calc import get_proxies
@@ -45,11 +45,21 @@ def build_stat_curve(hcurve, imtls, stat, weights, wget, use_rates=False):
     """
     Build statistics by taking into account IMT-dependent weights
     """
-    poes = hcurve.T  # shape R, L
+    return build_stat_curves(
+        hcurve[None], imtls, stat, weights, wget, use_rates)[0][:, None]
+
+
+def build_stat_curves(hcurves, imtls, stat, weights, wget, use_rates=False):
+    """
+    Build statistics for a block of sites in a single pass
+
+    :param hcurves: an array of shape (N, L, R)
+    :returns: an array of shape (N, L)
+    """
+    poes = hcurves.transpose(2, 0, 1)  # shape R, N, L
     assert len(poes) == len(weights), (len(poes), len(weights))
-    L = imtls.size
-    array = numpy.zeros((L, 1))
-    
+    N, L, _R = hcurves.shape
+    array = numpy.zeros((N, L), hcurves.dtype)
     if weights.shape[1] > 1:  # IMT-dependent weights
         # this is slower since the arrays are shorter
         for imt in imtls:
@@ -58,14 +68,14 @@ def build_stat_curve(hcurve, imtls, stat, weights, wget, use_rates=False):
             if not ws.sum():  # expect no data for this IMT
                 continue
             if use_rates:
-                array[slc, 0] = to_probs(stat(to_rates(poes[:, slc]), ws))
+                array[:, slc] = to_probs(stat(to_rates(poes[:, :, slc]), ws))
             else:
-                array[slc, 0] = stat(poes[:, slc], ws)
+                array[:, slc] = stat(poes[:, :, slc], ws)
     else:
         if use_rates:
-            array[:, 0] = to_probs(stat(to_rates(poes), weights[:, -1]))
+            array[:] = to_probs(stat(to_rates(poes), weights[:, -1]))
         else:
-            array[:, 0] = stat(poes, weights[:, -1])
+            array[:] = stat(poes, weights[:, -1])
     return array
 
 
@@ -167,6 +177,87 @@ def get_num_chunks_sites(dstore):
     return chunks, N
 
     
+def rates_fnames(dstore):
+    """
+    :returns: the names of the files containing the _rates of a calculation
+    :raises: FileNotFoundError if the scratch files of a completed
+             calculation are missing or have been modified
+    """
+    fnames = [dstore.filename]
+    attrs = dstore.hdf5.attrs
+    if 'scratch_dir' not in attrs:  # no tiling
+        return fnames
+    scratch_dir = attrs['scratch_dir']
+    if 'scratch_files' not in attrs:  # the calculation is running
+        for f in os.listdir(scratch_dir):
+            if f.endswith('.hdf5'):
+                fnames.append(os.path.join(scratch_dir, f))
+        return fnames
+    for name, size in zip(attrs['scratch_files'].split(),
+                          attrs['scratch_sizes']):
+        fname = os.path.join(scratch_dir, name)
+        if not os.path.exists(fname) or os.path.getsize(fname) != size:
+            raise FileNotFoundError('%s is missing or incomplete' % fname)
+        fnames.append(fname)
+    return fnames
+
+
+def compact_rates(fname, monitor):
+    """
+    Rewrite the _rates in the given scratch file as contiguous uncompressed
+    datasets sorted by chunk index, so that they can be memory-mapped
+    """
+    with hdf5.File(fname, 'r') as h5:
+        slices = h5['_rates/slice_by_idx'][:]
+        if h5['_rates/sid'].id.get_offset() is not None:  # already compact
+            return {}
+        arrays = {col: h5[f'_rates/{col}'][:] for col in rates_dt.names}
+    slices.sort(order='idx')
+    idxs = numpy.concatenate(
+        [numpy.arange(start, stop) for start, stop in zip(
+            slices['start'], slices['stop'])])
+    iss = []
+    offset = 0
+    for idx, start, stop in performance.idx_start_stop(slices['idx']):
+        size = (slices['stop'][start:stop] - slices['start'][start:stop]).sum()
+        iss.append((idx, offset, offset + size))
+        offset += size
+    tmp = fname + '.tmp'
+    with hdf5.File(tmp, 'w') as h5:
+        for col in rates_dt.names:
+            h5[f'_rates/{col}'] = arrays.pop(col)[idxs]
+        h5['_rates'].attrs['__pdcolumns__'] = ' '.join(rates_dt.names)
+        h5['_rates/slice_by_idx'] = numpy.array(iss, slice_dt)
+    os.replace(tmp, fname)
+    return {}
+
+
+def read_rates(h5, start, stop, dsets=None):
+    """
+    :param h5: an open hdf5.File containing a _rates group
+    :param start: start index of the slice
+    :param stop: stop index of the slice
+    :param dsets: a dictionary col -> memmap or dataset, populated in the
+                  first call and reused in the following calls on `h5`
+    :returns: the arrays sid, lid, gid, rate in the slice
+
+    Contiguous datasets (see `compact_rates`) are memory-mapped and the
+    returned arrays are views on the file, chunked datasets are read
+    via h5py.
+    """
+    if dsets is None:
+        dsets = {}
+    out = []
+    for col in rates_dt.names:
+        if col not in dsets:
+            dset = h5[f'_rates/{col}']
+            offset = dset.id.get_offset()
+            dsets[col] = dset if offset is None else numpy.memmap(
+                h5.filename, dset.dtype, 'r', offset, dset.shape)
+        out.append(dsets[col][start:stop])
+    return out
+
+
 def map_getters(dstore, full_lt=None, disagg=False):
     """
     :returns: a list of pairs (MapGetter, weights)
@@ -185,15 +276,7 @@ def map_getters(dstore, full_lt=None, disagg=False):
         trt_rlzs = numpy.zeros(len(weights))  # reduces the data transfer
     else:
        weights = full_lt.weights
-    fnames = [dstore.filename]
-    try:
-        scratch_dir = dstore.hdf5.attrs['scratch_dir']
-    except KeyError:  # no tiling
-        pass
-    else:
-        for f in os.listdir(scratch_dir):
-            if f.endswith('.hdf5'):
-                fnames.append(os.path.join(scratch_dir, f))
+    fnames = rates_fnames(dstore)
     out = []
     for chunk in range(chunks):
         getter = MapGetter(fnames, chunk, trt_rlzs, R, oq)
@@ -265,6 +348,7 @@ class MapGetter(object):
         self.imtls = oq.imtls
         self.poes = oq.poes
         self.use_rates = oq.use_rates
+        self.dtype = numpy.dtype(oq.precision)
         self.eids = None
         self._map = {}
 
@@ -304,17 +388,21 @@ class MapGetter(object):
             with hdf5.File(fname) as dstore:
                 slices = dstore['_rates/slice_by_idx'][:]
                 slices = slices[slices['idx'] == self.idx]
+                dsets = {}  # a single memmap per column and file
                 for start, stop in zip(slices['start'], slices['stop']):
-                    rates_df = dstore.read_df('_rates', slc=slice(start, stop))
-                    # not using groupby to save memory
-                    for sid in rates_df.sid.unique():
-                        df = rates_df[rates_df.sid == sid]
+                    sid, lid, gid, rate = read_rates(
+                        dstore, start, stop, dsets)
+                    # not using groupby to save memory; only the site IDs
+                    # are copied, the other columns are read site by site
+                    order = sid.argsort(kind='stable')
+                    for s, i, j in performance.idx_start_stop(sid[order]):
                         try:
-                            array = self._map[sid]
+                            array = self._map[s]
                         except KeyError:
-                            array = numpy.zeros((self.L, self.G))
-                            self._map[sid] = array
-                        array[df.lid, df.gid] = df.rate
+                            array = numpy.zeros((self.L, self.G), self.dtype)
+                            self._map[s] = array
+                        idx = order[i:j]
+                        array[lid[idx], gid[idx]] = rate[idx]
         return self._map
 
     def get_hcurve(self, sid):  # used in classical
@@ -323,7 +411,7 @@ class MapGetter(object):
         :returns: an array of shape (L, R) for the given site ID
         """
         pmap = self.init()
-        r0 = numpy.zeros((self.L, self.R))
+        r0 = numpy.zeros((self.L, self.R), self.dtype)
         if sid not in pmap:  # no hazard for sid
             return r0
         for g, t_rlzs in enumerate(self.trt_rlzs):
@@ -333,6 +421,22 @@ class MapGetter(object):
                 r0[:, rlz] += rates
         return to_probs(r0)
 
+    def get_hcurves(self, sids):  # used in classical
+        """
+        :param sids: a list of site IDs
+        :returns: an array of shape (N, L, R) for the given site IDs
+        """
+        pmap = self.init()
+        rates = numpy.zeros((len(sids), self.L, self.G), self.dtype)
+        for i, sid in enumerate(sids):
+            if sid in pmap:  # else no hazard for sid
+                rates[i] = pmap[sid]
+        r0 = numpy.zeros((len(sids), self.L, self.R), self.dtype)
+        for g, t_rlzs in enumerate(self.trt_rlzs):
+            rlzs = t_rlzs % TWO24
+            r0[:, :, rlzs] += rates[:, :, g, None]
+        return to_probs(r0)
+
     def get_fast_mean(self, gweights):
         """
         :returns: a MapArray of shape (N, M, L1) with the mean hcurves
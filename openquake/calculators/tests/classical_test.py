@@ -19,14 +19,19 @@
 import os
 import sys
 import gzip
+import zlib
+import pickle
 import tempfile
 import numpy
 from unittest import mock
-from openquake.baselib import parallel, general, config
+from openquake.baselib import parallel, general, config, hdf5
 from openquake.baselib.python3compat import decode
 from openquake.hazardlib import InvalidFile, nrml, calc
 from openquake.hazardlib.source.rupture import get_ruptures_aw
 from openquake.hazardlib.sourcewriter import write_source_model
+from openquake.calculators import getters
+from openquake.calculators.classical import (
+    TilePlanner, share_srcs_sitecol, read_srcs_sitecol)
 from openquake.calculators.views import view, text_table
 from openquake.calculators.export import export
 from openquake.calculators.extract import extract
@@ -99,6 +104,59 @@ class ClassicalTestCase(CalculatorTestCase):
             self.run_calc(case_01.__file__, 'job.ini', minimum_magnitude='4.5')
         self.assertIn('All sources were discarded', str(ctx.exception))
 
+    def test_case_01_shared_srcs(self):
+        # the sources and the sitecol are read from the shared memory
+        # and decoded only once per worker
+        self.run_calc(case_01.__file__, 'job.ini')
+        ds = self.calc.datastore
+        smap = mock.Mock(distribute='processpool')
+        share_srcs_sitecol(smap, ds, [0])
+        shared = {k: parallel.SharedArray.new(arr)
+                  for k, arr in smap.share.call_args.kwargs.items()}
+        try:
+            srcs, sitecol = read_srcs_sitecol(None, 0, ds, shared)
+            srcs2, sitecol2 = read_srcs_sitecol(None, 0, ds, shared)
+        finally:
+            for arr in shared.values():
+                arr.unlink()
+        self.assertIs(srcs, srcs2)
+        self.assertIs(sitecol, sitecol2)
+        with ds:
+            expected = ds['sitecol'].complete
+            [src] = pickle.loads(zlib.decompress(
+                ds.getitem('_csm')[0].tobytes()))
+        self.assertEqual(sitecol, expected)
+        self.assertEqual([s.source_id for s in srcs], [src.source_id])
+
+    def test_case_01_fast_poes(self):
+        # check the interpolated PoEs are close to the exact ones;
+        # see utils/bench_fast_poes.py for the speedup on the QA cases
+        self.assert_curves_ok(
+            ['hazard_curve-PGA.csv', 'hazard_curve-SA(0.1).csv'],
+            case_01.__file__, delta=1E-5, fast_poes='true')
+
+    def test_case_01_float32(self):
+        # check the float32 precision gives the same curves up to 1E-5,
+        # as stated in the documentation of the precision parameter
+        self.assert_curves_ok(
+            ['hazard_curve-PGA.csv', 'hazard_curve-SA(0.1).csv'],
+            case_01.__file__, delta=1E-5, precision='float32')
+
+    def test_case_01_reuse_rates(self):
+        self.run_calc(case_01.__file__, 'job.ini')
+        calc_id = str(self.calc.datastore.calc_id)
+
+        # the only source group is unchanged, so its rates are reused
+        self.assert_curves_ok(
+            ['hazard_curve-PGA.csv', 'hazard_curve-SA(0.1).csv'],
+            case_01.__file__, reuse_rates_from=calc_id)
+        self.assertEqual(self.calc.reused, {0: 0})
+
+        # changing the truncation level the rates are recomputed
+        self.run_calc(case_01.__file__, 'job.ini', truncation_level='3',
+                      reuse_rates_from=calc_id)
+        self.assertEqual(self.calc.reused, {})
+
     def test_case_02(self):
         # test for Lanzano2019 with vs30 > 1500
         self.assert_curves_ok(['hazard_curve-PGA.csv'], case_02.__file__)
@@ -207,6 +265,56 @@ class ClassicalTestCase(CalculatorTestCase):
         self.assertEqual(data['tiles'], 1)
         self.assertEqual(data['blocks'], 2)
 
+        # the rates in the scratch files are contiguous and memory-mappable
+        fnames = getters.rates_fnames(self.calc.datastore)
+        self.assertGreater(len(fnames), 1)
+        with hdf5.File(fnames[1]) as h5:
+            self.assertIsNotNone(h5['_rates/sid'].id.get_offset())
+            slices = h5['_rates/slice_by_idx'][:]
+            start, stop = slices[0]['start'], slices[-1]['stop']
+            sid, lid, gid, rate = getters.read_rates(h5, start, stop)
+            numpy.testing.assert_equal(rate, h5['_rates/rate'][start:stop])
+
+    def test_case_22_reuse_rates(self):
+        # reusing the rates of a tiling calculation, stored in scratch files
+        tmp = tempfile.gettempdir()
+        with mock.patch.dict(os.environ, {'OQ_DISTRIBUTE': 'no'}), \
+             mock.patch.dict(config.memory, {'pmap_max_gb': 1E-5}), \
+             mock.patch.dict(config.directory, {'custom_tmp': tmp}):
+            self.run_calc(case_22.__file__, 'job.ini')
+            sgs = self.calc.datastore['source_groups']
+            self.assertTrue(sgs.attrs['tiling'])
+            calc_id = str(self.calc.datastore.calc_id)
+            fnames = getters.rates_fnames(self.calc.datastore)
+            self.assertGreater(len(fnames), 1)
+            expected = self.calc.datastore['hcurves-stats'][:]
+
+            self.run_calc(case_22.__file__, 'job.ini',
+                          reuse_rates_from=calc_id)
+            self.assertEqual(len(self.calc.reused), len(self.calc.cmakers))
+            numpy.testing.assert_allclose(
+                self.calc.datastore['hcurves-stats'][:], expected, rtol=1E-6)
+
+            # if a scratch file has been purged the rates are recomputed
+            os.remove(fnames[1])
+            self.run_calc(case_22.__file__, 'job.ini',
+                          reuse_rates_from=calc_id)
+            self.assertEqual(self.calc.reused, {})
+            numpy.testing.assert_allclose(
+                self.calc.datastore['hcurves-stats'][:], expected, rtol=1E-6)
+
+    def test_tile_planner(self):
+        tiler = TilePlanner(L=64, target_mb=1)
+        # before any measurement the size of the rates is used
+        self.assertEqual(tiler.num_tiles(G=4, N=1024), 1)
+        self.assertEqual(tiler.num_tiles(G=4, N=1024, hint=3), 3)
+        tiler.update(1E-3)  # measured 1 KB per gsim and site
+        self.assertAlmostEqual(tiler.num_tiles(G=4, N=1024), 4.096)
+        for _ in range(3):
+            tiler.update(1E-3)
+        tiler.update(1.)  # a single outlier does not change the tiles
+        self.assertAlmostEqual(tiler.num_tiles(G=4, N=1024), 4.096)
+
     def test_case_22_bis(self):
         # crossing date line calculation for Alaska
         # this also tests full tiling without custom_dir
@@ -706,6 +814,12 @@ class ClassicalTestCase(CalculatorTestCase):
         self.assertEqual(decode(sinfo['source_id']), ['ufc3mean_0'])
         ae(sinfo['num_ruptures'], [5])
 
+        # test dynamic tasks give the same curves
+        self.run_calc(case_75.__file__, 'job.ini', disagg_by_src='false',
+                      dynamic_tasks='true')
+        [f1] = export(('hcurves/mean', 'csv'), self.calc.datastore)
+        self.assertEqualFiles('expected/hcurve-mean.csv', f1)
+
         # test calculation with multi-fault and disagg_by_src
         self.run_calc(case_75.__file__, 'job.ini')
         [f1] = export(('hcurves/mean', 'csv'), self.calc.datastore)
@@ -17,12 +17,13 @@
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 import os
 import sys
-from unittest import mock, SkipTest
+from unittest import mock, SkipTest, TestCase
 import numpy
+import pandas
 
-from openquake.baselib.general import gettemp
+from openquake.baselib.general import gettemp, AccumDict, fast_agg2
 from openquake.baselib.hdf5 import read_csv
-from openquake.baselib.writers import CsvWriter, FIVEDIGITS
+from openquake.baselib.writers import CsvWriter, FIVEDIGITS, pyarrow
 from openquake.hazardlib import InvalidFile
 from openquake.hazardlib.source.rupture import get_ruptures_aw
 from openquake.commonlib import logs, readinput
@@ -30,7 +31,10 @@ from openquake.calculators.views import view, text_table
 from openquake.calculators.tests import CalculatorTestCase, strip_calc_id
 from openquake.calculators.export import export
 from openquake.calculators.extract import extract
-from openquake.calculators.post_risk import PostRiskCalculator
+from openquake.calculators.post_risk import (
+    PostRiskCalculator, fix_dtypes)
+from openquake.calculators.event_based_risk import AggLossTable, TWO32
+from openquake.risklib.scientific import LOSSID
 from openquake.qa_tests_data.event_based_risk import (
     case_1, case_2, case_3, case_4, case_4a, case_5, case_6c, case_master,
     case_miriam, occupants, case_1f, case_1g, case_7a, case_8, case_9,
@@ -208,6 +212,25 @@ agg_id
         self.assertEqualFiles('expected/avg_losses.csv', fname)
         os.remove(fname)
 
+    def test_case_1g_parquet(self):
+        # the Parquet exporters must give the same numbers of the CSV ones
+        if pyarrow is None:
+            raise SkipTest('pyarrow is not installed')
+        self.run_calc(case_1g.__file__, 'job_h.ini,job_r.ini')
+        for key in ['avg_losses-rlzs', 'risk_by_event', 'gmf_data']:
+            fnames = export((key, 'csv'), self.calc.datastore)
+            if key == 'gmf_data':  # skip sigma_epsilon and sitemesh
+                fnames = fnames[:1]
+            csv = pandas.concat([pandas.read_csv(fname, comment='#')
+                                 for fname in fnames])
+            [pname] = export((key, 'parquet'), self.calc.datastore)
+            df = pandas.read_parquet(pname)
+            self.assertEqual(len(df), len(csv))
+            for col in csv.columns:
+                if csv[col].dtype.kind == 'f':
+                    aac(numpy.sort(df[col]), numpy.sort(csv[col]),
+                        rtol=1E-4, err_msg=col)
+
     def test_case_2(self):
         self.run_calc(case_2.__file__, 'job.ini', concurrent_tasks='0')
         loss0 = view('portfolio_losses', self.calc.datastore)
@@ -775,3 +798,84 @@ class ReinsuranceTestCase(CalculatorTestCase):
         [fname] = export(('reinsurance-aggcurves', 'csv'), self.calc.datastore)
         self.assertEqualFiles('expected/reinsurance-aggcurves.csv',
                               fname, delta=.002)  # big diffs on macos, 0.16%
+
+
+def agg_loss_dict(xtypes, batches):
+    # the AccumDict-based aggregation used before AggLossTable
+    acc = AccumDict(accum=numpy.zeros((len(xtypes), 2)))
+    for keys, values, correl, li in batches:
+        ukeys, avalues = fast_agg2(keys, values)
+        if correl:
+            avalues[:, 0] = avalues[:, 0] ** 2
+        for ukey, avalue in zip(ukeys, avalues):
+            acc[ukey][li] += avalue
+    dic = AccumDict(accum=[])
+    for ukey, arr in acc.items():
+        eid, kid = divmod(ukey, TWO32)
+        for li in range(len(xtypes)):
+            if arr[li].any():
+                dic['event_id'].append(eid)
+                dic['agg_id'].append(kid)
+                dic['loss_id'].append(LOSSID[xtypes[li]])
+                for c, col in enumerate(['variance', 'loss']):
+                    dic[col].append(arr[li, c])
+    fix_dtypes(dic)
+    return pandas.DataFrame(dic)
+
+
+class AggLossTableTestCase(TestCase):
+    xtypes = ['structural', 'nonstructural']
+
+    def setUp(self):
+        rng = numpy.random.default_rng(42)
+        self.batches = []
+        for i in range(6):
+            n = 50
+            eids = rng.integers(0, 20, n).astype(numpy.uint64)
+            kids = rng.integers(0, 3, n).astype(numpy.uint64)
+            values = rng.random((n, 2))
+            values[:5] = 0  # some zero losses
+            self.batches.append(
+                (eids * TWO32 + kids, values, i % 3 == 0, i % 2))
+
+    def build(self, batches):
+        acc = AggLossTable(self.xtypes)
+        for batch in batches:
+            acc.add(*batch)
+        return acc
+
+    def assert_same(self, df, expected):
+        cols = ['event_id', 'agg_id', 'loss_id']
+        expected = expected.sort_values(cols).reset_index(drop=True)
+        self.assertEqual(list(df.columns), list(expected.columns))
+        for col in cols:
+            numpy.testing.assert_equal(df[col].to_numpy(),
+                                       expected[col].to_numpy())
+        for col in ['variance', 'loss']:
+            aac(df[col].to_numpy(), expected[col].to_numpy())
+
+    def test_to_dframe(self):
+        df = self.build(self.batches).to_dframe()
+        self.assert_same(df, agg_loss_dict(self.xtypes, self.batches))
+        # the rows are sorted by key and not by insertion order
+        keys = df.event_id.to_numpy() * 1000 + df.agg_id.to_numpy()
+        self.assertTrue((numpy.diff(keys) >= 0).all())
+
+    def test_reduce(self):
+        acc = self.build(self.batches)
+        allkeys = numpy.concatenate([b[0] for b in self.batches])
+        self.assertEqual(acc.reduce(), len(numpy.unique(allkeys)))
+        self.assertEqual(len(acc.keys), 1)
+        self.assertEqual(acc.reduce(), len(numpy.unique(allkeys)))
+
+    def test_iadd(self):
+        acc = self.build(self.batches[:3])
+        acc += self.build(self.batches[3:])
+        self.assert_same(acc.to_dframe(),
+                         agg_loss_dict(self.xtypes, self.batches))
+
+    def test_empty(self):
+        df = AggLossTable(self.xtypes).to_dframe()
+        self.assertEqual(len(df), 0)
+        self.assertEqual(list(df.columns),
+                         ['event_id', 'agg_id', 'loss_id', 'variance', 'loss'])
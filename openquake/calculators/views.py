@@ -734,11 +734,13 @@ def view_task_info(token, dstore):
     for task, arr in group_array(task_info[()], 'taskname').items():
         val = discard_small(arr['duration'])
         if len(val):
-            data.append(stats(task, val, val.max() / val.mean()))
+            # the 95th percentile and the slowfac measure the tail latency
+            data.append(stats(task, val, numpy.percentile(val, 95),
+                              val.max() / val.mean()))
     if not data:
         return 'Not available'
-    return numpy.array(
-        data, dt('operation-duration counts mean stddev min max slowfac'))
+    return numpy.array(data, dt(
+        'operation-duration counts mean stddev min max p95 slowfac'))
 
 
 def reduce_srcids(srcids):
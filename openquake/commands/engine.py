@@ -97,7 +97,8 @@ def main(
         exports='',
         log_level='info',
         sample_sources=False,
-        nodes: int = 1):
+        nodes: int = 1,
+        priority: int = 0):
     """
     Run a calculation using the traditional command line API
     """
@@ -171,7 +172,8 @@ def main(
         for job in jobs:
             job.params.update(pars)
             job.params['exports'] = exports
-        run_jobs(jobs, nodes=nodes, sbatch=True, precalc=not multi)
+        run_jobs(jobs, nodes=nodes, sbatch=True, precalc=not multi,
+                 priority=priority)
 
     # hazard
     elif list_hazard_calculations:
@@ -279,3 +281,4 @@ main.log_level = dict(help='Defaults to "info"',
 main.sample_sources = dict(abbrev='--ss',
                            help="Sample fraction in the range 0..1")
 main.nodes = 'Number of SLURM nodes (if applicable)'
+main.priority = 'Jobs with higher priority are taken first from the queue'
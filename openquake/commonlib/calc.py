@@ -16,13 +16,15 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
 
+import time
 import logging
 import operator
 import functools
 import numpy
+import pandas
 from shapely.geometry import Point
 
-from openquake.baselib import performance, parallel, hdf5, general
+from openquake.baselib import performance, parallel, hdf5, general, config
 from openquake.hazardlib.source import rupture
 from openquake.hazardlib import map_array, geo
 from openquake.hazardlib.source.rupture import get_events
@@ -462,6 +464,8 @@ def starmap_from_gmfs(task_func, oq, dstore, mon):
         for slc in general.gen_slices(0, len(sbe), 100_000):
             slices.append(get_slices(sbe[slc], data, num_assets))
         slices = numpy.concatenate(slices, dtype=slices[0].dtype)
+    gmf_dt = oq.gmf_data_dt()
+    nbytes = len(data['sid']) * gmf_dt.itemsize
     dstore.swmr_on()
     maxw = slices['weight'].sum() / (oq.concurrent_tasks or 1) or 1.
     logging.info('maxw = {:_d}'.format(int(maxw)))
@@ -471,9 +475,84 @@ def starmap_from_gmfs(task_func, oq, dstore, mon):
         maxweight=min(maxw, 200_000_000),
         weight=operator.itemgetter('weight'),
         h5=dstore.hdf5)
+    if (smap.distribute in ('processpool', 'threadpool') and
+            nbytes < float(config.memory.shared_gmf_gb) * 1024**3):
+        with mon('sharing GMFs', measuremem=True):
+            smap.share(gmf_data=share_gmfs(dstore['gmf_data'], gmf_dt))
     return smap
 
 
+def share_gmfs(data, gmf_dt, blocksize=10_000_000):
+    """
+    Read the GMFs in the master one block of rows at the time and store
+    them in a SharedArray, so that the workers do not need to read the
+    gmf_data datasets concurrently.
+
+    :param data: the gmf_data group
+    :param gmf_dt: the composite dtype returned by oq.gmf_data_dt()
+    :returns: a SharedArray with the GMFs
+    """
+    n = len(data['sid'])
+    shr = parallel.SharedArray((n,), gmf_dt, None)
+    with shr as arr:
+        for slc in general.gen_slices(0, n, blocksize):
+            for col in gmf_dt.names:
+                arr[col][slc] = data[col][slc]
+    return shr
+
+
+def read_gmfs(dstore, start, stop, gmfcols, shared, sids=None):
+    """
+    Read the GMFs in the range start:stop, from shared memory if possible,
+    otherwise from the datastore, throttling the reads when only the GMFs
+    on the given sites are needed. NB: the GMFs are shared only with
+    processpool/threadpool and below shared_gmf_gb; on a zmq cluster
+    the tasks still read the datastore concurrently, with the throttle
+
+    :param dstore: DataStore containing the gmf_data
+    :param start: start row
+    :param stop: stop row
+    :param gmfcols: the columns to read (sid, eid, gmv_...)
+    :param shared: dictionary of SharedArrays, possibly containing gmf_data
+    :param sids: if given, return only the GMFs on the given sites
+    :returns: a DataFrame with the given columns
+    """
+    if 'gmf_data' in shared:
+        with shared['gmf_data'] as gmfs:
+            arr = gmfs[start:stop]
+            if sids is not None:
+                arr = arr[numpy.isin(arr['sid'], sids)]
+            # NB: copying since the shared memory is closed at the end
+            return pandas.DataFrame({col: arr[col].copy() for col in gmfcols})
+    if sids is None:
+        with dstore:
+            data = dstore['gmf_data']
+            return pandas.DataFrame(
+                {col: data[col][start:stop] for col in gmfcols})
+    # read the site IDs first and then only the relevant rows
+    with dstore:
+        t0 = time.time()
+        haz_sids = dstore['gmf_data/sid'][start:stop]
+    dt = time.time() - t0
+    idx, = numpy.where(numpy.isin(haz_sids, sids))
+    if len(idx) == 0:
+        return pandas.DataFrame({col: [] for col in gmfcols})
+    # the tasks are reading the same file concurrently; sleeping for the
+    # time spent reading the site IDs spreads the reads and reduces the
+    # contention, which is significant on NFS
+    time.sleep(dt)
+    s0, s1 = start + idx.min(), start + idx.max() + 1
+    dic = {}
+    with dstore:
+        data = dstore['gmf_data']
+        for col in gmfcols:
+            if col == 'sid':
+                dic[col] = haz_sids[idx]
+            else:
+                dic[col] = data[col][s0:s1][idx + start - s0]
+    return pandas.DataFrame(dic)
+
+
 def get_close_mosaic_models(lon, lat, buffer_radius):
     """
     :param lon: longitude
@@ -20,8 +20,12 @@ Set up some system-wide loggers
 """
 import os
 import re
+import time
+import atexit
+import socket
 import getpass
 import logging
+import threading
 from datetime import datetime, timezone
 from openquake.baselib import config, zeromq, parallel, workerpool as w
 from openquake.commonlib import readinput, dbapi
@@ -34,6 +38,9 @@ LEVELS = {'debug': logging.DEBUG,
           'critical': logging.CRITICAL}
 SIMPLE_TYPES = (str, int, float, bool, datetime, list, tuple, dict, type(None))
 CALC_REGEX = r'(calc|cache)_(\d+)\.hdf5'
+LOG_FLUSH_SIZE = 100  # maximum number of buffered log records
+LOG_FLUSH_TIME = 1.  # maximum seconds a log record can stay in the buffer
+LOG_DRAIN_TIME = 10  # maximum seconds to wait for the pushed log records
 MODELS = []  # to be populated in get_tag
 
 
@@ -49,6 +56,34 @@ def get_tag(job_ini):
     return ''
 
 
+def get_dbhost():
+    """
+    :returns: a pair (dbhost, local) where local is True if the database
+              is accessed directly, without the DbServer
+    """
+    dbhost = os.environ.get('OQ_DATABASE', config.dbserver.host)
+    return dbhost, dbhost == '127.0.0.1' and getpass.getuser() != 'openquake'
+
+
+def get_log_address(dbhost=None):
+    """
+    :returns: the address of the DbServer socket receiving the log records
+    """
+    dbhost = dbhost or get_dbhost()[0]
+    port = config.dbserver.get('log_port') or int(config.dbserver.port) + 2
+    return 'tcp://%s:%s' % (dbhost, port)
+
+
+def get_notify_address(dbhost=None):
+    """
+    :returns: the address of the DbServer socket publishing a notification
+              every time a job finishes
+    """
+    dbhost = dbhost or get_dbhost()[0]
+    port = config.dbserver.get('notify_port') or int(config.dbserver.port) + 3
+    return 'tcp://%s:%s' % (dbhost, port)
+
+
 def dbcmd(action, *args):
     """
     A dispatcher to the database server.
@@ -61,8 +96,8 @@ def dbcmd(action, *args):
     for arg in args:
         if type(arg) not in SIMPLE_TYPES:
             raise TypeError(f'{arg} is not a simple type')
-    dbhost = os.environ.get('OQ_DATABASE', config.dbserver.host)
-    if dbhost == '127.0.0.1' and getpass.getuser() != 'openquake':
+    dbhost, local = get_dbhost()
+    if local:
         # access the database directly
         if action.startswith('workers_'):
             master = w.WorkerMaster(-1)  # current job
@@ -86,12 +121,106 @@ def dbcmd(action, *args):
     return res
 
 
+class LogBuffer(object):
+    """
+    Buffer of log records to be stored in the database. The records are
+    sent in a single batch when the buffer is full, when the oldest record
+    is older than `dt` seconds, or when .flush is called at the end of a job.
+    The batches are pushed to the DbServer without waiting for an answer.
+
+    :param size: maximum number of buffered records
+    :param dt: maximum number of seconds a record can stay in the buffer
+    """
+    def __init__(self, size=LOG_FLUSH_SIZE, dt=LOG_FLUSH_TIME):
+        self.size = size
+        self.dt = dt
+        self._reset()
+
+    def _reset(self):
+        # called in the constructor and after a fork
+        self.pid = os.getpid()
+        self.sender = '%s:%d' % (socket.gethostname(), self.pid)
+        self.pushed = 0  # number of batches pushed to the DbServer
+        self.records = []
+        self.lock = threading.RLock()  # dbcmd could log in the db
+        self.timer = None
+        self.sock = None
+
+    def append(self, job_id, level, process, msg):
+        """
+        Add a log record to the buffer, possibly flushing it
+        """
+        if self.pid != os.getpid():  # in a forked process
+            self._reset()
+        with self.lock:
+            self.records.append(
+                (job_id, datetime.now(UTC), level, process, msg))
+            if len(self.records) >= self.size:
+                self._flush()
+            elif self.timer is None:  # flush after dt seconds
+                self.timer = threading.Timer(self.dt, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self, sync=False):
+        """
+        Send the buffered records to the database. If sync is True, wait
+        until they are stored, together with the batches already pushed
+        by this process.
+        """
+        if self.pid != os.getpid():  # in a forked process
+            self._reset()
+        with self.lock:
+            self._flush(sync)
+
+    def _flush(self, sync=False):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        records, self.records = self.records, []
+        if records:
+            dbhost, local = get_dbhost()
+            if sync or local:
+                dbcmd('log_many', records)
+            else:
+                self._push(dbhost, records)
+        if sync and self.pushed:
+            self._wait_stored()
+
+    def _push(self, dbhost, records):
+        if self.sock is None:
+            self.sock = zeromq.connect(get_log_address(dbhost),
+                                       zeromq.zmq.PUSH)
+            self.sock.setsockopt(zeromq.zmq.LINGER, 5000)  # milliseconds
+        try:
+            self.sock.send_pyobj((self.sender, self.pushed + 1, records),
+                                 zeromq.zmq.NOBLOCK)
+        except zeromq.zmq.Again:  # the DbServer is not reachable
+            dbcmd('log_many', records)
+        else:
+            self.pushed += 1
+
+    def _wait_stored(self):
+        # wait until the DbServer has stored all the pushed batches
+        t0 = time.time()
+        while dbcmd('logs_stored', self.sender) < self.pushed:
+            if time.time() - t0 > LOG_DRAIN_TIME:
+                logging.warning('Some log records pushed to the DbServer '
+                                'have not been stored after %d seconds',
+                                LOG_DRAIN_TIME)
+                break
+            time.sleep(.01)
+
+
+LOG_BUFFER = LogBuffer()
+atexit.register(LOG_BUFFER.flush)
+
+
 def dblog(level: str, job_id: int, task_no: int, msg: str):
     """
-    Log on the database
+    Log on the database, asynchronously
     """
-    task = 'task #%d' % task_no
-    return dbcmd('log', job_id, datetime.now(UTC), level, task, msg)
+    LOG_BUFFER.append(job_id, level, 'task #%d' % task_no, msg)
 
 
 def get_datadir():
@@ -188,9 +317,9 @@ class LogDatabaseHandler(logging.Handler):
         self.job_id = job_id
 
     def emit(self, record):
-        dbcmd('log', self.job_id, datetime.now(UTC), record.levelname,
-              '%s/%s' % (record.processName, record.process),
-              record.getMessage())
+        LOG_BUFFER.append(self.job_id, record.levelname,
+                          '%s/%s' % (record.processName, record.process),
+                          record.getMessage())
 
 
 class LogContext:
@@ -266,14 +395,17 @@ class LogContext:
     def __exit__(self, etype, exc, tb):
         if tb:
             if etype is SystemExit:
-                dbcmd('finish', self.calc_id, 'aborted')
+                status = 'aborted'
             else:
                 # remove StreamHandler to avoid logging twice
                 logging.root.removeHandler(self.handlers[-1])
                 logging.exception(f'{etype.__name__}: {exc}')
-                dbcmd('finish', self.calc_id, 'failed')
+                status = 'failed'
         else:
-            dbcmd('finish', self.calc_id, 'complete')
+            status = 'complete'
+        # store the pending log records before the job is marked as finished
+        LOG_BUFFER.flush(sync=True)
+        dbcmd('finish', self.calc_id, status)
         for handler in self.handlers:
             logging.root.removeHandler(handler)
         parallel.Starmap.shutdown()
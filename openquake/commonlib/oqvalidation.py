@@ -138,6 +138,10 @@ cachedir:
   INTERNAL
 
 cache_distances:
+  Cache in memory the contexts of the non-point sources, so that
+  sources differing only by the MFD (for instance in logic trees with
+  MFD uncertainties) compute the distances only once. The memory used
+  by each process is limited by ctx_cache_gb in openquake.cfg.
   Useful in UCERF calculations.
   Example: *cache_distances = true*.
   Default: False
@@ -264,6 +268,14 @@ distance_bin_width:
   Example: *distance_bin_width = 20*.
   Default: no default
 
+dynamic_tasks:
+  Used in classical calculations with sources of very uneven cost, like
+  kite or multi-fault sources. The source groups are split in more blocks,
+  sent heavy blocks first as the workers free up, so that a bad weight
+  estimate produces a small slow task and not a big one.
+  Example: *dynamic_tasks = true*.
+  Default: False
+
 epsilon_star:
   A boolean controlling the typology of disaggregation output to be provided.
   When True disaggregation is perfomed in terms of epsilon* rather then
@@ -277,6 +289,14 @@ extreme_gmv:
   Example: *extreme_gmv = 5.0*
   Default: {'default': numpy.inf} i.e. no values are extreme
 
+fast_poes:
+  Compute the PoEs by interpolating a precomputed table of the truncated
+  normal survival function instead of calling the error function for each
+  level. The absolute error on the PoEs is below 1E-7 for truncation
+  levels above 1 and the classical calculators are faster.
+  Example: *fast_poes = true*.
+  Default: False
+
 floating_x_step:
   Float, used in rupture generation for kite faults. indicates the fraction
   of fault length used to float ruptures along strike by the given float
@@ -330,8 +350,11 @@ ground_motion_correlation_model:
   Default: None
 
 ground_motion_correlation_params:
-  To be used together with ground_motion_correlation_model.
-  Example: *ground_motion_correlation_params = {"vs30_clustering": False}*.
+  To be used together with ground_motion_correlation_model. For JB2009
+  you can set "submatrix": True to factorize only the correlation matrix
+  of the sites affected by each rupture, which is essential for large
+  site collections.
+  Example: *ground_motion_correlation_params = {"vs30_clustering": False, "submatrix": True}*.
   Default: empty dictionary
 
 ground_motion_fields:
@@ -611,6 +634,14 @@ postproc_args:
   Example: *postproc_args = {'imt': 'PGA'}*
   Default: {} (no arguments)
 
+precision:
+  Floating point precision of the PoEs computed by the classical
+  calculators and of the rates read in postclassical. With float32 the
+  memory occupation is halved; the difference on the hazard curves is
+  below 1E-5 in the QA tests.
+  Example: *precision = float32*.
+  Default: float64
+
 prefer_global_site_params:
   INTERNAL. Automatically set by the engine.
 
@@ -674,6 +705,14 @@ reqv_ignore_sources:
   Example: *reqv_ignore_sources = src1 src2 src3*
   Default: empty list
 
+reuse_rates_from:
+  ID of an earlier classical calculation. The rates of the source groups
+  which did not change (same sources, gsims, sites and levels) are copied
+  from that calculation and only the changed groups are recomputed.
+  Not supported together with disagg_by_src.
+  Example: *reuse_rates_from = 42*.
+  Default: None
+
 risk_imtls:
   INTERNAL. Automatically set by the engine.
 
@@ -1020,7 +1059,9 @@ class OqParam(valid.ParamSet):
     discard_trts = valid.Param(str, '')  # tested in the cariboo example
     discrete_damage_distribution = valid.Param(valid.boolean, False)
     distance_bin_width = valid.Param(valid.positivefloat)
+    dynamic_tasks = valid.Param(valid.boolean, False)
     mag_bin_width = valid.Param(valid.positivefloat, 1.)
+    fast_poes = valid.Param(valid.boolean, False)
     floating_x_step = valid.Param(valid.positivefloat, 0)
     floating_y_step = valid.Param(valid.positivefloat, 0)
     ignore_encoding_errors = valid.Param(valid.boolean, False)
@@ -1088,6 +1129,7 @@ class OqParam(valid.ParamSet):
     pointsource_distance = valid.Param(valid.floatdict, {'default': PSDIST})
     postproc_func = valid.Param(valid.mod_func, 'dummy.main')
     postproc_args = valid.Param(valid.dictionary, {})
+    precision = valid.Param(valid.Choice('float64', 'float32'), 'float64')
     prefer_global_site_params = valid.Param(valid.boolean, None)
     ps_grid_spacing = valid.Param(valid.positivefloat, 0)
     quantile_hazard_curves = quantiles = valid.Param(valid.probabilities, [])
@@ -1103,6 +1145,7 @@ class OqParam(valid.ParamSet):
     region = valid.Param(valid.wkt_polygon, None)
     region_grid_spacing = valid.Param(valid.positivefloat, None)
     reqv_ignore_sources = valid.Param(valid.namelist, [])
+    reuse_rates_from = valid.Param(valid.NoneOr(valid.positiveint), None)
     risk_imtls = valid.Param(valid.intensity_measure_types_and_levels, {})
     risk_investigation_time = valid.Param(valid.positivefloat, None)
     rlz_index = valid.Param(valid.positiveints, None)
@@ -1,6 +1,10 @@
+import os
+import tempfile
 import unittest
 import numpy
 from openquake.baselib import general
+from openquake.commonlib import datastore
+from openquake.commonlib.calc import share_gmfs, read_gmfs
 from openquake.hazardlib.sourceconverter import SourceConverter
 from openquake.hazardlib.map_array import compute_hazard_maps
 
@@ -64,3 +68,48 @@ class HazardMapsTestCase(unittest.TestCase):
         ]
         actual = compute_hazard_maps(numpy.array(curves), imls, poes)
         aaae(expected, actual.T)
+
+
+class ReadGmfsTestCase(unittest.TestCase):
+    gmf_dt = numpy.dtype([('sid', numpy.uint32), ('eid', numpy.uint32),
+                          ('gmv_0', numpy.float32)])
+    cols = ['sid', 'eid', 'gmv_0']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.gmfs = numpy.zeros(10, cls.gmf_dt)
+        cls.gmfs['sid'] = numpy.arange(10) % 3
+        cls.gmfs['eid'] = numpy.arange(10) // 3
+        cls.gmfs['gmv_0'] = numpy.arange(10) / 10.
+        path = os.path.join(tempfile.mkdtemp(), 'calc_1.hdf5')
+        cls.dstore = datastore.DataStore(path)
+        for col in cls.cols:
+            cls.dstore['gmf_data/' + col] = cls.gmfs[col]
+        cls.dstore.close()
+
+    def check(self, df, arr):
+        for col in self.cols:
+            numpy.testing.assert_equal(df[col].to_numpy(), arr[col])
+
+    def test_share_gmfs(self):
+        data = {col: self.gmfs[col] for col in self.cols}
+        shr = share_gmfs(data, self.gmf_dt, blocksize=3)  # 4 blocks
+        try:
+            with shr as arr:
+                numpy.testing.assert_equal(arr, self.gmfs)
+            shared = {'gmf_data': shr}
+            df = read_gmfs(self.dstore, 2, 8, self.cols, shared)
+            self.check(df, self.gmfs[2:8])
+            df = read_gmfs(self.dstore, 2, 8, self.cols, shared, sids=[1])
+            self.check(df, self.gmfs[[4, 7]])
+        finally:
+            shr.unlink()
+
+    def test_read_gmfs(self):
+        # reading from the datastore, without shared memory
+        df = read_gmfs(self.dstore, 2, 8, self.cols, {})
+        self.check(df, self.gmfs[2:8])
+        df = read_gmfs(self.dstore, 2, 8, self.cols, {}, sids=[1])
+        self.check(df, self.gmfs[[4, 7]])
+        df = read_gmfs(self.dstore, 0, 2, self.cols, {}, sids=[2])
+        self.assertEqual(len(df), 0)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (C) 2025 GEM Foundation
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest
+from unittest import mock
+from openquake.baselib import zeromq
+from openquake.commonlib import logs
+
+
+class LogBufferTestCase(unittest.TestCase):
+
+    def patch(self, local):
+        # patch the database access, returning the mock dbcmd
+        dbhost = mock.patch.object(
+            logs, 'get_dbhost', return_value=('127.0.0.1', local))
+        dbcmd = mock.patch.object(logs, 'dbcmd')
+        dbhost.start()
+        self.addCleanup(dbhost.stop)
+        self.addCleanup(dbcmd.stop)
+        return dbcmd.start()
+
+    def test_size_flush(self):
+        dbcmd = self.patch(local=True)
+        buf = logs.LogBuffer(size=3, dt=60)
+        buf.append(1, 'info', 'MainProcess', 'a')
+        buf.append(1, 'info', 'MainProcess', 'b')
+        self.assertEqual(dbcmd.call_count, 0)
+        buf.append(1, 'info', 'MainProcess', 'c')
+        self.assertEqual(dbcmd.call_count, 1)
+        action, records = dbcmd.call_args[0]
+        self.assertEqual(action, 'log_many')
+        self.assertEqual([rec[-1] for rec in records], ['a', 'b', 'c'])
+        self.assertEqual(buf.records, [])
+        self.assertIsNone(buf.timer)
+
+    def test_time_flush(self):
+        dbcmd = self.patch(local=True)
+        buf = logs.LogBuffer(size=100, dt=.05)
+        buf.append(1, 'info', 'MainProcess', 'a')
+        self.assertEqual(dbcmd.call_count, 0)
+        for _ in range(100):  # wait for the timer, at most 1 second
+            if dbcmd.call_count:
+                break
+            time.sleep(.01)
+        dbcmd.assert_called_once_with('log_many', mock.ANY)
+        self.assertEqual(buf.records, [])
+
+    def test_local_fallback(self):
+        # when the DbServer is not reachable the records are stored directly
+        dbcmd = self.patch(local=False)
+        sock = mock.Mock()
+        sock.send_pyobj.side_effect = zeromq.zmq.Again
+        with mock.patch.object(zeromq, 'connect', return_value=sock):
+            buf = logs.LogBuffer(size=1, dt=60)
+            buf.append(1, 'info', 'MainProcess', 'a')
+        dbcmd.assert_called_once_with('log_many', mock.ANY)
+        self.assertEqual(buf.pushed, 0)
+
+    def test_sync_flush_waits(self):
+        # a sync flush waits until the DbServer has stored the pushed batches
+        dbcmd = self.patch(local=False)
+        stored = iter([0, 1, 2])
+        dbcmd.side_effect = lambda action, *args: (
+            next(stored) if action == 'logs_stored' else None)
+        sock = mock.Mock()
+        with mock.patch.object(zeromq, 'connect', return_value=sock):
+            buf = logs.LogBuffer(size=1, dt=60)
+            buf.append(1, 'info', 'MainProcess', 'a')
+            buf.append(1, 'info', 'MainProcess', 'b')
+        self.assertEqual(buf.pushed, 2)
+        sender, batch_no, records = sock.send_pyobj.call_args[0][0]
+        self.assertEqual((sender, batch_no), (buf.sender, 2))
+        buf.flush(sync=True)
+        calls = [c[0][0] for c in dbcmd.call_args_list]
+        self.assertEqual(calls, ['logs_stored'] * 3)
@@ -31,6 +31,7 @@ import getpass
 import logging
 import platform
 import functools
+from contextlib import contextmanager
 from os.path import getsize
 from datetime import datetime, timezone
 import psutil
@@ -43,7 +44,8 @@ except ImportError:
         "Do nothing"
 from urllib.request import urlopen, Request
 from openquake.baselib.python3compat import decode
-from openquake.baselib import parallel, general, config, slurm, workerpool as w
+from openquake.baselib import (
+    parallel, general, config, slurm, zeromq, workerpool as w)
 from openquake.commonlib.oqvalidation import OqParam
 from openquake.commonlib import readinput, logs
 from openquake.calculators import base
@@ -58,11 +60,6 @@ MB = 1024 ** 2
 _PID = os.getpid()  # the PID
 _PPID = os.getppid()  # the controlling terminal PID
 
-GET_JOBS = '''--- executing or submitted
-SELECT * FROM job WHERE status IN ('executing', 'submitted')
-AND host=?x AND is_running=1 AND pid > 0 ORDER BY id'''
-
-
 def get_zmq_ports():
     """
     :returns: an array with the receiver ports
@@ -140,31 +137,90 @@ def register_signals(job_id):
         pass
 
 
-def poll_queue(job_id, poll_time):
+@contextmanager
+def subscribe():
     """
-    Check the queue of executing/submitted jobs and exit when there is
-    a free slot.
+    Subscribe to the notifications sent by the DbServer when a job finishes.
+
+    :yields: a zmq SUB socket, or None if there is no DbServer
     """
+    dbhost, local = logs.get_dbhost()
+    if local:
+        yield None
+        return
+    sock = zeromq.connect(logs.get_notify_address(dbhost), zeromq.zmq.SUB)
+    sock.setsockopt(zeromq.zmq.SUBSCRIBE, b'')
     try:
-        host = socket.gethostname()
-    except Exception:  # gaierror
-        host = None
-    offset = config.distribution.serialize_jobs - 1
-    if offset >= 0:
+        yield sock
+    finally:
+        sock.close(linger=0)
+
+
+def wait_notification(sock, seconds):
+    """
+    Wait until the DbServer notifies that a job has finished or until the
+    given number of seconds has passed, whatever comes first
+    """
+    if sock is None:
+        time.sleep(seconds)
+    elif sock.poll(seconds * 1000):
+        while sock.poll(0):  # consume all pending notifications
+            sock.recv()
+
+
+def get_avail_mb():
+    """
+    :returns: the memory available for a new job in MB, keeping 20% of
+              the total memory as a reserve (it can be negative)
+    """
+    mem = psutil.virtual_memory()
+    return int((mem.available - .2 * mem.total) / MB)
+
+
+def get_required_mb(jobctx):
+    """
+    :returns: the memory required by the job in MB, as estimated in the
+              preclassical phase of the parent calculation (0 if unknown)
+
+    NB: req_gb is the memory needed to store the rates of a classical
+    calculation, so it is used only for classical jobs starting from a
+    preclassical parent; it is only a rough proxy of the real footprint,
+    and for the other jobs (i.e. risk) the requirement is unknown.
+    """
+    hc_id = jobctx.params.get('hazard_calculation_id')
+    if not hc_id or jobctx.params.get('calculation_mode') != 'classical':
+        return 0
+    parent = logs.dbcmd('get_job', int(hc_id))
+    if parent is None:  # the parent job does not exist
+        return 0
+    path = parent.ds_calc_dir + '.hdf5'
+    try:
+        with h5py.File(path, 'r') as f:
+            return int(f['source_groups'].attrs['req_gb'] * 1024)
+    except (OSError, KeyError):  # missing file or not a classical
+        return 0
+
+
+def poll_queue(job_id, poll_time, priority=0, required_mb=0):
+    """
+    Wait in the job queue of the DbServer until the job is admitted, i.e.
+    there is a free slot and enough memory. The check is repeated as soon
+    as another job finishes, or after `poll_time` seconds.
+    """
+    max_jobs = config.distribution.serialize_jobs
+    if max_jobs == 0:  # no queue
+        return
+    logs.dbcmd('update_job', job_id,
+               {'status': 'submitted', 'pid': _PID, 'priority': priority,
+                'required_mb': required_mb})
+    with subscribe() as sock:
         first_time = True
-        while True:
-            running = logs.dbcmd(GET_JOBS, host)
-            previous = [job.id for job in running if job.id < job_id - offset]
-            if previous:
-                if first_time:
-                    logs.dbcmd('update_job', job_id,
-                               {'status': 'submitted', 'pid': _PID})
-                    first_time = False
-                    # the logging is not yet initialized, so use a print
-                    print('Waiting for jobs %s' % ' '.join(map(str, previous)))
-                time.sleep(poll_time)
-            else:
-                break
+        while not logs.dbcmd('admit_job', job_id, max_jobs, get_avail_mb()):
+            if first_time:
+                first_time = False
+                # the logging is not yet initialized, so use a print
+                print('Job %d is waiting in the queue' % job_id)
+            wait_notification(sock, poll_time)
 
 
 def run_calc(log):
@@ -178,13 +234,14 @@ def run_calc(log):
     setproctitle('oq-job-%d' % log.calc_id)
     with log:
         # check the available memory before starting
-        while True:
-            used_mem = psutil.virtual_memory().percent
-            if used_mem < 80:  # continue if little memory is in use
-                break
-            logging.info('Memory occupation %d%%, the user should free '
-                         'some memory', used_mem)
-            time.sleep(5)
+        with subscribe() as sock:
+            while True:
+                used_mem = psutil.virtual_memory().percent
+                if used_mem < 80:  # continue if little memory is in use
+                    break
+                logging.info('Memory occupation %d%%, the user should free '
+                             'some memory', used_mem)
+                wait_notification(sock, 5)
         oqparam = log.get_oqparam()
         calc = base.calculators(oqparam, log.calc_id)
         try:
@@ -295,7 +352,8 @@ def watchdog(calc_id, pid, timeout):
             break
 
 
-def run_jobs(jobctxs, concurrent_jobs=None, nodes=1, sbatch=False, precalc=False):
+def run_jobs(jobctxs, concurrent_jobs=None, nodes=1, sbatch=False,
+             precalc=False, priority=0):
     """
     Run jobs using the specified config file and other options.
 
@@ -303,6 +361,8 @@ def run_jobs(jobctxs, concurrent_jobs=None, nodes=1, sbatch=False, precalc=False
         List of LogContexts
     :param concurrent_jobs:
         How many jobs to run concurrently (default num_cores/4)
+    :param priority:
+        Jobs with higher priority are taken first from the job queue
     """
     dist = parallel.oq_distribute()
     if dist == 'slurm':
@@ -343,7 +403,8 @@ def run_jobs(jobctxs, concurrent_jobs=None, nodes=1, sbatch=False, precalc=False
         pass  # do not wait in the job queue
     else:
         try:
-            poll_queue(job_id, poll_time=15)
+            required_mb = max(get_required_mb(ctx) for ctx in jobctxs)
+            poll_queue(job_id, 15, priority, required_mb)
             # wait for an empty slot or a CTRL-C
         except BaseException:
             # the job aborted even before starting
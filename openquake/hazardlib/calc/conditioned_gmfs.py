@@ -111,6 +111,7 @@ from dataclasses import dataclass
 
 import psutil
 import numpy
+from scipy import linalg
 from openquake.baselib import parallel
 from openquake.hazardlib import correlation, cross_correlation
 from openquake.hazardlib.imt import from_string
@@ -120,6 +121,8 @@ from openquake.hazardlib.geo.geodetic import geodetic_distance
 
 U32 = numpy.uint32
 F32 = numpy.float32
+# below this reciprocal condition number inv_psd uses pinv
+RCOND_MIN = 1E-6
 
 class NoInterIntraStdDevs(Exception):
     def __init__(self, gsim):
@@ -236,7 +239,7 @@ class TempResult:
     native_data_available: bool
     corr_HD_HD: numpy.ndarray = 0
     cov_WD_WD_inv: numpy.ndarray = 0
-    phi_D_diag: numpy.ndarray = 0
+    phi_D: numpy.ndarray = 0
     T_D: numpy.ndarray = 0
     zeta_D: numpy.ndarray = 0
 
@@ -291,10 +294,15 @@ def _create_result(g, m, target_imt, observed_imts, station_data_filtered):
 def create_result(g, m, target_imt, target_imts, observed_imts,
                   station_data, sitecol, station_sitecol,
                   spatial_correl, cross_correl_within,
-                  cross_correl_between, DD):
+                  cross_correl_between, DD, cache=None):
     """
+    :param cache:
+        a dictionary storing the correlation matrices of the stations and
+        their inverses, to be reused across GSIMs, or None
     :returns: a TempResult
     """
+    if cache is None:
+        cache = {}
     t = _create_result(g, m, target_imt, observed_imts, station_data)
 
     # Observations (recorded values at the stations)
@@ -336,19 +344,30 @@ def create_result(g, m, target_imt, target_imts, observed_imts,
 
     # The raw residuals
     t.zeta_D = yD - mu_yD
-    t.phi_D_diag = numpy.diag(phi_D.flatten())
+    t.phi_D = phi_D.flatten()
 
-    cov_WD_WD = compute_spatial_cross_covariance_matrix(
-        spatial_correl, cross_correl_within, DD,
-        t.conditioning_imts, t.conditioning_imts, t.phi_D_diag, t.phi_D_diag)
-
-    # Add on the additional variance of the residuals
-    # for the cases where the station data is uncertain
-    numpy.fill_diagonal(cov_WD_WD, numpy.diag(cov_WD_WD) + var_addon_D)
+    # The station data correlation matrix does not depend on the GSIM
+    key = tuple(imt.string for imt in t.conditioning_imts)
+    if key not in cache:
+        cache[key] = compute_spatial_cross_covariance_matrix(
+            spatial_correl, cross_correl_within, DD,
+            t.conditioning_imts, t.conditioning_imts)
 
     # Get the (pseudo)-inverse of the station data within-event covariance
     # matrix
-    t.cov_WD_WD_inv = numpy.linalg.pinv(cov_WD_WD)
+    if key + ('inv',) not in cache:
+        cache[key + ('inv',)] = cholesky_inv(cache[key])
+    rho_inv = cache[key + ('inv',)]
+    if (var_addon_D == 0).all() and rho_inv is not None:
+        # cov_WD_WD = phi_D * rho_D * phi_D and the inverse of rho_D
+        # can be reused across GSIMs
+        t.cov_WD_WD_inv = rho_inv / numpy.outer(t.phi_D, t.phi_D)
+    else:
+        cov_WD_WD = cache[key] * numpy.outer(t.phi_D, t.phi_D)
+        # Add on the additional variance of the residuals
+        # for the cases where the station data is uncertain
+        numpy.fill_diagonal(cov_WD_WD, numpy.diag(cov_WD_WD) + var_addon_D)
+        t.cov_WD_WD_inv = inv_psd(cov_WD_WD)
 
     # # The normalized between-event residual and its variance (for the
     # # observation points)
@@ -388,9 +407,40 @@ def compute_distance_matrix(sites1, sites2):
     return distance_matrix.astype(F32)
 
 
+def cholesky_inv(matrix):
+    """
+    :param matrix: a symmetric positive semi-definite matrix
+    :returns: its inverse computed via Cholesky or None
+
+    None is returned if the matrix is not positive definite or its
+    reciprocal condition number (estimated by LAPACK from the Cholesky
+    factor) is below RCOND_MIN, since then the inverse would not agree
+    with the pseudo-inverse.
+    """
+    matrix = numpy.asarray(matrix, float)
+    try:
+        c, lower = linalg.cho_factor(matrix, lower=True)
+    except numpy.linalg.LinAlgError:  # not positive definite
+        return
+    anorm = numpy.abs(matrix).sum(axis=0).max()  # 1-norm
+    rcond, info = linalg.lapack.dpocon(c, anorm, uplo='L')
+    if info or rcond < RCOND_MIN:  # ill conditioned
+        return
+    return linalg.cho_solve((c, lower), numpy.eye(len(matrix)))
+
+
+def inv_psd(matrix):
+    """
+    :param matrix: a symmetric positive semi-definite matrix
+    :returns: its inverse via Cholesky or its pseudo-inverse via pinv
+    """
+    inv = cholesky_inv(matrix)
+    return numpy.linalg.pinv(matrix) if inv is None else inv
+
+
 def compute_spatial_cross_covariance_matrix(
         spatial_correl, cross_correl_within, distance_matrix,
-        imts1, imts2, diag1, diag2):
+        imts1, imts2, std1=None, std2=None):
     # The correlation structure for IMs of differing types at differing
     # locations can be reasonably assumed as Markovian in nature, and we
     # assume here that the correlation between differing IMs at differing
@@ -398,11 +448,16 @@ def compute_spatial_cross_covariance_matrix(
     # at the same location and the spatial correlation due to the distance
     # between sites m and n. Can be refactored down the line to support direct
     # spatial cross-correlation models
+    # If the standard deviations std1, std2 are not given, returns the
+    # correlation matrix
     rho = numpy.block([[
         _compute_spatial_cross_correlation_matrix(
             imt_1, imt_2, spatial_correl, cross_correl_within, distance_matrix)
         for imt_2 in imts2] for imt_1 in imts1])
-    return numpy.linalg.multi_dot([diag1, rho, diag2])
+    if std1 is None:
+        return rho
+    # same as diag(std1) @ rho @ diag(std2), without the dense diagonals
+    return std1[:, None] * rho * std2
 
 
 # In scenario/case_21 one has
@@ -447,7 +502,7 @@ def get_mu_tau_phi(target_imt, gsim, mean_stds,
 
     # Predicted uncertainty components at the target sites, from GSIM
     tau_Y = mean_stds[2, 0][:, None]
-    phi_Y_diag = numpy.diag(mean_stds[3, 0])
+    phi_Y = mean_stds[3, 0]
 
     # Compute the within-event covariance matrices for the
     # target sites and observation sites; the shapes are 
@@ -455,12 +510,12 @@ def get_mu_tau_phi(target_imt, gsim, mean_stds,
     with monitor.shared['YD'] as YD:
         cov_WY_WD = compute_spatial_cross_covariance_matrix(
             spatial_correl, cross_correl_within, YD,
-            [target_imt], r.conditioning_imts, phi_Y_diag, r.phi_D_diag)
+            [target_imt], r.conditioning_imts, phi_Y, r.phi_D)
 
     with monitor.shared['DY'] as DY:
         cov_WD_WY = compute_spatial_cross_covariance_matrix(
             spatial_correl, cross_correl_within, DY,
-            r.conditioning_imts, [target_imt], r.phi_D_diag, phi_Y_diag)
+            r.conditioning_imts, [target_imt], r.phi_D, phi_Y)
 
     # Compute the regression coefficient matrix [cov_WY_WD × cov_WD_WD_inv]
     RC = cov_WY_WD @ r.cov_WD_WD_inv  # shape (nsites, nstations)
@@ -480,7 +535,7 @@ def get_mu_tau_phi(target_imt, gsim, mean_stds,
     with monitor.shared['YY'] as YY:
         cov_WY_WY = compute_spatial_cross_covariance_matrix(
             spatial_correl, cross_correl_within, YY,
-            [target_imt], [target_imt], phi_Y_diag, phi_Y_diag)
+            [target_imt], [target_imt], phi_Y, phi_Y)
 
     # Both conditioned covariance matrices can contain extremely
     # small negative values due to limitations of floating point
@@ -519,6 +574,7 @@ def get_me_ta_ph(cmaker, sdata, observed_imts, target_imts,
                YD=compute_distance_matrix(target, station_filtered),
                DY=compute_distance_matrix(station_filtered, target))
     DD = compute_distance_matrix(station_filtered, station_filtered)
+    cache = {}  # correlation matrices of the stations, same for all GSIMs
 
     for g, gsim in enumerate(cmaker.gsims):
         if gsim.DEFINED_FOR_STANDARD_DEVIATION_TYPES == {StdDev.TOTAL}:
@@ -540,7 +596,7 @@ def get_me_ta_ph(cmaker, sdata, observed_imts, target_imts,
                 g, m, target_imt, target_imts, observed_imts,
                 sdata, target, station_filtered,
                 spatial_correl, cross_correl_within, cross_correl_between,
-                DD)
+                DD, cache)
             smap.submit(
                 (target_imt, gsim, mean_stds_Y[:, g], target_imts,
                  observed_imts, sdata, target, station_filtered,
@@ -22,7 +22,7 @@ import logging
 import operator
 from contextlib import contextmanager
 import numpy
-from scipy.spatial import KDTree, distance
+from scipy.spatial import distance
 from scipy.interpolate import interp1d
 
 from openquake.baselib.python3compat import raise_
@@ -30,11 +30,13 @@ from openquake.hazardlib import site
 from openquake.hazardlib.geo.utils import (
     KM_TO_DEGREES, angular_distance, get_bounding_box,
     get_longitudinal_extent, BBoxError, spherical_to_cartesian)
+from openquake.hazardlib.geo.geodetic import geodetic_distance
 
 U32 = numpy.uint32
 MINMAG = 2.5
 MAXMAG = 10.2  # to avoid breaking PAC
 MAX_DISTANCE = 2000  # km, ultra big distance used if there is no filter
+KDT_MIN_SITES = 100_000  # use the KDTree of the sites also for the sources
 trt_smr = operator.attrgetter('trt_smr')
 
 class FilteredAway(Exception):
@@ -333,15 +335,12 @@ def close_ruptures(ruptures, sites, dist=800.):
     :returns: array of ruptures close to the sites
     """    
     hypos = ruptures['hypo']
-    kr = KDTree(spherical_to_cartesian(hypos[:, 0], hypos[:, 1], hypos[:, 2]))
-    ks = KDTree(spherical_to_cartesian(sites.lons, sites.lats, sites.depths))
-    all_sids = kr.query_ball_tree(ks, dist, eps=.1)
-    out = []
-    for r, sids in enumerate(all_sids):
-        if sids:
-            ruptures[r]['nsites'] = len(sids)
-            out.append(ruptures[r])
-    return numpy.array(out)
+    nsites = sites.count_within_distance(
+        hypos[:, 0], hypos[:, 1], hypos[:, 2], dist, eps=.1)
+    ok = nsites > 0
+    out = ruptures[ok]
+    out['nsites'] = nsites[ok]
+    return out
 
 
 default = IntegrationDistance({'default': [(MINMAG, 1000), (MAXMAG, 1000)]})
@@ -434,17 +433,10 @@ class SourceFilter(object):
                 raise ValueError(
                     'The SourceFilter was instantiated with '
                     'maximum_distance and not maximum_distance(trt)')
-            dlon = get_longitudinal_extent(
-                src_or_rec['minlon'], src_or_rec['maxlon']) / 2.
-            dlat = (src_or_rec['maxlat'] - src_or_rec['minlat']) / 2.
             lon, lat, dep = src_or_rec['hypo']
-            dist = self.integration_distance(src_or_rec['mag']) + numpy.sqrt(
-                dlon**2 + dlat**2) / KM_TO_DEGREES
-            dist += 10  # added 10 km of buffer to guard against numeric errors
-            # the test most sensitive to the buffer effect is in oq-risk-tests,
-            # case_ucerf/job_eb.ini; without buffer, sites can be discarded
-            # even if within the maximum_distance
-            return self._close_sids(lon, lat, dep, dist)
+            [sids] = self.sitecol.within_distance(
+                lon, lat, dep, self._rup_dist(src_or_rec))
+            return sids
         else:  # source
             trt = src_or_rec.tectonic_region_type
             try:
@@ -453,15 +445,54 @@ class SourceFilter(object):
                 return U32([])
             except BBoxError:  # do not filter
                 return self.sitecol.sids
+            if len(self.sitecol) >= KDT_MIN_SITES:
+                return self._within_bbox(bbox)
             return self.sitecol.within_bbox(bbox)
 
-    def _close_sids(self, lon, lat, dep, dist):
-        if not hasattr(self, 'kdt'):
-            self.kdt = KDTree(self.sitecol.xyz)
-        xyz = spherical_to_cartesian(lon, lat, dep)
-        sids = U32(self.kdt.query_ball_point(xyz, dist, eps=.001))
-        sids.sort()  # for cross-platform consistency
-        return sids
+    # batched version of close_sids for rupture records
+    def num_close_sites(self, recs):
+        """
+        :param recs: an array of rupture records
+        :returns: the number of sites close to each rupture
+        """
+        assert self.sitecol is not None
+        if not self.integration_distance:  # do not filter
+            return numpy.full(len(recs), len(self.sitecol))
+        if not hasattr(self.integration_distance, 'x'):
+            raise ValueError(
+                'The SourceFilter was instantiated with '
+                'maximum_distance and not maximum_distance(trt)')
+        hypos = recs['hypo']
+        return self.sitecol.count_within_distance(
+            hypos[:, 0], hypos[:, 1], hypos[:, 2], self._rup_dist(recs))
+
+    def _rup_dist(self, recs):
+        # maximum distance from the hypocenter of the ruptures
+        dlon = get_longitudinal_extent(recs['minlon'], recs['maxlon']) / 2.
+        dlat = (recs['maxlat'] - recs['minlat']) / 2.
+        dist = self.integration_distance(recs['mag']) + numpy.sqrt(
+            dlon**2 + dlat**2) / KM_TO_DEGREES
+        # added 10 km of buffer to guard against numeric errors; the test
+        # most sensitive to the buffer effect is in oq-risk-tests,
+        # case_ucerf/job_eb.ini; without buffer, sites can be discarded
+        # even if within the maximum_distance
+        return dist + 10
+
+    def _within_bbox(self, bbox):
+        # select with the KDTree the sites in the circle containing the
+        # bounding box, then discard the ones outside the bounding box
+        if not hasattr(self, 'maxdepth'):
+            self.maxdepth = numpy.abs(self.sitecol.depths).max()
+        min_lon, min_lat, max_lon, max_lat = bbox
+        lon = min_lon + ((max_lon - min_lon) % 360) / 2.
+        lat = (min_lat + max_lat) / 2.
+        # the farthest points of the bounding box are the corners
+        dist = geodetic_distance(
+            lon, lat, numpy.array([min_lon, min_lon, max_lon, max_lon]),
+            numpy.array([min_lat, max_lat, min_lat, max_lat])).max()
+        [idxs] = self.sitecol.within_distance(
+            lon, lat, 0., dist + self.maxdepth + 1.)
+        return self.sitecol.within_bbox(bbox, idxs)
 
     def filter(self, sources):
         """
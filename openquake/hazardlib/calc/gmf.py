@@ -24,7 +24,7 @@ import numpy
 import pandas
 
 from openquake.baselib.general import AccumDict
-from openquake.baselib.performance import Monitor, compile
+from openquake.baselib.performance import Monitor, compile, split_array
 from openquake.hazardlib.const import StdDev
 from openquake.hazardlib.source.rupture import EBRupture, get_eid_rlz
 from openquake.hazardlib.cross_correlation import NoCrossCorrelation
@@ -293,9 +293,9 @@ class GmfComputer(object):
                             data[key].append(outarr)
                 n += E
 
-    def strip_zeros(self, data):
+    def get_gmfdata(self, data):
         """
-        :returns: a DataFrame with the nonzero GMVs
+        :returns: a dictionary of arrays with the nonzero GMVs
         """
         # building an array of shape (3, NE)
         eid_sid_rlz = build_eid_sid_rlz(
@@ -307,23 +307,41 @@ class GmfComputer(object):
         ok = gmv.sum(axis=1).T.reshape(-1) > 0
         for m, gmv_field in enumerate(self.gmv_fields):
             data[gmv_field] = gmv[:, m].T.reshape(-1)
-
-        # build dataframe
-        df = pandas.DataFrame(data)
-        df['eid'] = eid_sid_rlz[0]
-        df['sid'] = eid_sid_rlz[1]
-        df['rlz'] = eid_sid_rlz[2]
+        data['eid'] = eid_sid_rlz[0]
+        data['sid'] = eid_sid_rlz[1]
+        data['rlz'] = eid_sid_rlz[2]
 
         # remove the rows with all zero values
-        return df[ok]
+        return {key: arr[ok] for key, arr in data.items()}
+
+    def strip_zeros(self, data):
+        """
+        :returns: a DataFrame with the nonzero GMVs
+        """
+        return pandas.DataFrame(self.get_gmfdata(data))
 
     def compute_all(self, mean_stds=None, max_iml=None,
                     mmon=Monitor(), cmon=Monitor(), umon=Monitor()):
         """
         :returns: DataFrame with fields eid, rlz, sid, gmv_X, ...
         """
-        conditioned = mean_stds is not None
         self.init_eid_rlz_sig_eps()
+        data = self.compute_data(mean_stds, max_iml, mmon, cmon, umon)
+        with umon:
+            return self.strip_zeros(data)
+
+    def compute_data(self, mean_stds=None, max_iml=None,
+                     mmon=Monitor(), cmon=Monitor(), umon=Monitor()):
+        """
+        Must be called after `init_eid_rlz_sig_eps`.
+
+        :param mean_stds:
+            None (compute them), a list [mea, tau, phi] for conditioned GMFs
+            or a dictionary g -> array (4, M, N) as in `compute_gmfs_batch`
+        :returns: a dictionary with the arrays of GMVs
+        """
+        conditioned = mean_stds is not None and not isinstance(
+            mean_stds, dict)
         rng = numpy.random.default_rng(self.seed)
         data = AccumDict(accum=[])
         for g, (gs, rlzs) in enumerate(self.cmaker.gsims.items()):
@@ -335,6 +353,8 @@ class GmfComputer(object):
             if mean_stds is None:
                 with mmon:
                     ms = self.cmaker.get_4MN([self.ctx], gs)
+            elif not conditioned:  # computed in compute_gmfs_batch
+                ms = mean_stds[g]
             else:  # conditioned
                 ms = (mean_stds[0][g], mean_stds[1][g], mean_stds[2][g])
             with cmon:
@@ -366,8 +386,7 @@ class GmfComputer(object):
             with umon:
                 result = result.transpose(1, 0, 2)  # shape (N, M, E)
                 self.update(data, result, rlzs, ms[0], max_iml)
-        with umon:
-            return self.strip_zeros(data)
+        return data
 
     def _compute(self, mean_stds, m, imt, gsim, intra_eps, idxs, rng=None):
         if len(mean_stds) == 3:  # conditioned GMFs
@@ -433,6 +452,50 @@ class GmfComputer(object):
         return gmf  # shapes (N, E)
 
 
+def compute_gmfs_batch(computers, max_iml=None,
+                       mmon=Monitor(), cmon=Monitor(), umon=Monitor()):
+    """
+    Compute the GMFs of several ruptures at once. The mean and stddevs are
+    computed once per GSIM on the concatenated contexts of the ruptures,
+    grouped by magnitude; the random numbers are still generated rupture
+    by rupture, so the GMFs are the same as with `GmfComputer.compute_all`.
+
+    :param computers: a list of GmfComputers sharing the same ContextMaker
+    :returns: a dictionary with arrays eid, rlz, sid, gmv_X, ...
+    """
+    cmaker = computers[0].cmaker
+    M = len(cmaker.imtls)
+    for computer in computers:
+        computer.init_eid_rlz_sig_eps()
+    mean_stds = [{} for _ in computers]
+    for g, (gs, rlzs) in enumerate(cmaker.gsims.items()):
+        idxs = [i for i, computer in enumerate(computers)
+                if numpy.isin(computer.rlz, rlzs).any()]
+        if not idxs:
+            continue
+        with mmon:
+            ctx = numpy.concatenate([computers[i].ctx for i in idxs]).view(
+                numpy.recarray)
+            order = ctx.mag.argsort(kind='stable')
+            ctxs = split_array(
+                ctx[order], U32(numpy.round(ctx.mag[order] * 100)))
+            ms = numpy.empty((4, M, len(ctx)))
+            ms[:, :, order] = cmaker.get_4MN(ctxs, gs)
+        start = 0
+        for i in idxs:
+            stop = start + computers[i].N
+            mean_stds[i][g] = ms[:, :, start:stop]
+            start = stop
+    gmfdata = []
+    for computer, ms in zip(computers, mean_stds):
+        data = computer.compute_data(ms, max_iml, mmon, cmon, umon)
+        with umon:
+            gmfdata.append(computer.get_gmfdata(data))
+    with umon:
+        return {key: numpy.concatenate([dic[key] for dic in gmfdata])
+                for key in gmfdata[0]}
+
+
 # this is not used in the engine; it is still useful for usage in IPython
 # when demonstrating hazardlib capabilities
 def ground_motion_fields(rupture, sites, imts, gsim, truncation_level,
@@ -50,7 +50,9 @@ def to_probs(rates, itime=1):
     >>> numpy.round(to_probs(numpy.array([1.609438])), 6)
     array([0.8])
     """
-    return 1. - numpy.exp(- rates * itime)
+    # NB: expm1 is accurate also for small rates in 32 bit;
+    # subtracting from 0. avoids returning -0. for zero rates
+    return 0. - numpy.expm1(- rates * itime)
 
 
 def calc_rmap(src_groups, full_lt, sitecol, oq):
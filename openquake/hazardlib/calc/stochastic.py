@@ -93,13 +93,6 @@ def get_rup_array(ebruptures, srcfilter=nofilter, model='???', model_geom=None):
         if srcfilter.integration_distance(rup.mag) == 0:
             continue
 
-        # apply distance filtering
-        nsites = 0
-        if srcfilter.sitecol is not None:
-            nsites = len(srcfilter.close_sids(rec, rup.tectonic_region_type))
-            if nsites == 0:
-                continue
-
         # apply model filtering if any (used in `oq mosaic sample_rups`)
         if model_geom and not shapely.contains_xy(
                 model_geom, hypo[0], hypo[1]):
@@ -108,7 +101,7 @@ def get_rup_array(ebruptures, srcfilter=nofilter, model='???', model_geom=None):
         rate = getattr(rup, 'occurrence_rate', numpy.nan)
         tup = (ebrupture.id, ebrupture.seed, ebrupture.source_id,
                ebrupture.trt_smr, rup.code, ebrupture.n_occ, rup.mag, rup.rake,
-               rate, minlon, minlat, maxlon, maxlat, hypo, 0, nsites, 0, model)
+               rate, minlon, minlat, maxlon, maxlat, hypo, 0, 0, 0, model)
         rups.append(tup)
         # we are storing the geometries as arrays of 32 bit floating points;
         # the first element is the number of surfaces, then there are
@@ -124,11 +117,19 @@ def get_rup_array(ebruptures, srcfilter=nofilter, model='???', model_geom=None):
         geoms.append(geom)
     if not rups:
         return ()
-    dic = dict(geom=numpy.array(geoms, object))
     # NB: PMFs for nonparametric ruptures are not saved since they
     # are useless for the GMF computation
     arr = numpy.array(rups, rupture_dt)
-    return hdf5.ArrayWrapper(arr, dic)
+    geoms = numpy.array(geoms, object)
+
+    # apply distance filtering, with a single query for all ruptures
+    if srcfilter.sitecol is not None:
+        arr['nsites'] = srcfilter.num_close_sites(arr)
+        ok = arr['nsites'] > 0
+        if not ok.any():
+            return ()
+        arr, geoms = arr[ok], geoms[ok]
+    return hdf5.ArrayWrapper(arr, dict(geom=geoms))
 
 
 def sample_cluster(group, num_ses, ses_seed):
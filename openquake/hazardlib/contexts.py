@@ -20,6 +20,8 @@ import os
 import abc
 import copy
 import time
+import zlib
+import pickle
 import logging
 import warnings
 import itertools
@@ -32,13 +34,14 @@ from scipy.interpolate import interp1d
 from openquake.baselib import config
 from openquake.baselib.general import (
     AccumDict, DictArray, RecordBuilder, split_in_slices, block_splitter,
-    sqrscale)
+    gen_slices, sqrscale)
 from openquake.baselib.performance import Monitor, split_array, kround0, compile
 from openquake.baselib.python3compat import decode
 from openquake.hazardlib import valid, imt as imt_module
 from openquake.hazardlib.const import StdDev, OK_COMPONENTS
 from openquake.hazardlib.tom import NegativeBinomialTOM, PoissonTOM
-from openquake.hazardlib.stats import ndtr, truncnorm_sf
+from openquake.hazardlib.stats import (
+    ndtr, truncnorm_sf, truncnorm_sf_table, truncnorm_sf_interp)
 from openquake.hazardlib.site import SiteCollection, site_param_dt
 from openquake.hazardlib.calc.filters import (
     SourceFilter, IntegrationDistance, magdepdist,
@@ -47,7 +50,7 @@ from openquake.hazardlib.map_array import MapArray
 from openquake.hazardlib.geo import multiline
 from openquake.hazardlib.geo.mesh import Mesh
 from openquake.hazardlib.geo.surface.planar import (
-    project, project_back, get_distances_planar)
+    project_back, get_distances_planar, get_dists_planar, DIST_CODES)
 
 U8 = numpy.uint8
 I32 = numpy.int32
@@ -388,14 +391,19 @@ def _get_ctx_planar(cmaker, builder, mag, magi, planar, sites,
         rup_ids = zeroctx['rup_id'].T  # numpy trick, shape (U, N)
         rup_ids[:] = numpy.arange(offset, offset+len(planar))
 
-    # computing distances
-    rrup, xx, yy = project(planar, sites.xyz)  # (3, U, N)
+    # computing all the distances in a single pass
+    pars = sorted(cmaker.REQUIRES_DISTANCES & set(DIST_CODES))
+    codes = numpy.uint8([DIST_CODES[par] for par in pars])
+    dists = get_dists_planar(planar, sites.xyz, codes)  # (3+D, U, N)
+    rrup, xx, yy = dists[:3]
     # get the closest points on the surface
     if cmaker.fewsites or 'clon' in cmaker.REQUIRES_DISTANCES:
         closest = project_back(planar, xx, yy)  # (3, U, N)
     # set distances
     zeroctx['rrup'] = rrup
-    for par in cmaker.REQUIRES_DISTANCES - {'rrup'}:
+    for d, par in enumerate(pars):
+        zeroctx[par] = dists[3 + d]
+    for par in cmaker.REQUIRES_DISTANCES - set(pars) - {'rrup'}:
         zeroctx[par] = get_distances_planar(planar, sites, par)
     for par in cmaker.REQUIRES_DISTANCES:
         dst = zeroctx[par]
@@ -502,6 +510,113 @@ def _build_dparam(src, sitecol, cmaker):
     return out
 
 
+# attributes of the sources not entering in the geometry key of the CtxCache
+NONGEOM = {'source_id', 'id', 'name', 'trt_smr', 'grp_id', 'smweight',
+           'samples', 'branch', 'checksum', 'offset', 'mfd', 'probs_occur',
+           'num_ruptures', 'weight', 'nsites', 'esites'}
+
+
+def _crc(obj):
+    # checksum of a pickleable object
+    return zlib.crc32(pickle.dumps(obj, protocol=4))
+
+
+class CtxCache(object):
+    """
+    An in-memory cache of context arrays with LRU eviction when the stored
+    size exceeds `maxbytes`. The keys are built from the geometry of the
+    source, the sites and the parameters of the ContextMaker, so that
+    sources differing only by the MFD (i.e. the occurrence rates) share
+    the same distances.
+
+    :param maxbytes: maximum size of the stored context arrays
+    """
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.data = {}  # key -> (ctx, idxs, mags, offset), in LRU order
+        self.hits = 0
+
+    @classmethod
+    def instance(cls, calc_id, maxbytes):
+        """
+        :returns: the CtxCache of the given calculation in the current
+                  process; the cache of the previous calculation, if any,
+                  is discarded
+        """
+        cache = _ctx_cache.get(calc_id)
+        if cache is None or cache.maxbytes != maxbytes:
+            _ctx_cache.clear()
+            cache = _ctx_cache[calc_id] = cls(maxbytes)
+        return cache
+
+    def get_key(self, cmaker, src, sitecol):
+        """
+        :returns: a content-addressed key for the contexts of the source
+        """
+        geom = {k: v for k, v in vars(src).items() if k not in NONGEOM}
+        params = (cmaker.trt, sorted(cmaker.defaultdict),
+                  cmaker.maximum_distance, cmaker.minimum_distance,
+                  cmaker.reqv, cmaker.fewsites, cmaker.shift_hypo)
+        return '%s-%d-%d-%d-%d' % (
+            src.__class__.__name__, _crc(geom),
+            zlib.crc32(sitecol.array.tobytes()), len(sitecol), _crc(params))
+
+    def get(self, key, src, allrups):
+        """
+        :returns: a copy of the cached context array updated with the rates
+                  (or the probabilities of occurrence) of the ruptures or
+                  None if the key is missing or stale
+        """
+        if key not in self.data:
+            return None
+        cached, idxs, mags, offset = self.data[key]
+        rup_idxs = U32([rup.rup_id - src.offset for rup in allrups])
+        if not (numpy.array_equal(idxs, rup_idxs) and numpy.array_equal(
+                mags, F32([rup.mag for rup in allrups]))):
+            return None
+        ctx = cached.copy()
+        i = ctx.rup_id - offset
+        rates = numpy.zeros(rup_idxs.max() + 1)
+        rates[rup_idxs] = [getattr(rup, 'occurrence_rate', numpy.nan)
+                           for rup in allrups]
+        ctx['occurrence_rate'] = rates[i]
+        P = ctx.dtype['probs_occur'].shape[0]
+        if P:  # nonpoissonian ruptures
+            probs = numpy.zeros((len(rates), P))
+            for idx, rup in zip(rup_idxs, allrups):
+                if len(rup.probs_occur) != P:
+                    return None
+                probs[idx] = rup.probs_occur
+            ctx['probs_occur'] = probs[i]
+        self.data[key] = self.data.pop(key)  # most recently used
+        self.hits += 1
+        ctx['rup_id'] = src.offset + i
+        ctx['src_id'] = src.id
+        return ctx
+
+    def put(self, key, src, allrups, ctxs):
+        """
+        Store the context arrays of the source, evicting the least
+        recently used arrays if the cache is too big
+        """
+        ctx = numpy.concatenate(ctxs) if ctxs else ()
+        if len(ctx) == 0 or ctx.nbytes > self.maxbytes:
+            return
+        if key in self.data:  # stale
+            self.nbytes -= self.data.pop(key)[0].nbytes
+        while self.nbytes + ctx.nbytes > self.maxbytes:
+            oldest = next(iter(self.data))
+            self.nbytes -= self.data.pop(oldest)[0].nbytes
+        self.data[key] = (ctx.view(numpy.recarray),
+                          U32([rup.rup_id - src.offset for rup in allrups]),
+                          F32([rup.mag for rup in allrups]), src.offset)
+        self.nbytes += ctx.nbytes
+
+
+_ctx_cache = {}  # calc_id -> CtxCache of the current calculation
+
+
 # this is the critical function for the performance of the classical calculator
 # the performance is dominated by the CPU cache, i.e. large arrays are slow
 # the only way to speedup is to reduce the maximum_distance, then the array
@@ -516,6 +631,18 @@ def _set_poes(mean_std, loglevels, phi_b, out):
         for lvl, iml in enumerate(levels):
             out[mL1 + lvl] = truncnorm_sf(phi_b, (iml - mea) / std)
 
+
+# used instead of _set_poes when the fast_poes option is set
+@compile("(float64[:,:,:], float64[:,:], float64[:], float64, float32[:,:])")
+def _set_poes_fast(mean_std, loglevels, table, xmax, out):
+    L1 = loglevels.size // len(loglevels)
+    for m, levels in enumerate(loglevels):
+        mL1 = m * L1
+        mea, std = mean_std[:, m]  # shape N
+        for lvl, iml in enumerate(levels):
+            eps = (iml - mea) / std
+            out[mL1 + lvl] = truncnorm_sf_interp(table, xmax, eps)
+
 # ############################ ContextMaker ############################### #
 
 
@@ -627,6 +754,12 @@ class ContextMaker(object):
         self.ses_per_logic_tree_path = param.get('ses_per_logic_tree_path', 1)
         self.truncation_level = param.get('truncation_level', 99.)
         self.phi_b = ndtr(self.truncation_level)
+        self.poes_dt = F32 if param.get('precision') == 'float32' else F64
+        if param.get('fast_poes') and self.truncation_level > 1E-9:
+            # pair (table, xmax) used in _set_poes_fast
+            self.sf_table = truncnorm_sf_table(self.truncation_level)
+        else:
+            self.sf_table = None
         self.num_epsilon_bins = param.get('num_epsilon_bins', 1)
         self.disagg_bin_edges = param.get('disagg_bin_edges', {})
         self.ps_grid_spacing = param.get('ps_grid_spacing')
@@ -696,6 +829,7 @@ class ContextMaker(object):
         self.sec_mon = monitor('building dparam', measuremem=True)
         self.delta_mon = monitor('getting delta_rates', measuremem=False)
         self.task_no = getattr(monitor, 'task_no', 0)
+        self.calc_id = monitor.calc_id
         self.out_no = getattr(monitor, 'out_no', self.task_no)
         self.cfactor = numpy.zeros(2)
 
@@ -1055,11 +1189,6 @@ class ContextMaker(object):
         if getattr(src, 'location', None) and step == 1:
             return self.pla_mon.iter(genctxs_Pp(src, sitecol, self))
         elif hasattr(src, 'source_id'):  # other source
-            if src.code == b'F' and step == 1:
-                with self.sec_mon:
-                    self.dparam = _build_dparam(src, sitecol, self)
-            else:
-                self.dparam = None
             minmag = self.maximum_distance.x[0]
             maxmag = self.maximum_distance.x[-1]
             with self.ir_mon:
@@ -1073,6 +1202,14 @@ class ContextMaker(object):
                 self.num_rups = len(allrups) or 1
                 if not allrups:
                     return iter([])
+            if self.cache_distances and step == 1 and src.id >= 0:
+                return self._get_cached_ctxs(src, sitecol, allrups)
+            if src.code == b'F' and step == 1:
+                with self.sec_mon:
+                    self.dparam = _build_dparam(src, sitecol, self)
+            else:
+                self.dparam = None
+            with self.ir_mon:
                 # sorted by mag by construction
                 u32mags = U32([rup.mag * 100 for rup in allrups])
                 rups_sites = [(rups, sitecol) for rups in split_array(
@@ -1087,6 +1224,35 @@ class ContextMaker(object):
         # the weight of 10_000 ensure less than 1MB per block (recarray)
         return self.ctx_mon.iter(map(self.recarray, blocks))
 
+    def _get_cached_ctxs(self, src, sitecol, allrups):
+        # used when cache_distances is set; returns a list of recarrays
+        maxbytes = float(config.performance.ctx_cache_gb) * 1024**3
+        if self.calc_id is None:  # outside a calculation
+            if not hasattr(self, 'ctx_cache'):
+                self.ctx_cache = CtxCache(maxbytes)
+            cache = self.ctx_cache
+        else:
+            cache = CtxCache.instance(self.calc_id, maxbytes)
+        key = cache.get_key(self, src, sitecol)
+        with self.ctx_mon:
+            ctx = cache.get(key, src, allrups)
+        if ctx is not None:
+            return [ctx[slc] for slc in gen_slices(0, len(ctx), 10_000)]
+        if src.code == b'F':
+            with self.sec_mon:
+                self.dparam = _build_dparam(src, sitecol, self)
+        else:
+            self.dparam = None
+        u32mags = U32([rup.mag * 100 for rup in allrups])
+        rups_sites = [(rups, sitecol) for rups in split_array(
+            numpy.array(allrups), u32mags)]
+        ctxs = self.gen_contexts(rups_sites, src.id)
+        blocks = block_splitter(ctxs, 10_000, weight=len)
+        with self.ctx_mon:
+            ctxs = list(map(self.recarray, blocks))
+            cache.put(key, src, allrups, ctxs)
+        return ctxs
+
     def max_intensity(self, sitecol1, mags, dists):
         """
         :param sitecol1: a SiteCollection instance with a single site
@@ -1183,9 +1349,11 @@ class ContextMaker(object):
             ctxt = ctx[ctx.mag == mag]
             self.cfactor += [len(ctxt), 1]
             for poes, mea, sig, slc in self._gen_poes(ctxt):
-                # NB: using directly 64 bit poes would be slower without reason
-                # since with astype(F64) the numbers are identical
-                yield poes.astype(F64), mea, sig, ctxt[slc]
+                # NB: the poes are computed in 32 bit, so converting them
+                # to 64 bit does not change the numbers; with
+                # precision=float32 the conversion is skipped to save memory
+                poes = poes.astype(self.poes_dt, copy=False)
+                yield poes, mea, sig, ctxt[slc]
 
     # documented but not used in the engine
     def get_pmap(self, ctxs, tom=None, rup_mutex={}):
@@ -1249,32 +1417,49 @@ class ContextMaker(object):
                 recarrays, dtype=recarrays[0].dtype).view(numpy.recarray)
             recarrays = split_array(recarr, U32(numpy.round(recarr.mag*100)))
         out = numpy.empty((4, G, M, N))
-        for g, gsim in enumerate(self.gsims):
-            out[:, g] = self.get_4MN(recarrays, gsim)
+        # group the gsims by class, to compute them in batches
+        gsims = list(self.gsims)
+        gidxs = collections.defaultdict(list)
+        for g, gsim in enumerate(gsims):
+            gidxs[gsim.__class__].append(g)
+        for idxs in gidxs.values():
+            out[:, idxs] = self.get_4GMN(recarrays, [gsims[g] for g in idxs])
         return out
 
     def get_4MN(self, ctxs, gsim):
         """
         Called by the GmfComputer
         """
+        return self.get_4GMN(ctxs, [gsim])[:, 0]
+
+    def get_4GMN(self, ctxs, gsims):
+        """
+        :param ctxs: a list of contexts with N=sum(len(ctx) for ctx in ctxs)
+        :param gsims: a list of G gsims of the same class
+        :returns: an array of shape (4, G, M, N) with mean and stddevs
+        """
         N = sum(len(ctx) for ctx in ctxs)
         M = len(self.imts)
-        out = numpy.zeros((4, M, N))
-        gsim.adj = []  # NSHM2014P adjustments
-        compute = gsim.__class__.compute
+        out = numpy.zeros((4, len(gsims), M, N))
+        for gsim in gsims:
+            gsim.adj = []  # NSHM2014P adjustments
+        compute_batch = gsims[0].__class__.compute_batch
         start = 0
         for ctx in ctxs:
             slc = slice(start, start + len(ctx))
-            adj = compute(gsim, ctx, self.imts, *out[:, :, slc])
-            if adj is not None:
-                gsim.adj.append(adj)
+            adjs = compute_batch(gsims, ctx, self.imts, out[:, :, :, slc])
+            for gsim, adj in zip(gsims, adjs):
+                if adj is not None:
+                    gsim.adj.append(adj)
             start = slc.stop
-        if self.truncation_level not in (0, 1E-9, 99.) and (out[1] == 0.).any():
-            raise ValueError('Total StdDev is zero for %s' % gsim)
-        if gsim.adj:
-            gsim.adj = numpy.concatenate(gsim.adj)
-        if self.conv:  # apply horizontal component conversion
-            self.horiz_comp_to_geom_mean(out, gsim)
+        for g, gsim in enumerate(gsims):
+            if self.truncation_level not in (0, 1E-9, 99.) and (
+                    out[1, g] == 0.).any():
+                raise ValueError('Total StdDev is zero for %s' % gsim)
+            if gsim.adj:
+                gsim.adj = numpy.concatenate(gsim.adj)
+            if self.conv:  # apply horizontal component conversion
+                self.horiz_comp_to_geom_mean(out[:, g], gsim)
         return out
 
     # not used right now
@@ -1380,11 +1565,19 @@ def print_finite_size(rups):
     print('total finite size ruptures = ', sum(c.values()))
 
 
-def _get_poes(mean_std, loglevels, phi_b):
+def _fill_poes(mean_std, loglevels, phi_b, sf_table, out):
+    # fill a matrix of shape (L, N), possibly using the interpolation table
+    if sf_table is None:
+        _set_poes(mean_std, loglevels, phi_b, out)
+    else:
+        _set_poes_fast(mean_std, loglevels, sf_table[0], sf_table[1], out)
+
+
+def _get_poes(mean_std, loglevels, phi_b, sf_table=None):
     # returns a matrix of shape (N, L)
     N = mean_std.shape[2]  # shape (2, M, N)
     out = numpy.empty((loglevels.size, N), F32)  # shape (L, N)
-    _set_poes(mean_std, loglevels, phi_b, out)
+    _fill_poes(mean_std, loglevels, phi_b, sf_table, out)
     return out.T
 
 
@@ -1414,6 +1607,7 @@ def set_poes(gsim, mean_std, cmaker, ctx, out, slc):
     """
     loglevels = cmaker.loglevels.array
     phi_b = cmaker.phi_b
+    sf_table = getattr(cmaker, 'sf_table', None)
     _M, L1 = loglevels.shape
     if hasattr(gsim, 'weights_signs'):  # for nshmp_2014, case_72
         adj = gsim.adj[slc]
@@ -1423,14 +1617,14 @@ def set_poes(gsim, mean_std, cmaker, ctx, out, slc):
             ms = numpy.array(mean_std)  # make a copy
             for m in range(len(loglevels)):
                 ms[0, m] += s * adj
-            outs.append(_get_poes(ms, loglevels, phi_b))
+            outs.append(_get_poes(ms, loglevels, phi_b, sf_table))
         out[:] = numpy.average(outs, weights=weights, axis=0)
     elif hasattr(gsim, 'mixture_model'):
         for f, w in zip(gsim.mixture_model["factors"],
                         gsim.mixture_model["weights"]):
             mean_stdi = mean_std.copy()
             mean_stdi[1] *= f  # multiply stddev by factor
-            out[:] += w * _get_poes(mean_stdi, loglevels, phi_b)
+            out[:] += w * _get_poes(mean_stdi, loglevels, phi_b, sf_table)
     elif hasattr(gsim, 'weights'):  # avg_poe_gmpe
         cm = copy.copy(cmaker)
         cm.poe_mon = Monitor()  # avoid double counts
@@ -1441,7 +1635,7 @@ def set_poes(gsim, mean_std, cmaker, ctx, out, slc):
             avgs.append(poes @ gsim.weights)
         out[:] = numpy.concatenate(avgs)
     else:  # regular case
-        _set_poes(mean_std, loglevels, phi_b, out.T)
+        _fill_poes(mean_std, loglevels, phi_b, sf_table, out.T)
     imtweight = getattr(gsim, 'weight', None)  # ImtWeight or None
     for m, imt in enumerate(cmaker.imtls):
         mL1 = m * L1
@@ -20,6 +20,9 @@ spatially-distributed ground-shaking intensities.
 import abc
 import numpy
 
+# max number of correlation matrices cached by site set
+SUBCACHE_SIZE = 16
+
 
 class BaseCorrelationModel(metaclass=abc.ABCMeta):
     """
@@ -84,14 +87,42 @@ class JB2009CorrelationModel(BaseCorrelationModel):
         Boolean value to indicate whether "Case 1" or "Case 2" from page 1700
         should be applied. ``True`` value means that Vs 30 values show or are
         expected to show clustering ("Case 2"), ``False`` means otherwise.
+    :param submatrix:
+        If ``True``, factorize only the correlation matrix of the sites
+        affected by the rupture, caching it by site set, instead of the
+        (N, N) matrix of the complete site collection. This is the way to go
+        for large site collections.
     """
-    def __init__(self, vs30_clustering):
+    def __init__(self, vs30_clustering, submatrix=False):
         self.vs30_clustering = vs30_clustering
+        self.submatrix = submatrix
         self.cache = {}  # imt -> correlation model
+        self.subcache = {}  # (imt, sids) -> correlation model
 
     def _get_correlation_matrix(self, sites, imt):
         return jbcorrelation(sites, imt, self.vs30_clustering)
 
+    def apply_correlation(self, sites, imt, residuals, stddev_intra=0):
+        """
+        Apply correlation to randomly sampled residuals. If `submatrix`
+        is set, the Cholesky decomposition is performed on the correlation
+        matrix of the given sites, which gives the exact distribution
+        of the residuals on the sites, not only on the complete site
+        collection.
+        """
+        if not self.submatrix:
+            return super().apply_correlation(
+                sites, imt, residuals, stddev_intra)
+        key = (imt.string, sites.sids.tobytes())
+        try:
+            corma = self.subcache[key]
+        except KeyError:
+            if len(self.subcache) >= SUBCACHE_SIZE:  # remove the oldest
+                del self.subcache[next(iter(self.subcache))]
+            corma = self.get_lower_triangle_correlation_matrix(sites, imt)
+            self.subcache[key] = corma
+        return corma @ residuals  # shape (n, s)
+
     def get_lower_triangle_correlation_matrix(self, sites, imt):
         """
         Get lower-triangle matrix as a result of Cholesky-decomposition
@@ -616,6 +616,126 @@ def get_rvolc(planar, points):
     return numpy.zeros((len(planar), len(points)))
 
 
+# codes of the distances computed by get_dists_planar
+DIST_CODES = dict(rjb=0, rx=1, ry0=2, rhypo=3, repi=4, azimuth=5, rvolc=6)
+
+
+@compile("f8(f8, f8, f8, f8, f8)")
+def _dist(lon, lat, lon2, lat2, coslat2):
+    # scalar version of geodetic.distances, angles in radians
+    return math.asin(math.sqrt(
+        math.sin((lat - lat2) / 2.0) ** 2 +
+        math.cos(lat) * coslat2 * math.sin((lon - lon2) / 2.0) ** 2
+    )) * 2. * geodetic.EARTH_RADIUS
+
+
+@compile("f8(f8, f8, f8, f8, f8, f8, f8)")
+def _dist_to_arc(lon, lat, azi, lon2, lat2, sinlat2, coslat2):
+    # scalar version of geodetic.distances_to_arc, angles in radians
+    azi_to_target = - math.atan2(
+        math.sin(lon - lon2) * coslat2,
+        math.cos(lat) * sinlat2 - math.sin(lat) * coslat2 *
+        math.cos(lon - lon2))
+    sin = math.sin(azi_to_target - azi)
+    angle = math.acos(sin * math.sin(
+        _dist(lon, lat, lon2, lat2, coslat2) / geodetic.EARTH_RADIUS))
+    return (math.pi / 2. - angle) * geodetic.EARTH_RADIUS
+
+
+# numbified below
+def get_dists_planar(planar, points, codes):
+    """
+    Fused version of :func:`project` and of the get_<dist> functions,
+    computing all the requested distances in a single pass over the sites.
+
+    :param planar: a planar recarray of shape (U, 3)
+    :param points: an array of euclidean coordinates of shape (N, 3)
+    :param codes: D distance codes, as in DIST_CODES
+    :returns: (3 + D, U, N) values, i.e. rrup, xx, yy and the D distances
+    """
+    lonlatdeps = geo_utils.cartesian_to_spherical(points)
+    lons = numpy.radians(lonlatdeps[0])
+    lats = numpy.radians(lonlatdeps[1])
+    deps = lonlatdeps[2]
+    sinlats, coslats = numpy.sin(lats), numpy.cos(lats)
+    out = numpy.zeros((3 + len(codes), len(planar), len(points)))
+    clons, clats = numpy.zeros(4), numpy.zeros(4)
+    need = numpy.zeros(7, numpy.bool_)  # one flag per DIST_CODE
+    need[codes] = True
+    a0 = a1 = a2 = a3 = 0.
+    for u in range(len(planar)):
+        width, length = planar.wlr[u, 0], planar.wlr[u, 1]
+        strike = planar.sdr[u, 0]
+        azi = math.radians(strike)
+        downdip = math.radians((strike + 90.) % 360.)
+        clons[:], clats[:] = planar.corners[u, 0], planar.corners[u, 1]
+        # corners projected at the surface, for the rjb case "I"
+        cxyz = fast_spherical_to_cartesian(clons, clats, numpy.zeros(4))
+        clons[:], clats[:] = numpy.radians(clons), numpy.radians(clats)
+        hlon = math.radians(planar.hypo[u, 0])
+        hlat = math.radians(planar.hypo[u, 1])
+        hdep = planar.hypo[u, 2]
+        xyz0 = planar.xyz[u, :, 0]
+        normal, uv1, uv2 = planar.normal[u], planar.uv1[u], planar.uv2[u]
+        for n in range(len(points)):
+            mx = points[n, 0] - xyz0[0]
+            my = points[n, 1] - xyz0[1]
+            mz = points[n, 2] - xyz0[2]
+            dist = mx * normal[0] + my * normal[1] + mz * normal[2]
+            xx = mx * uv1[0] + my * uv1[1] + mz * uv1[2]
+            yy = mx * uv2[0] + my * uv2[1] + mz * uv2[2]
+            # same cases as in project
+            mxx = xx if xx < 0 else (xx - length if xx > length else 0.)
+            myy = yy if yy < 0 else (yy - width if yy > width else 0.)
+            out[0, u, n] = math.sqrt(dist ** 2 + mxx ** 2 + myy ** 2)
+            out[1, u, n] = xx
+            out[2, u, n] = yy
+            lon, lat, sinlat, coslat = site = (
+                lons[n], lats[n], sinlats[n], coslats[n])
+            # distances to the arcs of get_rjb, shared by rjb, rx and ry0
+            if need[0] or need[1]:
+                a1 = _dist_to_arc(clons[0], clats[0], azi, *site)
+            if need[0]:
+                a0 = _dist_to_arc(clons[2], clats[2], azi, *site)
+            if need[0] or need[2]:
+                a2 = _dist_to_arc(clons[0], clats[0], downdip, *site)
+                a3 = _dist_to_arc(clons[1], clats[1], downdip, *site)
+            for d, code in enumerate(codes):
+                if code == 0:  # rjb, same cases as in get_rjb
+                    same01 = numpy.sign(a0) == numpy.sign(a1)
+                    same23 = numpy.sign(a2) == numpy.sign(a3)
+                    if same01 and same23:
+                        dst = geo_utils.min_distance(points[n], cxyz)
+                    elif same01:
+                        dst = min(abs(a0), abs(a1))
+                    elif same23:
+                        dst = min(abs(a2), abs(a3))
+                    else:
+                        dst = 0.
+                elif code == 1:  # rx
+                    dst = a1
+                elif code == 2:  # ry0, same as in get_ry0
+                    if numpy.sign(a2) == numpy.sign(a3):
+                        dst = min(abs(a2), abs(a3))
+                    else:
+                        dst = 0.
+                elif code == 3:  # rhypo
+                    hdist = _dist(hlon, hlat, lon, lat, coslat)
+                    dst = math.sqrt(hdist ** 2 + (hdep - deps[n]) ** 2)
+                elif code == 4:  # repi
+                    dst = _dist(hlon, hlat, lon, lat, coslat)
+                elif code == 5:  # azimuth, as in geodetic.fast_azimuth
+                    azim = - math.degrees(math.atan2(
+                        math.sin(hlon - lon) * coslat,
+                        math.cos(hlat) * sinlat -
+                        math.sin(hlat) * coslat * math.cos(hlon - lon)))
+                    dst = (azim - strike) % 360
+                else:  # rvolc, see the TODO in get_rvolc
+                    dst = 0.
+                out[3 + d, u, n] = dst
+    return out
+
+
 planar_nt = numba.from_dtype(planar_array_dt)
 project = compile(numba.float64[:, :, :](
     planar_nt[:, :],
@@ -634,6 +754,11 @@ get_rhypo = comp(get_rhypo)
 get_repi = comp(get_repi)
 get_azimuth = comp(get_azimuth)
 get_rvolc = comp(get_rvolc)
+get_dists_planar = compile(numba.float64[:, :, :](
+    planar_nt[:, :],
+    numba.float64[:, :],
+    numba.uint8[:]
+))(get_dists_planar)
 
 
 def get_distances_planar(planar, sites, dist_type):
@@ -80,8 +80,8 @@ class AdaptedWarning(UserWarning):
     """
 
 
-OK_METHODS = ('compute', 'get_mean_and_stddevs', 'set_poes', 'requires',
-              'set_parameters', 'set_tables')
+OK_METHODS = ('compute', 'compute_batch', 'get_mean_and_stddevs',
+              'set_poes', 'requires', 'set_parameters', 'set_tables')
 
 
 def bad_methods(clsdict):
@@ -440,3 +440,18 @@ class GMPE(GroundShakingIntensityModel):
         arrays and returning None.
         """
         raise NotImplementedError
+
+    @classmethod
+    def compute_batch(cls, gsims, ctx: numpy.recarray, imts, out):
+        """
+        :param gsims: a list of G instances of the class
+        :param ctx: a numpy recarray of size N
+        :param imts: a list of M Intensity Measure Types
+        :param out: an array of shape (4, G, M, N) to fill
+        :returns: a list of G adjustments (possibly None)
+
+        By default calls .compute for each instance. To be overridden in
+        subclasses where the instances can share the common terms.
+        """
+        return [cls.compute(gsim, ctx, imts, *out[:, g])
+                for g, gsim in enumerate(gsims)]
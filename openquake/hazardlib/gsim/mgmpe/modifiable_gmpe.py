@@ -267,6 +267,64 @@ def _dict_to_coeffs_table(input_dict, name):
     return {name: CoeffsTable.fromdict(coeff_dict)}
 
 
+def _rock_vs30(params):
+    # reference Vs30 used when computing the original GMPE, if any
+    if 'nrcan15_site_term' in params:
+        return 760.
+    elif 'cy14_site_term' in params:
+        return 1130.
+    elif 'ba08_site_term' in params:
+        return 760.
+
+
+def _rock_ctx(mgmpe, ctx):
+    # set the reference Vs30 if required
+    rock_vs30 = _rock_vs30(mgmpe.params)
+    if rock_vs30 is None:
+        return ctx
+    ctx_copy = ctx.copy()
+    ctx_copy.vs30 = np.full_like(ctx.vs30, rock_vs30)  # rock
+    return ctx_copy
+
+
+def _gmpe_key(mgmpe):
+    # instances with the same key give the same original mean and stddevs
+    gmpe = mgmpe.gmpe
+    return (gmpe.__class__.__name__, repr(sorted(gmpe.kwargs.items())),
+            _rock_vs30(mgmpe.params))
+
+
+def _modify(mgmpe, ctx, imts, mean, sig, tau, phi):
+    g = globals()
+
+    # Here we compute reference ground-motion for PGA when we need to
+    # amplify the motion using the CEUS2020 model
+    if 'ceus2020_site_term' in mgmpe.params:
+
+        # Arrays for storing results
+        ref = np.zeros((1, len(sig[0, :])))
+        tmp = np.zeros((1, len(sig[0, :])))
+
+        # Update context
+        tctx = ctx.copy()
+        ref_vs30 = mgmpe.params['ceus2020_site_term']['ref_vs30']
+        tctx.vs30 = np.ones_like(tctx.vs30) * ref_vs30
+        timt = (PGA(),)
+
+        mgmpe.gmpe.compute(tctx, timt, ref, tmp, tmp, tmp)
+
+        # 'ref' contains the PGA for the reference Vs30
+        ref = np.squeeze(ref)
+
+    # Apply sequentially the modifications
+    for methname, kw in mgmpe.params.items():
+        if methname in ['ceus2020_site_term']:
+            kw['ref_pga'] = np.exp(ref)
+        for m, imt in enumerate(imts):
+            me, si, ta, ph = mean[m], sig[m], tau[m], phi[m]
+            g[methname](ctx, imt, me, si, ta, ph, **kw)
+
+
 class ModifiableGMPE(GMPE):
     """
     This is a class to modify an underlying GMPE.
@@ -377,51 +435,25 @@ class ModifiableGMPE(GMPE):
         <.base.GroundShakingIntensityModel.compute>`
         for spec of input and result values.
         """
-        # Set reference Vs30 if required
-        if ('nrcan15_site_term' in self.params or
-                'cy14_site_term' in self.params or
-                'ba08_site_term' in self.params):
-            ctx_copy = ctx.copy()
-            if 'nrcan15_site_term' in self.params:
-                rock_vs30 = 760.
-            elif 'cy14_site_term' in self.params:
-                rock_vs30 = 1130.
-            elif 'ba08_site_term' in self.params:
-                rock_vs30 = 760.
-            ctx_copy.vs30 = np.full_like(ctx.vs30, rock_vs30)  # rock
-        else:
-            ctx_copy = ctx
-        g = globals()
-
         # Compute the original mean and standard deviations
-        self.gmpe.compute(ctx_copy, imts, mean, sig, tau, phi)
-
-        # Here we compute reference ground-motion for PGA when we need to
-        # amplify the motion using the CEUS2020 model
-        if 'ceus2020_site_term' in self.params:
-
-            # Arrays for storing results
-            ref = np.zeros_like(mean)
-            tmp = np.zeros_like(sig)
+        self.gmpe.compute(_rock_ctx(self, ctx), imts, mean, sig, tau, phi)
+        _modify(self, ctx, imts, mean, sig, tau, phi)
 
-            ref = np.zeros((1, len(sig[0, :])))
-            tmp = np.zeros((1, len(sig[0, :])))
-
-            # Update context
-            tctx = ctx.copy()
-            ref_vs30 = self.params['ceus2020_site_term']['ref_vs30']
-            tctx.vs30 = np.ones_like(tctx.vs30) * ref_vs30
-            timt = (PGA(),)
-
-            self.gmpe.compute(tctx, timt, ref, tmp, tmp, tmp)
-
-            # 'ref' contains the PGA for the reference Vs30
-            ref = np.squeeze(ref)
-
-        # Apply sequentially the modifications
-        for methname, kw in self.params.items():
-            if methname in ['ceus2020_site_term']:
-                kw['ref_pga'] = np.exp(ref)
-            for m, imt in enumerate(imts):
-                me, si, ta, ph = mean[m], sig[m], tau[m], phi[m]
-                g[methname](ctx, imt, me, si, ta, ph, **kw)
+    @classmethod
+    def compute_batch(cls, gsims, ctx: np.recarray, imts, out):
+        """
+        The original GMPE is computed only once for the instances
+        wrapping the same GMPE with the same reference Vs30, then
+        the modifications of each instance are applied.
+        """
+        first = {}  # key -> index of the first instance with that key
+        for g, gsim in enumerate(gsims):
+            key = _gmpe_key(gsim)
+            if key in first:
+                out[:, g] = out[:, first[key]]
+            else:
+                first[key] = g
+                gsim.gmpe.compute(_rock_ctx(gsim, ctx), imts, *out[:, g])
+        for g, gsim in enumerate(gsims):
+            _modify(gsim, ctx, imts, *out[:, g])
+        return [None] * len(gsims)
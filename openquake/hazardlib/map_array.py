@@ -201,20 +201,23 @@ def get_lvl(hcurve, imls, poe):
 # ############################# probability maps ##############################
 
 t = numba.types
-sig_i = t.void(t.float32[:, :, :],                     # pmap
-               t.float64[:, :, :],                     # poes
-               t.float64[:],                           # rates
-               t.float64[:, :],                        # probs_occur
-               t.uint32[:],                            # sids
-               t.float64)                              # itime
-
-sig_m = t.void(t.float32[:, :, :],                     # pmap
-               t.float64[:, :, :],                     # poes
-               t.float64[:],                           # rates
-               t.float64[:, :],                        # probs_occur
-               t.float64[:],                           # weights
-               t.uint32[:],                            # sids
-               t.float64)                              # itime
+# the PoEs can be 64 bit or 32 bit, depending on the precision parameter
+sig_i = [t.void(t.float32[:, :, :],                    # pmap
+                poes,                                  # poes
+                t.float64[:],                          # rates
+                t.float64[:, :],                       # probs_occur
+                t.uint32[:],                           # sids
+                t.float64)                             # itime
+         for poes in (t.float64[:, :, :], t.float32[:, :, :])]
+
+sig_m = [t.void(t.float32[:, :, :],                    # pmap
+                poes,                                  # poes
+                t.float64[:],                          # rates
+                t.float64[:, :],                       # probs_occur
+                t.float64[:],                          # weights
+                t.uint32[:],                           # sids
+                t.float64)                             # itime
+         for poes in (t.float64[:, :, :], t.float32[:, :, :])]
 
 
 @compile(sig_i)
@@ -76,6 +76,7 @@ import re
 import sys
 import operator
 import collections.abc
+from xml.parsers.expat import ParserCreate
 
 import numpy
 
@@ -226,6 +227,11 @@ def get_source_model_05(node, fname, converter=default):
             for src in sg:
                 source_ids.append(src.source_id)
             groups.append(sg)
+    return _build_source_model(node, groups)
+
+
+def _build_source_model(node, groups):
+    # build a SourceModel from a sourceModel node and its groups
     itime = node.get('investigation_time')
     if itime is not None:
         itime = valid.positivefloat(itime)
@@ -235,6 +241,139 @@ def get_source_model_05(node, fname, converter=default):
     return SourceModel(sorted(groups), node.get('name'), itime, stime)
 
 
+def stream_source_model(source, converter=default, fname=None):
+    """
+    Convert a source model in NRML 0.5 format without keeping the full
+    Node tree in memory: each source is converted as soon as its closing
+    tag is parsed and then its subnodes are discarded.
+
+    :param source: a file name or a file object open for reading
+    :param converter: a SourceConverter instance
+    :param fname: the name of the file, used in the error messages
+    :returns: a SourceModel instance
+    """
+    converter.fname = fname or getattr(source, 'name', source)
+    groups = []
+    sources = []
+    vparser = ValidatingXmlParser(validators)
+    for depth, node in vparser.iterparse(source, depths=(1, 2, 3)):
+        if depth == 1:  # sourceModel node, the last one
+            return _build_source_model(node, groups)
+        expected = 'Source' if depth == 3 else 'sourceGroup'
+        if 'nrml/0.5' not in node.tag or not node.tag.endswith(expected):
+            # for instance a source node outside of a sourceGroup
+            raise InvalidFile(
+                '%s: you have an incorrect declaration '
+                'xmlns="http://openquake.org/xmlns/nrml/0.5"; it should be '
+                'xmlns="http://openquake.org/xmlns/nrml/0.4"' %
+                converter.fname)
+        if depth == 3:  # source node
+            sources.append(converter.convert_node(node))
+        else:  # sourceGroup node
+            sg = converter.convert_sourceGroup(node, sources)
+            if sg and len(sg):
+                groups.append(sg)
+            sources = []
+        node.nodes = []  # keep only the attributes
+    raise InvalidFile('%s: missing sourceModel node' % converter.fname)
+
+
+def get_source_shards(fname, shard_size):
+    """
+    Split a source model file in NRML 0.5 format in shards of around
+    `shard_size` bytes, at the boundaries of the source groups and of the
+    sources. Mutex groups and cluster groups are never split.
+
+    :param fname: path to a source model file
+    :param shard_size: the maximum size in bytes of a shard
+    :returns:
+        a list of pairs (group index, byte ranges); the shard is obtained
+        by concatenating the ranges with :func:`read_source_shard`.
+        The list is empty if the file is not in NRML 0.5 format.
+    """
+    depth = 0
+    groups = []  # [start, attrs, source starts, end tag start]
+    ok = True
+
+    def start(name, attrs):
+        nonlocal depth, ok
+        if depth == 0:
+            ok = 'nrml/0.5' in attrs.get('xmlns', '')
+        elif depth == 2:
+            ok = ok and name.split(':')[-1] == 'sourceGroup'
+            groups.append([p.CurrentByteIndex, attrs, []])
+        elif depth == 3:
+            groups[-1][2].append(p.CurrentByteIndex)
+        depth += 1
+
+    def end(name):
+        nonlocal depth
+        depth -= 1
+        if depth == 2:
+            groups[-1].append(p.CurrentByteIndex)
+
+    p = ParserCreate()
+    p.StartElementHandler = start
+    p.EndElementHandler = end
+    with open(fname, 'rb') as f:
+        p.ParseFile(f)
+        size = f.tell()
+    if not ok or not groups:
+        return []
+    header = (0, groups[0][0])
+    footer = (groups[-1][3], size)  # includes the last </sourceGroup>
+    shards = []
+    for grp_idx, (gstart, attrs, starts, gend) in enumerate(groups):
+        if not starts:  # empty group
+            continue
+        opening = (gstart, starts[0])
+        stops = starts[1:] + [gend]
+        if (attrs.get('src_interdep') == 'mutex' or
+                attrs.get('cluster') == 'true'):
+            runs = [(starts[0], gend)]
+        else:
+            runs = []
+            a = starts[0]
+            for start_, stop in zip(starts, stops):
+                if stop - a > shard_size and start_ > a:
+                    runs.append((a, start_))
+                    a = start_
+            runs.append((a, gend))
+        for run in runs:
+            shards.append((grp_idx, [header, opening, run, footer]))
+    return shards
+
+
+def read_source_shard(fname, ranges):
+    """
+    :returns: the bytes of a shard of a source model file
+    """
+    with open(fname, 'rb') as f:
+        chunks = []
+        for start, stop in ranges:
+            f.seek(start)
+            chunks.append(f.read(stop - start))
+    return b''.join(chunks)
+
+
+def merge_source_shards(pairs):
+    """
+    :param pairs: a list of pairs (group index, SourceModel) in shard order
+    :returns: a SourceModel with the groups of the shards merged
+    """
+    groups = {}
+    for grp_idx, sm in pairs:
+        for sg in sm:
+            if grp_idx in groups:
+                for src in sg:
+                    groups[grp_idx].update(src)
+            else:
+                groups[grp_idx] = sg
+    sm = pairs[0][1]
+    return SourceModel(sorted(groups.values()), sm.name,
+                       sm.investigation_time, sm.start_time)
+
+
 validators = {
     'backarc': valid.boolean,
     'strike': valid.strike_range,
@@ -337,18 +476,23 @@ def read_source_models(fnames, converter):
         else:
             raise ValueError('Unrecognized extension in %s' % fname)
         sm.fname = fname
-
-        # check investigation time for NonParametricSeismicSources
-        cit = converter.investigation_time
-        np = [s for sg in sm.src_groups for s in sg if hasattr(s, 'data')]
-        if np and sm.investigation_time != cit:
-            raise ValueError(
-                'The source model %s contains an investigation_time '
-                'of %s, while the job.ini has %s' % (
-                    fname, sm.investigation_time, cit))
+        check_investigation_time(sm, converter)
         yield sm
 
 
+def check_investigation_time(sm, converter):
+    """
+    Check the investigation time for NonParametricSeismicSources
+    """
+    cit = converter.investigation_time
+    np = [s for sg in sm.src_groups for s in sg if hasattr(s, 'data')]
+    if np and sm.investigation_time != cit:
+        raise ValueError(
+            'The source model %s contains an investigation_time '
+            'of %s, while the job.ini has %s' % (
+                sm.fname, sm.investigation_time, cit))
+
+
 def read(source, stop=None):
     """
     Convert a NRML file into a validated Node object. Keeps
@@ -22,7 +22,7 @@ Module :mod:`openquake.hazardlib.site` defines :class:`Site`.
 
 import numpy
 import pandas
-from scipy.spatial import distance
+from scipy.spatial import KDTree, distance
 from shapely import geometry
 from openquake.baselib import hdf5
 from openquake.baselib.general import not_equal, get_duplicates, cached_property
@@ -716,21 +716,77 @@ class SiteCollection(object):
             for rec in self.array])
         return self.filter(mask)
 
-    def within_bbox(self, bbox):
+    def within_bbox(self, bbox, idxs=None):
         """
         :param bbox:
             a quartet (min_lon, min_lat, max_lon, max_lat)
+        :param idxs:
+            if given, an ordered array of candidate site indices
         :returns:
             site IDs within the bounding box
         """
         min_lon, min_lat, max_lon, max_lat = bbox
         lons, lats = self['lon'], self['lat']
-        if cross_idl(lons.min(), lons.max(), min_lon, max_lon):
+        # NB: the IDL check is made on the full site collection, so that
+        # the result does not depend on the candidate sites
+        idl = cross_idl(*self.lon_range, min_lon, max_lon)
+        if idxs is not None:
+            if len(idxs) == 0:
+                return idxs
+            lons, lats = lons[idxs], lats[idxs]
+        if idl:
             lons = lons % 360
             min_lon, max_lon = min_lon % 360, max_lon % 360
         mask = (min_lon < lons) * (lons < max_lon) * \
                (min_lat < lats) * (lats < max_lat)
-        return mask.nonzero()[0]
+        if idxs is None:
+            return mask.nonzero()[0]
+        return idxs[mask]
+
+    @cached_property
+    def lon_range(self):
+        """
+        :returns: the minimum and maximum longitude of the sites
+        """
+        lons = self['lon']
+        return lons.min(), lons.max()
+
+    @cached_property
+    def kdt(self):
+        """
+        :returns: a KDTree on the cartesian coordinates of the sites
+        """
+        return KDTree(self.xyz)
+
+    def within_distance(self, lons, lats, deps, dists, eps=.001):
+        """
+        Radius queries on the KDTree of the site collection; the
+        distances are euclidean distances in the 3D cartesian space.
+
+        :param lons: P longitudes
+        :param lats: P latitudes
+        :param deps: P depths
+        :param dists: P distances in km (or a scalar)
+        :param eps: tolerance used by the KDTree
+        :returns: a list of P ordered arrays of site indices
+        """
+        xyz = spherical_to_cartesian(lons, lats, deps).reshape(-1, 3)
+        idxs = self.kdt.query_ball_point(xyz, dists, eps=eps)
+        out = []
+        for ids in idxs:
+            arr = numpy.uint32(ids)
+            arr.sort()  # for cross-platform consistency
+            out.append(arr)
+        return out
+
+    def count_within_distance(self, lons, lats, deps, dists, eps=.001):
+        """
+        Same as `within_distance`, but returns only the number of sites
+        for each point, without building the lists of indices.
+        """
+        xyz = spherical_to_cartesian(lons, lats, deps).reshape(-1, 3)
+        return self.kdt.query_ball_point(
+            xyz, dists, eps=eps, return_length=True)
 
     def extend(self, lons, lats):
         """
@@ -752,6 +808,7 @@ class SiteCollection(object):
         array[N1:]['lon'] = lons
         array[N1:]['lat'] = lats
         complete.array = array
+        complete.__dict__.pop('kdt', None)  # the sites changed
 
     @cached_property
     def countries(self):
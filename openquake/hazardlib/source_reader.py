@@ -16,7 +16,9 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
 import zlib
+import hashlib
 import os.path
 import pickle
 import operator
@@ -52,6 +54,7 @@ source_info_dt = numpy.dtype([
 ])
 
 checksum = operator.attrgetter('checksum')
+SHARD_SIZE = 100 * 1024 ** 2  # larger source model files are split in shards
 
 
 def check_unique(ids, msg='', strict=True):
@@ -151,17 +154,81 @@ def _sample(srcs, sample, applied):
     return (out + rand) or [srcs[0]]
 
 
-def read_source_model(fname, branch, converter, applied, sample, monitor):
+def get_sm_cache_path(fname, converter, cachedir):
+    """
+    :returns: the path of the cache file of the given source model file
+              of the form <cachedir>/sm_<checksum>.pik
+
+    The checksum depends on the content of the file, on the content of the
+    sibling .hdf5 file (if any, it is read by the converter for gridded
+    and multi-fault sources) and on the parameters of the converter, not
+    on the path.
+    """
+    sha = hashlib.sha256()
+    sibling = os.path.splitext(fname)[0] + '.hdf5'
+    for path in [fname] + ([sibling] if os.path.exists(sibling) else []):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+    params = sorted((k, v) for k, v in vars(converter).items()
+                    if k != 'fname')
+    sha.update(repr(params).encode('utf8'))
+    return os.path.join(cachedir, 'sm_%s.pik' % sha.hexdigest())
+
+
+def read_cached_source_model(fname, converter, cachedir=''):
+    """
+    Convert the source model file, or read it from the per-file cache
+    if `cachedir` is set and the file was already converted.
+
+    :param fname: path to a source model XML file
+    :param converter: SourceConverter
+    :param cachedir: the cache directory (if any)
+    :returns: a SourceModel instance
+    """
+    if not cachedir:
+        [sm] = nrml.read_source_models([fname], converter)
+        return sm
+    path = get_sm_cache_path(fname, converter, cachedir)
+    if os.path.exists(path):
+        logging.debug('Reading %s from %s', fname, path)
+        with open(path, 'rb') as f:
+            sm = pickle.loads(zlib.decompress(f.read()))
+        sm.fname = fname
+        return sm
+    [sm] = nrml.read_source_models([fname], converter)
+    write_cached_source_model(path, sm)
+    return sm
+
+
+def write_cached_source_model(path, sm):
+    """
+    Store the given SourceModel in the per-file cache
+    """
+    tmp = '%s.%d' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(zpik(sm).tobytes())
+    os.replace(tmp, path)  # atomic, other processes may read the path
+
+
+def read_source_model(fname, branch, converter, applied, sample,
+                      cachedir, monitor):
     """
     :param fname: path to a source model XML file
     :param branch: source model logic tree branch ID
     :param converter: SourceConverter
     :param applied: list of source IDs within applyToSources
     :param sample: a string with the sampling factor (if any)
+    :param cachedir: the directory of the per-file cache (if any)
     :param monitor: a Monitor instance
     :returns: a SourceModel instance
     """
-    [sm] = nrml.read_source_models([fname], converter)
+    sm = read_cached_source_model(fname, converter, cachedir)
+    _set_branch_and_sample(sm, branch, applied, sample)
+    return {fname: sm}
+
+
+def _set_branch_and_sample(sm, branch, applied, sample):
     sm.branch = branch
     for sg in sm.src_groups:
         if sample and not sg.atomic:
@@ -172,7 +239,67 @@ def read_source_model(fname, branch, converter, applied, sample, monitor):
                 else:
                     srcs.extend(calc.filters.split_source(src))
             sg.sources = _sample(srcs, float(sample), applied)
-    return {fname: sm}
+
+
+def read_source_shard(fname, ishard, grp_idx, ranges, converter, monitor):
+    """
+    Convert a shard of a large source model file, see
+    :func:`openquake.hazardlib.nrml.get_source_shards`
+
+    :param fname: path to a source model XML file
+    :param ishard: the shard index
+    :param grp_idx: the index of the source group in the file
+    :param ranges: the byte ranges of the shard
+    :param converter: SourceConverter
+    :param monitor: a Monitor instance
+    :returns: a dictionary (fname, ishard) -> (grp_idx, SourceModel)
+    """
+    data = nrml.read_source_shard(fname, ranges)
+    sm = nrml.stream_source_model(io.BytesIO(data), converter, fname)
+    return {(fname, ishard): (grp_idx, sm)}
+
+
+def read_sharded_source_models(allargs, h5=None):
+    """
+    Split the source model files larger than SHARD_SIZE at the boundaries
+    of the sources and convert the shards in parallel.
+
+    :param allargs: the arguments of the read_source_model tasks
+    :returns: (the remaining arguments, a dictionary fname -> SourceModel)
+    """
+    remaining = []
+    shardargs = []
+    for args in allargs:
+        fname, branch, converter, applied, sample, cachedir = args
+        shards = []
+        if os.path.getsize(fname) > SHARD_SIZE and not (
+                cachedir and os.path.exists(
+                    get_sm_cache_path(fname, converter, cachedir))):
+            shards = nrml.get_source_shards(fname, SHARD_SIZE)
+        if len(shards) > 1:
+            logging.info('Splitting %s in %d shards', fname, len(shards))
+            for ishard, (grp_idx, ranges) in enumerate(shards):
+                shardargs.append((fname, ishard, grp_idx, ranges, converter))
+        else:
+            remaining.append(args)
+    smdict = {}
+    if not shardargs:
+        return remaining, smdict
+    dic = parallel.Starmap(read_source_shard, shardargs, h5=h5).reduce()
+    for args in allargs:
+        fname, branch, converter, applied, sample, cachedir = args
+        pairs = [dic[k] for k in sorted(dic) if k[0] == fname]
+        if not pairs:
+            continue
+        sm = nrml.merge_source_shards(pairs)
+        sm.fname = fname
+        nrml.check_investigation_time(sm, converter)
+        if cachedir:
+            write_cached_source_model(
+                get_sm_cache_path(fname, converter, cachedir), sm)
+        _set_branch_and_sample(sm, branch, applied, sample)
+        smdict[fname] = sm
+    return remaining, smdict
 
 
 # NB: in classical this is called after reduce_sources, so ";" is not
@@ -270,11 +397,15 @@ def get_csm(oq, full_lt, dstore=None):
         path = os.path.abspath(
             os.path.join(full_lt.source_model_lt.basepath, fname))
         smpaths.append(path)
-        allargs.append((path, rows[0]['branch'], converter, applied, ss))
+        allargs.append((path, rows[0]['branch'], converter, applied, ss,
+                        oq.cachedir))
     for path in allpaths - set(smpaths):  # geometry models
-        allargs.append((path, '', converter, applied, ss))
+        allargs.append((path, '', converter, applied, ss, oq.cachedir))
+    allargs, sharded = read_sharded_source_models(
+        allargs, h5=dstore if dstore else None)
     smdict = parallel.Starmap(read_source_model, allargs,
                               h5=dstore if dstore else None).reduce()
+    smdict.update(sharded)
     parallel.Starmap.shutdown()  # save memory
     smdict = {k: smdict[k] for k in sorted(smdict)}
     check_duplicates(smdict, strict=oq.disagg_by_src)
@@ -1198,12 +1198,15 @@ class SourceConverter(RuptureConverter):
     def convert_sourceModel(self, node):
         return [self.convert_node(subnode) for subnode in node]
 
-    def convert_sourceGroup(self, node):
+    def convert_sourceGroup(self, node, sources=None):
         """
         Convert the given node into a SourceGroup object.
 
         :param node:
             a node with tag sourceGroup
+        :param sources:
+            if given, the sources already converted from the subnodes
+            (None for the filtered out ones)
         :returns:
             a :class:`SourceGroup` instance
         """
@@ -1235,8 +1238,11 @@ class SourceConverter(RuptureConverter):
                 # hack in place of a ClusterPoissonTOM
                 assert hasattr(sg, 'occurrence_rate')
 
-        for src_node in node:
-            src = self.convert_node(src_node)
+        for i, src_node in enumerate(node):
+            if sources is None:
+                src = self.convert_node(src_node)
+            else:  # already converted while streaming
+                src = sources[i]
             if src is None:  # filtered out by source_id
                 continue
             # transmit the group attributes to the underlying source
@@ -19,6 +19,7 @@
 Utilities to compute mean and quantile curves
 """
 import math
+import functools
 import numpy
 import pandas
 from scipy.stats import norm
@@ -73,6 +74,57 @@ def truncnorm_sf(phi_b, values):
     return ((phi_b - ndtr(values)) / z).clip(0., 1.)
 
 
+# used when fast_poes is set: with a step of 1E-3 the error of the linear
+# interpolation is below STEP**2/8 * max|x*pdf(x)| / z = 3.1E-8 / z where
+# z = 2 * ndtr(truncation_level) - 1, i.e. smaller than the float32
+# resolution of the PoEs for truncation levels above 1
+SF_TABLE_STEP = 1E-3
+SF_TABLE_XMAX = 9.  # the survival function is 1 or 0 beyond that
+
+
+@functools.lru_cache()
+def truncnorm_sf_table(truncation_level):
+    """
+    :param truncation_level: a positive float
+    :returns: a pair (table, xmax) with the values of truncnorm_sf
+              on a uniform grid from -xmax to xmax
+    """
+    xmax = min(truncation_level, SF_TABLE_XMAX)
+    num = int(numpy.ceil(2 * xmax / SF_TABLE_STEP)) + 1
+    table = truncnorm_sf(ndtr(truncation_level), numpy.linspace(
+        -xmax, xmax, num))
+    return table, xmax
+
+
+@compile("float64[:](float64[:], float64, float64[:])")
+def truncnorm_sf_interp(table, xmax, values):
+    """
+    Approximate truncnorm_sf by interpolating the values in the table
+    returned by :func:`truncnorm_sf_table`.
+
+    :param table: an array of K+1 values on a uniform grid
+    :param xmax: the grid goes from -xmax to xmax
+    :param values: an array of epsilons
+    :returns: an array of survival function values
+    """
+    K = len(table) - 1
+    dx = 2. * xmax / K
+    out = numpy.empty(len(values))
+    for i, x in enumerate(values):
+        if x <= -xmax:
+            out[i] = table[0]
+        elif x >= xmax:
+            out[i] = table[K]
+        elif x == x:  # not NaN
+            p = (x + xmax) / dx
+            k = min(int(p), K - 1)
+            w = p - k
+            out[i] = table[k] * (1. - w) + table[k + 1] * w
+        else:
+            out[i] = x
+    return out
+
+
 def norm_cdf(x, a, s):
     """
     Gaussian cumulative distribution function; if s=0, returns an
@@ -203,15 +255,25 @@ def quantile_curve(quantile, curves, weights=None):
     else:
         weights = numpy.array(weights)
         assert len(weights) == R, (len(weights), R)
-    result = numpy.zeros(curves.shape[1:])
-    for idx, _ in numpy.ndenumerate(result):
-        cw = numpy.zeros(R, cw_dt)  # (curve, weight)
-        cw['c'] = curves[(slice(None), ) + idx]
-        cw['w'] = weights
-        cw.sort(order='c')
-        # get the quantile from the interpolated CDF
-        result[idx] = numpy.interp(quantile, cw['w'].cumsum(), cw['c'])
-    return result
+    # vectorized version of numpy.interp(quantile, cumweights, curves)
+    # on the sorted axis; ties in the curves are broken by weight, as
+    # when sorting a (curve, weight) composite array
+    ws = numpy.broadcast_to(
+        weights.reshape((R,) + (1,) * (curves.ndim - 1)), curves.shape)
+    order = numpy.lexsort((ws, curves), axis=0)
+    cs = numpy.take_along_axis(curves, order, axis=0)
+    cw = numpy.take_along_axis(ws, order, axis=0).cumsum(axis=0)
+    j = (cw <= quantile).sum(axis=0) - 1  # largest j with cw[j] <= q
+    lo = numpy.clip(j, 0, R - 1)[None]
+    hi = numpy.clip(j + 1, 0, R - 1)[None]
+    c0 = numpy.take_along_axis(cs, lo, axis=0)[0]
+    c1 = numpy.take_along_axis(cs, hi, axis=0)[0]
+    w0 = numpy.take_along_axis(cw, lo, axis=0)[0]
+    w1 = numpy.take_along_axis(cw, hi, axis=0)[0]
+    dw = w1 - w0
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        res = numpy.where(dw > 0, c0 + (quantile - w0) * (c1 - c0) / dw, c0)
+    return numpy.where(j < 0, cs[0], res)
 
 
 # NB: this will be obsolete in numpy 2+
@@ -26,7 +26,8 @@ import unittest
 import numpy
 
 from openquake.hazardlib.contexts import simple_cmaker
-from openquake.hazardlib.calc.conditioned_gmfs import get_mean_covs
+from openquake.hazardlib.calc.conditioned_gmfs import (
+    get_mean_covs, inv_psd, cholesky_inv)
 from openquake.hazardlib.tests.calc import \
     _conditioned_gmfs_test_data as test_data
 
@@ -314,6 +315,27 @@ class SetUSGSTestCase(unittest.TestCase):
                           case_name)
 
 
+class InvPsdTestCase(unittest.TestCase):
+    def test_positive_definite(self):
+        x = numpy.array([0, 1, 2.5, 4, 7])  # station positions in km
+        rho = numpy.exp(-numpy.abs(numpy.subtract.outer(x, x)) / 3.)
+        aac(inv_psd(rho), numpy.linalg.pinv(rho), atol=1E-10)
+
+    def test_singular(self):
+        rho = numpy.ones((3, 3))  # stations in the same location
+        self.assertIsNone(cholesky_inv(rho))
+        aac(inv_psd(rho), numpy.linalg.pinv(rho))
+
+    def test_ill_conditioned(self):
+        # two nearly coincident stations: the matrix is positive definite
+        # but ill conditioned, so the pseudo-inverse must be used
+        x = numpy.array([0, 1E-5, 5])  # station positions in km
+        rho = numpy.exp(-numpy.abs(numpy.subtract.outer(x, x)) / 30.)
+        numpy.linalg.cholesky(rho)  # does not raise
+        self.assertIsNone(cholesky_inv(rho))
+        aac(inv_psd(rho), numpy.linalg.pinv(rho))
+
+
 # Functions useful for debugging purposes. Recreates the plots on
 # https://usgs.github.io/shakemap/manual4_0/tg_verification.html
 # Original code is from the ShakeMap plotting modules
@@ -17,6 +17,7 @@
 # along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
 import os
 import unittest
+import numpy
 from numpy.testing import assert_almost_equal as aae
 from openquake.baselib.general import gettemp
 from openquake.hazardlib import nrml
@@ -60,6 +61,18 @@ class SourceFilterTestCase(unittest.TestCase):
         sites = srcfilter.get_close_sites(src)
         self.assertIsNotNone(sites)
 
+    def test_within_bbox_kdt(self):
+        # the KDTree must select the same sites as the numpy filtering
+        lons, lats = numpy.meshgrid(numpy.arange(-180., 180., 1.),
+                                    numpy.arange(-60., 60., 1.))
+        sitecol = SiteCollection.from_points(lons.flatten(), lats.flatten())
+        srcfilter = SourceFilter(sitecol, IntegrationDistance.new('200'))
+        for bbox in [(10.5, 40.5, 20.5, 50.5),
+                     (170.5, -45.5, -175.5, -35.5),  # crossing the IDL
+                     (-30.5, -59.5, 30.5, 59.5)]:
+            numpy.testing.assert_equal(srcfilter._within_bbox(bbox),
+                                       sitecol.within_bbox(bbox))
+
 
 # from https://groups.google.com/d/msg/openquake-users/P03SxJsfW_s/nCdcxj8WAAAJ
 characteric_source = '''\
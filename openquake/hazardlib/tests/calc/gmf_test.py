@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (c) 2025 GEM Foundation
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
+import unittest
+from unittest.mock import Mock
+import numpy
+from openquake.hazardlib import valid, contexts, site, geo
+from openquake.hazardlib.source.rupture import EBRupture, build_planar
+from openquake.hazardlib.calc.gmf import GmfComputer, compute_gmfs_batch
+
+
+class ComputeGmfsBatchTestCase(unittest.TestCase):
+    def test_same_as_compute_all(self):
+        rlzs_by_gsim = {valid.gsim('BooreAtkinson2008'): numpy.uint32([0, 1]),
+                        valid.gsim('AkkarBommer2010'): numpy.uint32([2])}
+        cmaker = contexts.simple_cmaker(
+            rlzs_by_gsim, ['PGA', 'SA(0.3)'], truncation_level=3.)
+        cmaker.scenario = True
+        siteparams = Mock(reference_vs30_value=760.)
+        sitecol = site.SiteCollection.from_points(
+            [0., 0., .1, .2], [0., 1., .5, .3], sitemodel=siteparams)
+        ebrs = []
+        for i, (mag, lat) in enumerate([(6., .5), (7., .2), (6., .7)]):
+            rup = build_planar(geo.point.Point(0, lat, 10), mag=mag, rake=0.)
+            ebr = EBRupture(rup, 0, 0, n_occ=3, id=i, e0=3 * i)
+            ebr.seed = 42 + i
+            ebrs.append(ebr)
+
+        # computing the GMFs one rupture at the time
+        dfs = [GmfComputer(ebr, sitecol, cmaker).compute_all()
+               for ebr in ebrs]
+
+        # computing the GMFs in a single batch
+        computers = [GmfComputer(ebr, sitecol, cmaker) for ebr in ebrs]
+        gmfdata = compute_gmfs_batch(computers)
+        for col in dfs[0].columns:
+            exp = numpy.concatenate([df[col].to_numpy() for df in dfs])
+            numpy.testing.assert_allclose(gmfdata[col], exp, rtol=1E-6)
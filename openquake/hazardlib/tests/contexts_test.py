@@ -17,6 +17,7 @@
 # along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import copy
 import unittest
 import numpy
 
@@ -25,7 +26,8 @@ from openquake.hazardlib import site
 from openquake.hazardlib.pmf import PMF
 from openquake.hazardlib.const import TRT
 from openquake.hazardlib.tom import PoissonTOM
-from openquake.hazardlib.contexts import Effect, ContextMaker, get_distances
+from openquake.hazardlib.contexts import (
+    Effect, ContextMaker, get_distances)
 from openquake.hazardlib import valid
 from openquake.hazardlib.geo.surface import SimpleFaultSurface as SFS
 from openquake.hazardlib.source.multi_fault import save_and_split
@@ -293,6 +295,40 @@ class GetCtxs02TestCase(unittest.TestCase):
         self.assertAlmostEqual(dst, self.ctx.ry0, delta=1e-3)
 
 
+class CtxCacheTestCase(unittest.TestCase):
+    """
+    Test for the cache_distances option with sources differing only
+    by the probabilities of occurrence
+    """
+    def test(self):
+        path = '../../qa_tests_data/classical/case_75/'
+        sc = SourceConverter(investigation_time=1, rupture_mesh_spacing=2.5)
+        [[src]] = to_python(
+            os.path.join(BASE_PATH, path, 'ruptures_0.xml'), sc)
+        geom = to_python(
+            os.path.join(BASE_PATH, path, 'ruptures_0_sections.xml'), sc)
+        save_and_split([src], geom.sections, gettemp(suffix='.hdf5'))
+        set_msparams(src, geom.sections)
+        src.id = 0
+        src2 = copy.copy(src)
+        src2.probs_occur = src.probs_occur[:, ::-1].copy()
+        src2.id = 1
+        src2.offset = 100
+        site = Site(Point(0.05, 0.2), vs30=760, z1pt0=30, z2pt5=0.5,
+                    vs30measured=True)
+        sitecol = SiteCollection([site])
+        param = dict(imtls={'PGA': []})
+        cmaker = ContextMaker('*', [AbrahamsonEtAl2014()], param)
+        param['cache_distances'] = True
+        cached = ContextMaker('*', [AbrahamsonEtAl2014()], param)
+        for source in (src, src2):
+            [ctx] = cached.get_ctx_iter(source, sitecol)
+            [expected] = cmaker.get_ctx_iter(source, sitecol)
+            for name in expected.dtype.names:
+                numpy.testing.assert_array_equal(ctx[name], expected[name])
+        self.assertEqual(cached.ctx_cache.hits, 1)  # src2 reused src
+
+
 class PlanarDistancesTestCase(unittest.TestCase):
     """
     Test for calculation of planar distances
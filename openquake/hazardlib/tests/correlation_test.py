@@ -147,6 +147,25 @@ class JB2009ApplyCorrelationTestCase(unittest.TestCase):
               [0.51816327, 1.36481251, 0.86016437, 1.48732124, -1.01860545]],
              decimal=6)
 
+    def test_submatrix(self):
+        numpy.random.seed(13)
+        eps = numpy.random.normal(size=(3, 100000))
+        full = JB2009CorrelationModel(vs30_clustering=False)
+        sub = JB2009CorrelationModel(vs30_clustering=False, submatrix=True)
+
+        # on the complete site collection the two methods agree
+        aaae(sub.apply_correlation(self.SITECOL, PGA(), eps),
+             full.apply_correlation(self.SITECOL, PGA(), eps))
+
+        # on a filtered site collection the correlation is the exact one
+        filtered = self.SITECOL.filtered([0, 1])
+        res = sub.apply_correlation(filtered, PGA(), eps[:2])
+        numpy.testing.assert_almost_equal(
+            numpy.corrcoef(res),
+            sub._get_correlation_matrix(filtered, PGA()), decimal=2)
+        self.assertEqual(len(sub.subcache), 2)
+        self.assertEqual(len(full.subcache), 0)
+
 
 class HM2018CorrelationMatrixTestCase(unittest.TestCase):
     SITECOL = SiteCollection([Site(Point(2, -40), 1, 1, 1),
@@ -19,6 +19,7 @@ import numpy
 from openquake.hazardlib.geo import Point
 from openquake.hazardlib.geo.mesh import Mesh
 from openquake.hazardlib.geo import utils as geo_utils
+from openquake.hazardlib.geo.surface import planar
 from openquake.hazardlib.geo.surface.planar import PlanarSurface
 from openquake.hazardlib.tests.geo.surface import _planar_test_data as tdata
 from openquake.hazardlib.scalerel import WC1994
@@ -488,3 +489,28 @@ class PlanarSurfaceGetMiddlePointTestCase(unittest.TestCase):
         aac(midpoint.longitude, 0.0, atol=1E-4)
         aac(midpoint.latitude, 0.044966, atol=1E-4)
         aac(midpoint.depth, -4.0, atol=1E-4)
+
+
+class GetDistsPlanarTestCase(unittest.TestCase):
+    # the fused kernel must agree with the single distance functions
+    def test(self):
+        planin = numpy.zeros((2, 3), planar.planin_dt).view(numpy.recarray)
+        planin['mag'] = 6.
+        planin['strike'] = [[0., 45., 170.], [270., 300., 359.]]
+        planin['dip'] = [[90., 30., 60.], [45., 80., 20.]]
+        planin['rake'] = 90.
+        planin['rate'] = 1.
+        planin['area'] = 300.
+        hdd = numpy.array([[.5, 5.], [.5, 15.]])
+        arr = planar.build_planar(planin, hdd, 10., 45., 0., 20., 1.5)
+        arr = arr.reshape(-1, 3)  # shape (U, 3)
+        rng = numpy.random.default_rng(42)
+        lons = 10. + rng.uniform(-1, 1, 100)
+        lats = 45. + rng.uniform(-1, 1, 100)
+        points = geo_utils.spherical_to_cartesian(lons, lats, 0.)
+        codes = numpy.uint8(list(planar.DIST_CODES.values()))
+        dists = planar.get_dists_planar(arr, points, codes)
+        aac(dists[:3], planar.project(arr, points), atol=1E-6)
+        for d, name in enumerate(planar.DIST_CODES):
+            expected = getattr(planar, 'get_' + name)(arr, points)
+            aac(dists[3 + d], expected, atol=1E-6, err_msg=name)
@@ -69,6 +69,27 @@ class ModifiableGMPETest(unittest.TestCase):
             ModifiableGMPE(gmpe={'Campbell2003': {}},
                            set_between_epsilon={'epsilon_tau': 0.5})
 
+    def test_compute_batch(self):
+        # the original GMPE is computed once for the whole batch
+        gmpe = valid.gsim('YenierAtkinson2015BSSA')
+        gsims = [valid.modified_gsim(
+            gmpe, set_scale_total_sigma_scalar={'scaling_factor': factor})
+            for factor in [.8, 1., 1.2]]
+        gsims.append(valid.modified_gsim(
+            gmpe, set_scale_median_scalar={'scaling_factor': 1.5}))
+        cmaker = simple_cmaker(gsims, ['PGA', 'SA(1.0)'])
+        ctx = cmaker.new_ctx(4)
+        ctx.mag = 6.
+        ctx.rake = 0.
+        ctx.hypo_depth = 10.
+        ctx.occurrence_rate = .001
+        ctx.vs30 = 760.
+        ctx.rrup = np.array([1., 10., 30., 70.])
+        mean_stds = cmaker.get_mean_stds([ctx])  # (4, G, M, N)
+        for g, gsim in enumerate(cmaker.gsims):
+            aae(mean_stds[:, g], cmaker.get_4MN([ctx], gsim))
+        aae(mean_stds[1, 2], mean_stds[1, 1] * 1.2)
+
     def test_AkkarEtAlRjb2014(self):
         # check mean and stds
         gmm = valid.gsim('AkkarEtAlRjb2014')
@@ -262,6 +262,29 @@ class WithinBBoxTestCase(unittest.TestCase):
     def test1(self):
         assert_eq(self.sites.within_bbox((-182, -28, -178, -26)), [0])
 
+    def test_idxs(self):
+        bbox = (-182, -28, -178, -26)
+        idxs = self.sites.within_bbox(bbox, numpy.uint32([0, 2]))
+        assert_eq(idxs, [0])
+        idxs = self.sites.within_bbox(bbox, numpy.uint32([1, 3, 4]))
+        assert_eq(idxs, [])
+
+
+class WithinDistanceTestCase(unittest.TestCase):
+
+    def test(self):
+        lons, lats = numpy.meshgrid(numpy.arange(10., 12., .1),
+                                    numpy.arange(45., 47., .1))
+        sites = SiteCollection.from_points(lons.flatten(), lats.flatten())
+        lon, lat, dep = [10.5, 11.8], [45.5, 46.2], [10., 5.]
+        dists = [30., 50.]
+        idxs = sites.within_distance(lon, lat, dep, dists, eps=0)
+        nums = sites.count_within_distance(lon, lat, dep, dists, eps=0)
+        for p in range(2):
+            cdist = sites.get_cdist(Point(lon[p], lat[p], dep[p]))
+            assert_eq(idxs[p], numpy.where(cdist <= dists[p])[0])
+            self.assertEqual(nums[p], len(idxs[p]))
+
 
 class SiteCollectionIterTestCase(unittest.TestCase):
 
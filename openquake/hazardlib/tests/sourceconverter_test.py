@@ -17,11 +17,15 @@
 # along with OpenQuake.  If not, see <http://www.gnu.org/licenses/>.
 import os
 import io
+import shutil
+import tempfile
 import unittest.mock
 import numpy
 from openquake.baselib import hdf5
 from openquake.hazardlib import nrml
 from openquake.hazardlib.geo import Point
+from openquake.hazardlib.source_reader import (
+    read_cached_source_model, get_sm_cache_path)
 from openquake.hazardlib.sourceconverter import update_source_model, \
     SourceConverter
 
@@ -502,3 +506,79 @@ class MultiFaultSourceModelTestCase(unittest.TestCase):
         self.assertEqual(expected[1], sec['s2'].profiles[0].points[1])
         ssm = nrml.to_python(src_xml, conv)
         self.assertIsInstance(ssm, nrml.SourceModel)
+
+
+class CachedSourceModelTestCase(unittest.TestCase):
+    """ Tests the per-file cache of the converted source models """
+
+    def test_cache(self):
+        testfile = os.path.join(testdir, 'area-source.xml')
+        conv = SourceConverter(area_source_discretization=10.)
+        with tempfile.TemporaryDirectory() as cachedir:
+            sm = read_cached_source_model(testfile, conv, cachedir)
+            [path] = os.listdir(cachedir)
+            self.assertEqual(os.path.join(cachedir, path),
+                             get_sm_cache_path(testfile, conv, cachedir))
+            cached = read_cached_source_model(testfile, conv, cachedir)
+            self.assertEqual(cached.fname, testfile)
+            self.assertEqual(
+                [src.source_id for sg in cached.src_groups for src in sg],
+                [src.source_id for sg in sm.src_groups for src in sg])
+
+            # changing a parameter of the converter invalidates the cache
+            conv = SourceConverter(area_source_discretization=20.)
+            read_cached_source_model(testfile, conv, cachedir)
+            self.assertEqual(len(os.listdir(cachedir)), 2)
+
+    def test_cache_sibling_hdf5(self):
+        # the sibling .hdf5 file, if any, enters in the cache key
+        conv = SourceConverter(area_source_discretization=10.)
+        with tempfile.TemporaryDirectory() as tmp:
+            fname = os.path.join(tmp, 'area-source.xml')
+            shutil.copy(os.path.join(testdir, 'area-source.xml'), fname)
+            path1 = get_sm_cache_path(fname, conv, tmp)
+            with open(os.path.join(tmp, 'area-source.hdf5'), 'wb') as f:
+                f.write(b'1')
+            path2 = get_sm_cache_path(fname, conv, tmp)
+            with open(os.path.join(tmp, 'area-source.hdf5'), 'wb') as f:
+                f.write(b'2')
+            path3 = get_sm_cache_path(fname, conv, tmp)
+        self.assertEqual(len({path1, path2, path3}), 3)
+
+
+class StreamSourceModelTestCase(unittest.TestCase):
+    """ Tests the streaming conversion and the sharding of source models """
+
+    def setUp(self):
+        self.fname = os.path.join(testdir, 'mixed.xml')
+        self.conv = SourceConverter(area_source_discretization=10.)
+        self.expected = nrml.to_python(self.fname, self.conv)
+
+    def assertSameModel(self, sm, expected):
+        self.assertEqual(
+            [(sg.trt, [src.source_id for src in sg]) for sg in sm],
+            [(sg.trt, [src.source_id for src in sg]) for sg in expected])
+        self.assertEqual(sm.name, expected.name)
+        self.assertEqual([sg.max_mag for sg in sm],
+                         [sg.max_mag for sg in expected])
+
+    def test_stream(self):
+        sm = nrml.stream_source_model(self.fname, self.conv)
+        self.assertSameModel(sm, self.expected)
+
+    def test_shards(self):
+        # with a tiny shard size each source ends up in its own shard
+        shards = nrml.get_source_shards(self.fname, shard_size=1)
+        self.assertEqual([grp_idx for grp_idx, ranges in shards],
+                         [0, 1, 2, 2, 3, 3, 3])
+        pairs = []
+        for grp_idx, ranges in shards:
+            data = nrml.read_source_shard(self.fname, ranges)
+            sm = nrml.stream_source_model(
+                io.BytesIO(data), self.conv, self.fname)
+            pairs.append((grp_idx, sm))
+        self.assertSameModel(nrml.merge_source_shards(pairs), self.expected)
+
+        # with a large shard size there is a shard per group
+        shards = nrml.get_source_shards(self.fname, shard_size=10 ** 6)
+        self.assertEqual(len(shards), 4)
@@ -1,7 +1,8 @@
 import unittest
 import numpy
 from openquake.hazardlib.stats import (
-    mean_curve, quantile_curve, std_curve, weighted_quantiles)
+    mean_curve, quantile_curve, std_curve, weighted_quantiles,
+    ndtr, truncnorm_sf, truncnorm_sf_table, truncnorm_sf_interp)
 
 aaae = numpy.testing.assert_array_almost_equal
 
@@ -117,6 +118,24 @@ class QuantileCurveTestCase(unittest.TestCase):
 
         numpy.testing.assert_allclose(expected_curve, actual_curve)
 
+    def test_compute_quantile_curve_3d(self):
+        # the quantile of a (R, N, L) array must be the same as the
+        # interpolated CDF computed element by element
+        rng = numpy.random.default_rng(42)
+        curves = rng.random((5, 3, 4))
+        curves[:, 0] = .5  # constant curves for the first site
+        weights = numpy.array([0.1, 0.2, 0.3, 0.15, 0.25])
+        for quantile in (0., 0.15, 0.5, 0.85, 1.):
+            actual = quantile_curve(quantile, curves, weights)
+            expected = numpy.zeros((3, 4))
+            for n in range(3):
+                for li in range(4):
+                    order = numpy.argsort(curves[:, n, li])
+                    expected[n, li] = numpy.interp(
+                        quantile, weights[order].cumsum(),
+                        curves[order, n, li])
+            aaae(actual, expected)
+
     def test_weighted_quantiles(self):
         data1 = [10, 20, 30, 40, 50, 60, 70, 80, 90]
         weig1 = [.01] * 9
@@ -127,3 +146,20 @@ class QuantileCurveTestCase(unittest.TestCase):
         qs = weighted_quantiles([.05, .95], data1 + data2 + data3,
                                 weig1 + weig2 + weig3)
         numpy.testing.assert_allclose(qs, [20.375, 70.925])
+
+
+class TruncnormSfTestCase(unittest.TestCase):
+
+    def test_interp(self):
+        eps = numpy.linspace(-10, 10, 100_001)
+        for truncation_level in [1., 2., 3., 99.]:
+            exact = truncnorm_sf(ndtr(truncation_level), eps)
+            table, xmax = truncnorm_sf_table(truncation_level)
+            approx = truncnorm_sf_interp(table, xmax, eps)
+            self.assertLess(numpy.abs(approx - exact).max(), 1E-7)
+
+    def test_nan(self):
+        table, xmax = truncnorm_sf_table(3.)
+        vals = truncnorm_sf_interp(table, xmax, numpy.array([numpy.nan, 0.]))
+        self.assertTrue(numpy.isnan(vals[0]))
+        self.assertAlmostEqual(vals[1], .5)
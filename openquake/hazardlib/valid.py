@@ -316,7 +316,8 @@ class Choices(Choice):
         return tuple(values)
 
 
-export_formats = Choices('', 'xml', 'geojson', 'txt', 'csv', 'npz', 'hdf5')
+export_formats = Choices('', 'xml', 'geojson', 'txt', 'csv', 'npz', 'hdf5',
+                         'parquet')
 
 
 class Regex(object):
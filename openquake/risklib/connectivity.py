@@ -31,11 +31,16 @@
 from dataclasses import dataclass
 import pandas as pd
 import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
 try:
     import networkx as nx
 except ImportError:
     nx = None
 import logging
+from openquake.baselib import parallel
+
+MAX_DISTANCES = 10_000_000  # maximum size of a block of distances
 
 
 @dataclass
@@ -45,10 +50,6 @@ class Out:
     """
     cl: pd.DataFrame
     node_el: pd.DataFrame
-    ccl_table: pd.DataFrame
-    pcl_table: pd.DataFrame
-    wcl_table: pd.DataFrame
-    eff_table: pd.DataFrame
     event_connectivity_loss_ccl: pd.DataFrame
     event_connectivity_loss_pcl: pd.DataFrame
     event_connectivity_loss_wcl: pd.DataFrame
@@ -59,31 +60,29 @@ class Out:
     avg_connectivity_loss_eff = 0
 
     @classmethod
-    def new(cls, expo_df, nodes, eff_nodes, kind):
-        assert kind in ('taz', 'demand'), kind
-        t0 = expo_df[expo_df['purpose'].str.lower() == kind].iloc[:, 0:1]
-        t1 = expo_df[expo_df['type'].str.lower() == 'node'].iloc[:, 0:1]
-
-        t2 = pd.DataFrame({'id': nodes})
-        t2.set_index('id', inplace=True)
-        t3 = pd.DataFrame({'id': nodes})
-        t3.set_index('id', inplace=True)
-        t4 = pd.DataFrame({'id': nodes})
-        t4.set_index('id', inplace=True)
-        t5 = pd.DataFrame({'id': eff_nodes})
-        t5.set_index('id', inplace=True)
-
-        # Create empty dataframes with columns "event_id" and
-        # "CCL"/"PCL"/"WCL"/"EL"
-        t6 = pd.DataFrame(
-            {'event_id': pd.Series(dtype=int), 'CCL': pd.Series(dtype=float)})
-        t7 = pd.DataFrame(
-            {'event_id': pd.Series(dtype=int), 'PCL': pd.Series(dtype=float)})
-        t8 = pd.DataFrame(
-            {'event_id': pd.Series(dtype=int), 'WCL': pd.Series(dtype=float)})
-        t9 = pd.DataFrame(
-            {'event_id': pd.Series(dtype=int), 'EL': pd.Series(dtype=float)})
-        return cls(t0, t1, t2, t3, t4, t5, t6, t7, t8, t9)
+    def new(cls, graph, targets, res, columns):
+        """
+        Build the outputs from the results of the connectivity tasks
+
+        :param graph: a CompactGraph
+        :param targets: indices of the demand or TAZ nodes
+        :param res: a dictionary of arrays returned by run_connectivity
+        :param columns: the node level indicators to store in .cl
+        """
+        cl = pd.DataFrame({'id': [graph.ids[i] for i in targets]})
+        for col in columns:
+            cl[col] = res[col]
+        dfs = {}
+        for col in ('CCL', 'PCL', 'WCL', 'EL'):
+            if col in res:
+                dfs[col] = pd.DataFrame(
+                    {'event_id': res['event_id'], col: res[col]})
+            else:  # not computed
+                dfs[col] = pd.DataFrame({'event_id': pd.Series(dtype=int),
+                                         col: pd.Series(dtype=float)})
+        return cls(cl.sort_values('id', ignore_index=True),
+                   get_node_el(graph, res),
+                   dfs['CCL'], dfs['PCL'], dfs['WCL'], dfs['EL'])
 
 
 def get_exposure_df(dstore):
@@ -198,7 +197,8 @@ def analyze_taz_nodes(dstore, exposure_df, G_original, TAZ_nodes, eff_nodes,
                       damage_df, g_type, calculation_mode):
     taz_nodes_analysis_results = {}
     o = ELWCLPCLloss_TAZ(
-        exposure_df, G_original, TAZ_nodes, eff_nodes, damage_df, g_type)
+        exposure_df, G_original, TAZ_nodes, eff_nodes, damage_df, g_type,
+        dstore)
     sum_connectivity_loss_pcl = o.event_connectivity_loss_pcl['PCL'].sum()
     sum_connectivity_loss_wcl = o.event_connectivity_loss_wcl['WCL'].sum()
     sum_connectivity_loss_eff = o.event_connectivity_loss_eff['EL'].sum()
@@ -225,9 +225,6 @@ def analyze_taz_nodes(dstore, exposure_df, G_original, TAZ_nodes, eff_nodes,
         o.cl["WCL_node"] /= num_events
         o.node_el["EL"] /= num_events
 
-    o.cl.drop(columns=['ordinal'], inplace=True)
-    o.node_el.drop(columns=['ordinal'], inplace=True)
-
     for result in [
             'avg_connectivity_loss_pcl', 'avg_connectivity_loss_wcl',
             'avg_connectivity_loss_eff',
@@ -246,7 +243,7 @@ def analyze_demand_nodes(dstore, exposure_df, G_original, eff_nodes,
     demand_nodes_analysis_results = {}
     o = ELWCLPCLCCL_demand(
         exposure_df, G_original, eff_nodes, demand_nodes, source_nodes,
-        damage_df, g_type)
+        damage_df, g_type, dstore)
     sum_connectivity_loss_ccl = o.event_connectivity_loss_ccl['CCL'].sum()
     sum_connectivity_loss_pcl = o.event_connectivity_loss_pcl['PCL'].sum()
     sum_connectivity_loss_wcl = o.event_connectivity_loss_wcl['WCL'].sum()
@@ -281,9 +278,6 @@ def analyze_demand_nodes(dstore, exposure_df, G_original, eff_nodes,
         o.cl["WCL_node"] /= num_events
         o.node_el["EL"] /= num_events
 
-    o.cl.drop(columns=['ordinal'], inplace=True)
-    o.node_el.drop(columns=['ordinal'], inplace=True)
-
     for result in [
             'avg_connectivity_loss_ccl', 'avg_connectivity_loss_pcl',
             'avg_connectivity_loss_wcl', 'avg_connectivity_loss_eff',
@@ -300,7 +294,7 @@ def analyze_generic_nodes(dstore, exposure_df, G_original, eff_nodes,
                           damage_df, g_type, calculation_mode):
     generic_nodes_analysis_results = {}
     node_el, event_connectivity_loss_eff = EL_node(
-        exposure_df, G_original, eff_nodes, damage_df, g_type)
+        exposure_df, G_original, eff_nodes, damage_df, g_type, dstore)
     sum_connectivity_loss_eff = event_connectivity_loss_eff['EL'].sum()
 
     if calculation_mode == "event_based_damage":
@@ -316,8 +310,6 @@ def analyze_generic_nodes(dstore, exposure_df, G_original, eff_nodes,
         avg_connectivity_loss_eff = sum_connectivity_loss_eff/num_events
         node_el["EL"] /= num_events
 
-    node_el.drop(columns=['ordinal'], inplace=True)
-
     for result in [
             'avg_connectivity_loss_eff',
             'event_connectivity_loss_eff',
@@ -327,89 +319,259 @@ def analyze_generic_nodes(dstore, exposure_df, G_original, eff_nodes,
     return generic_nodes_analysis_results
 
 
-def cleanup_graph(G_original, event_damage_df, g_type):
-    # Making a copy of original graph for each event for the analysis
-    G = G_original.copy()
-
-    nodes_damage_df = event_damage_df.loc[
-        event_damage_df.type.str.lower() == "node"].droplevel(level=0)
-    edges_damage_df = event_damage_df.loc[
-        event_damage_df.type.str.lower() == "edge"].droplevel(level=0)
-
-    # Updating the graph to remove damaged edges and nodes
-    nonfunctional_edges_df = edges_damage_df.loc[
-        ~edges_damage_df.is_functional]
-    nonfunctional_nodes_df = nodes_damage_df.loc[
-        ~nodes_damage_df.is_functional]
+class CompactGraph(object):
+    """
+    A graph stored as arrays of edges, from which the CSR adjacency matrix
+    of the graph without the damaged nodes and edges of an event is built.
 
-    # This is done to handle the the multi graph where more that one edge
-    # is possible between two nodes.
-    # If it is a multi graph then every edge has a key value
+    :param G: a networkx graph with the edge attribute "id"
+    """
+    def __init__(self, G):
+        self.ids = list(G.nodes)
+        self.idx = {node: i for i, node in enumerate(self.ids)}
+        self.N = len(self.ids)
+        self.directed = G.is_directed()
+        # if no weight is given the weight of each edge is considered one
+        self.weighted = bool(nx.get_edge_attributes(G, 'weight'))
+        edges = list(G.edges(data=True))
+        self.src = np.array([self.idx[u] for u, _, _ in edges], int)
+        self.dst = np.array([self.idx[v] for _, v, _ in edges], int)
+        self.weight = np.nan_to_num(
+            np.array([data.get('weight', 1) if self.weighted else 1
+                      for _, _, data in edges], float), nan=1.)
+        self.edge_ids = [data['id'] for _, _, data in edges]
+
+    def csr(self, dead_nodes=(), dead_edges=()):
+        """
+        :param dead_nodes: indices of the nonfunctional nodes
+        :param dead_edges: indices of the nonfunctional edges
+        :returns: the CSR adjacency matrix of the remaining graph
+        """
+        # NB: indexing with an empty tuple would select all the elements
+        ok = np.ones(len(self.src), bool)
+        if len(dead_edges):
+            ok[dead_edges] = False
+        if len(dead_nodes):
+            dead = np.zeros(self.N, bool)
+            dead[dead_nodes] = True
+            ok &= ~dead[self.src] & ~dead[self.dst]
+        src, dst, weight = self.src[ok], self.dst[ok], self.weight[ok]
+        # among parallel edges keep the lightest one, since the CSR
+        # constructor would sum the weights of duplicated entries
+        order = np.lexsort((weight, dst, src))
+        src, dst, weight = src[order], dst[order], weight[order]
+        first = np.ones(len(src), bool)
+        first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+        return csr_matrix((weight[first], (src[first], dst[first])),
+                          shape=(self.N, self.N))
+
+    def _blocks(self, nodes):
+        # split the nodes so that the distance matrices are not too large
+        size = max(1, MAX_DISTANCES // max(self.N, 1))
+        for start in range(0, len(nodes), size):
+            yield nodes[start:start + size]
+
+    def distances(self, csr, nodes):
+        """
+        :returns: the lengths of the shortest paths from the given nodes
+                  (inf if there is no path)
+        """
+        return shortest_path(csr, directed=self.directed,
+                             unweighted=not self.weighted, indices=nodes)
+
+    def efficiency(self, csr, alive):
+        """
+        :param csr: the adjacency matrix
+        :param alive: boolean array, False for the nonfunctional nodes
+        :returns: the efficiency of each node, i.e. the sum of the inverse
+                  distances to the reachable nodes divided by N-1
+        """
+        eff = np.zeros(self.N)
+        for block in self._blocks(np.where(alive)[0]):
+            eff[block] = _inverse(self.distances(csr, block)).sum(axis=1)
+        return eff / (self.N - 1)
+
+    def reach(self, csr, sources, targets, exclude_self):
+        """
+        :param csr: the adjacency matrix
+        :param sources: indices of the source nodes
+        :param targets: indices of the target nodes
+        :param exclude_self: if True, a node does not reach itself
+        :returns: for each target the number of sources with a path to it
+                  and the sum of the inverse distances from the sources
+        """
+        ns = np.zeros(len(targets))
+        inv = np.zeros(len(targets))
+        for block in self._blocks(sources):
+            dist = self.distances(csr, block)[:, targets]
+            conn = np.isfinite(dist)
+            if exclude_self:
+                conn &= block[:, None] != targets
+            ns += conn.sum(axis=0)
+            inv += _inverse(dist).sum(axis=0)
+        return ns, inv
+
+
+def _inverse(dist):
+    # inverse of the finite, nonzero distances, 0 otherwise
+    inv = np.zeros_like(dist)
+    ok = np.isfinite(dist) & (dist != 0)
+    inv[ok] = 1. / dist[ok]
+    return inv
+
+
+def _ratio_loss(value, value0):
+    # 1 - value / value0, NaN when value0 is zero and value too
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1. - value / value0
+
+
+def _mean(arr):
+    # mean skipping the NaNs, as in pandas
+    arr = arr[~np.isnan(arr)]
+    return arr.mean() if len(arr) else np.nan
+
+
+def get_state(graph, kind, sources, targets, dead_nodes=(), dead_edges=()):
+    """
+    :returns: a dictionary with the connectivity indicators of each node
+              after removing the given nodes and edges
+    """
+    alive = np.ones(graph.N, bool)
+    if len(dead_nodes):
+        alive[dead_nodes] = False
+    csr = graph.csr(dead_nodes, dead_edges)
+    state = {'Eff': graph.efficiency(csr, alive)}
+    if kind == 'generic':
+        return state
+    # some sources and targets may have been eliminated from the network
+    # due to damage, so their functionalities are not checked
+    ns, inv = graph.reach(csr, sources[alive[sources]], targets,
+                          exclude_self=kind == 'taz')
+    ns[~alive[targets]] = 0
+    inv[~alive[targets]] = 0
+    state['NS'] = ns  # number of connected sources
+    state['WS'] = inv * ns  # weighted number of connected sources
+    state['CNS'] = (ns > 0).astype(float)  # connected to any source
+    return state
+
+
+def empty_result(graph, kind, targets):
+    """
+    :returns: a dictionary with lists of losses by event and arrays of
+              losses by node, to be filled
+    """
+    res = {'event_id': [], 'EL': [], 'EL_node': np.zeros(graph.N)}
+    if kind != 'generic':
+        for col in ('PCL', 'WCL'):
+            res[col] = []
+            res[col + '_node'] = np.zeros(len(targets))
+    if kind == 'demand':
+        res['CCL'] = []
+        res['Isolation_node'] = np.zeros(len(targets))
+    return res
+
+
+def connectivity_task(events, graph, kind, sources, targets, state0,
+                      monitor):
+    """
+    Compute the connectivity losses for a chunk of events
+
+    :param events: a list of triples (event_id, dead_nodes, dead_edges)
+    :param graph: a CompactGraph
+    :param kind: 'demand', 'taz' or 'generic'
+    :param sources: indices of the source (or TAZ) nodes
+    :param targets: indices of the demand (or TAZ) nodes
+    :param state0: the state of the network before the earthquake
+    :param monitor: a Monitor instance
+    :returns: a dictionary with the losses by event and the sum of
+              the losses by node
+    """
+    eff0 = state0['Eff']
+    res = empty_result(graph, kind, targets)
+    for event_id, dead_nodes, dead_edges in events:
+        state = get_state(graph, kind, sources, targets,
+                          dead_nodes, dead_edges)
+        res['event_id'].append(event_id)
+        # if the initial graph has a disconnected node, its efficiency
+        # loss is zero
+        with np.errstate(divide='ignore', invalid='ignore'):
+            el = np.where(eff0 != 0, (eff0 - state['Eff']) / eff0, 0.)
+        res['EL_node'] += el
+        res['EL'].append((eff0.mean() - state['Eff'].mean()) / eff0.mean())
+        if kind == 'generic':
+            continue
+        pcl = _ratio_loss(state['NS'], state0['NS'])
+        wcl = _ratio_loss(state['WS'], state0['WS'])
+        res['PCL'].append(_mean(pcl))
+        res['WCL'].append(_mean(wcl))
+        res['PCL_node'] += np.nan_to_num(pcl, nan=0.)
+        res['WCL_node'] += np.nan_to_num(wcl, nan=0.)
+        if kind == 'demand':
+            res['CCL'].append(
+                1. - state['CNS'].sum() / state0['CNS'].sum())
+            res['Isolation_node'] += 1. - state['CNS']
+    return res
+
+
+def get_events(graph, damage_df):
+    """
+    :returns: a list of triples (event_id, dead_nodes, dead_edges)
+    """
+    edges = {}  # edge ID -> indices of the graph edges
+    for i, edge_id in enumerate(graph.edge_ids):
+        edges.setdefault(edge_id, []).append(i)
+    dead = damage_df.loc[~damage_df.is_functional].reset_index()
+    is_node = dead.type.str.lower() == 'node'
+    dead_nodes = {eid: [graph.idx[n] for n in df.id if n in graph.idx]
+                  for eid, df in dead[is_node].groupby('event_id')}
+    is_edge = dead.type.str.lower() == 'edge'
+    dead_edges = {eid: [i for e in df.id for i in edges.get(e, [])]
+                  for eid, df in dead[is_edge].groupby('event_id')}
+    eids = damage_df.index.get_level_values('event_id').unique()
+    return [(eid, np.array(dead_nodes.get(eid, []), int),
+             np.array(dead_edges.get(eid, []), int)) for eid in eids]
+
+
+def run_connectivity(dstore, G_original, damage_df, kind,
+                     source_nodes=(), target_nodes=()):
+    """
+    Compute the connectivity losses for all the events in parallel
 
-    if g_type in ["MultiGraph", "MultiDiGraph"]:
-        edges_to_remove = [
-            (u, v, key)
-            for (u, v, key, data) in G.edges(keys=True, data=True)
-            if data['id'] in nonfunctional_edges_df.index.to_list()]
-    else:
-        edges_to_remove = [
-            (u, v) for (u, v, data) in G.edges(data=True)
-            if data['id'] in nonfunctional_edges_df.index.to_list()]
-
-    G.remove_edges_from(edges_to_remove)
-    G.remove_nodes_from(nonfunctional_nodes_df.index.to_list())
-
-    return G
-
-
-def calc_weighted_connectivity_loss(
-        graph, att, nodes_from, nodes_to, wcl_table, pcl_table, ws, ns):
-    # For calculating weighted connectivity loss
-    # Important: if the weight is not provided, then the weight of each edges
-    # is considered to be one.
-    for i in nodes_to:
-        if not att:
-            path_lengths = [
-                nx.shortest_path_length(graph, j, i)
-                for j in nodes_from if nx.has_path(graph, j, i)]
-            countw = sum(
-                [1/path_length for path_length in path_lengths
-                 if path_length != 0])
-        else:
-            path_lengths = [
-                nx.shortest_path_length(graph, j, i, weight='weight')
-                for j in nodes_from if nx.has_path(graph, j, i)]
-            countw = sum(
-                [1/path_length for path_length in path_lengths
-                 if path_length != 0])
-        wcl_table.at[i, ws] = countw * pcl_table.at[i, ns]
-    return wcl_table
-
-
-def calc_efficiency(graph, N, att, eff_table, eff):
-    # For calculating efficiency
-    # Important: If the weight is not provided, then the weight of each edges
-    # is considered to be one.
-    for node in graph:
-        if not att:
-            lengths = nx.single_source_shortest_path_length(graph, node)
-            inv = [1/x for x in lengths.values() if x != 0]
-            eff_node = (sum(inv))/(N-1)
-        else:
-            lengths = nx.single_source_dijkstra_path_length(
-                graph, node, weight="weight")
-            inv = [1/x for x in lengths.values() if x != 0]
-            eff_node = (sum(inv))/(N-1)
-        eff_table.at[node, eff] = eff_node
-
-    if eff == 'Eff':
-        # This is done so that if the initial graph has a node disconnected,
-        # will raise an error when calculating the efficiency loss
-        eff_table['EL'] = (
-            eff_table.Eff0 - eff_table.Eff)/eff_table.Eff0.replace({0: np.nan})
-        eff_table['EL'] = eff_table['EL'].fillna(0)
-
-    return eff_table
+    :returns: (CompactGraph, target indices, dictionary of results)
+    """
+    graph = CompactGraph(G_original)
+    sources = np.array([graph.idx[n] for n in source_nodes], int)
+    targets = np.array([graph.idx[n] for n in target_nodes], int)
+    state0 = get_state(graph, kind, sources, targets)
+    events = get_events(graph, damage_df)
+    logging.info('Checking {:_d} events after earthquake'.format(
+        len(events)))
+    res = empty_result(graph, kind, targets)
+    smap = parallel.Starmap.apply(
+        connectivity_task, (events, graph, kind, sources, targets, state0),
+        concurrent_tasks=dstore['oqparam'].concurrent_tasks,
+        weight=lambda ev: len(ev[1]) + len(ev[2]) + 1, h5=dstore.hdf5)
+    for dic in smap:
+        for key, val in dic.items():
+            if key.endswith('_node'):
+                res[key] += val
+            else:
+                res[key].extend(val)
+    # sort by event ID, since the tasks complete in any order
+    order = np.argsort(res['event_id'])
+    for key, val in res.items():
+        if not key.endswith('_node'):
+            res[key] = np.array(val)[order]
+    return graph, targets, res
+
+
+def get_node_el(graph, res):
+    """
+    :returns: a DataFrame with the efficiency loss of the nodes
+    """
+    node_el = pd.DataFrame({'id': graph.ids, 'EL': res['EL_node']})
+    return node_el.sort_values('id', ignore_index=True)
 
 
 def analysis(dstore):
@@ -461,304 +623,35 @@ def analysis(dstore):
 
 
 def ELWCLPCLCCL_demand(expo_df, G_original, eff_nodes, demand_nodes,
-                       source_nodes, damage_df, g_type):
+                       source_nodes, damage_df, g_type, dstore):
     # Classic one where particular nodes are divided as supply or demand and
     # the main interest is to check the serviceability of supply to demand
     # nodes. This calculates, complete connectivity loss (CCL), weighted
     # connectivity loss (WCL), partial connectivity loss(PCL) considering the
     # demand and supply nodes provided at nodal and global level. Additionly,
     # efficiency loss globally and for each node is also calculated
-
-    # To store the information of the performance indicators at connectivity
-    # level
-    o = Out.new(expo_df, demand_nodes, eff_nodes, 'demand')
-
-    # To check the the values for each node before the earthquake event
-
-    # For calculating complete connectivity Loss
-    o.ccl_table.loc[demand_nodes, 'CNO'] = [
-        1 if any(nx.has_path(G_original, j, i) for j in source_nodes) else 0
-        for i in demand_nodes]
-
-    # For calculating partial connectivity loss
-    o.pcl_table.loc[demand_nodes, 'NS0'] = [
-        sum(nx.has_path(G_original, j, i) for j in source_nodes)
-        for i in demand_nodes]
-
-    att = nx.get_edge_attributes(G_original, 'weight')
-    o.wcl_table = calc_weighted_connectivity_loss(
-        G_original, att, source_nodes, demand_nodes, o.wcl_table, o.pcl_table,
-        'WS0', 'NS0')
-
-    N = len(G_original)
-    att = nx.get_edge_attributes(G_original, 'weight')
-    o.eff_table = calc_efficiency(G_original, N, att, o.eff_table, 'Eff0')
-
-    logging.info('Checking for every event after earthquake')
-    for event_id, event_damage_df in damage_df.groupby("event_id"):
-        update_demand(o, event_id, event_damage_df, G_original, g_type,
-                      source_nodes, demand_nodes, eff_nodes, N, att)
-    return o
-
-
-def update_demand(o, event_id, event_damage_df, G_original, g_type,
-                  source_nodes, demand_nodes, eff_nodes, N, att):
-    G = cleanup_graph(G_original, event_damage_df, g_type)
-
-    # Checking if there is a path between any souce to each demand node.
-    # Some demand nodes and source nodes may have been eliminated from
-    # the network due to damage, so we do not need to check their
-    # functionalities
-    extant_source_nodes = set(source_nodes) & set(G.nodes)
-    extant_demand_nodes = sorted(set(demand_nodes) & set(G.nodes))
-    extant_eff_nodes = sorted(set(eff_nodes) & set(G.nodes))
-
-    # If demand nodes are damaged itself (Example, building collapsed where
-    # demand node is considered)
-
-    o.ccl_table.loc[~o.ccl_table.index.isin(extant_demand_nodes), 'CNS'] = 0
-    o.pcl_table.loc[~o.pcl_table.index.isin(extant_demand_nodes), 'NS'] = 0
-    o.wcl_table.loc[~o.wcl_table.index.isin(extant_demand_nodes), 'WS'] = 0
-    o.eff_table.loc[~o.eff_table.index.isin(extant_eff_nodes), 'Eff'] = 0
-
-    # To check the the values for each node after the earthquake event
-    # Complete connectivity loss
-    o.ccl_table.loc[extant_demand_nodes, 'CNS'] = [
-        1 if any(nx.has_path(G, j, i) for j in extant_source_nodes) else 0
-        for i in extant_demand_nodes]
-
-    # Partial Connectivity Loss
-    o.pcl_table.loc[extant_demand_nodes, 'NS'] = [
-        sum(nx.has_path(G, j, i) for j in extant_source_nodes)
-        for i in extant_demand_nodes]
-
-    o.wcl_table = calc_weighted_connectivity_loss(
-        G, att, extant_source_nodes, extant_demand_nodes, o.wcl_table,
-        o.pcl_table, 'WS', 'NS')
-
-    o.eff_table = calc_efficiency(G, N, att, o.eff_table, 'Eff')
-
-    # Connectivity Loss for each node
-    o.pcl_table['PCL_node'] = 1 - (o.pcl_table['NS']/o.pcl_table['NS0'])
-    o.wcl_table['WCL_node'] = 1 - (o.wcl_table['WS']/o.wcl_table['WS0'])
-
-    # Computing the mean of the connectivity loss to consider the overall
-    # performance of the area (at global level)
-    CCL_per_event = 1 - ((o.ccl_table['CNS'].sum())/
-                         o.ccl_table['CNO'].sum())
-    PCL_mean_per_event = o.pcl_table['PCL_node'].mean()
-    WCL_mean_per_event = o.wcl_table['WCL_node'].mean()
-    Glo_eff0_per_event = o.eff_table['Eff0'].mean()
-    Glo_eff_per_event = o.eff_table['Eff'].mean()
-    # Calculation of Efficiency loss
-    Glo_effloss_per_event = (
-        Glo_eff0_per_event - Glo_eff_per_event) / Glo_eff0_per_event
-
-    # Storing the value of performance indicators for each event
-    o.event_connectivity_loss_ccl = pd.concat(
-        [o.event_connectivity_loss_ccl, pd.DataFrame.from_records(
-            [{'event_id': event_id, 'CCL': CCL_per_event}])],
-        ignore_index=True)
-    o.event_connectivity_loss_pcl = pd.concat(
-        [o.event_connectivity_loss_pcl, pd.DataFrame.from_records(
-            [{'event_id': event_id, 'PCL': PCL_mean_per_event}])],
-        ignore_index=True)
-    o.event_connectivity_loss_wcl = pd.concat(
-        [o.event_connectivity_loss_wcl, pd.DataFrame.from_records(
-            [{'event_id': event_id, 'WCL': WCL_mean_per_event}])],
-        ignore_index=True)
-    o.event_connectivity_loss_eff = pd.concat(
-        [o.event_connectivity_loss_eff, pd.DataFrame.from_records(
-            [{'event_id': event_id, 'EL': Glo_effloss_per_event}])],
-        ignore_index=True)
-
-    # To store the sum of performance indicator at nodal level to calulate
-    # the average afterwards
-    o.ccl_table['Isolation_node'] = 1 - o.ccl_table['CNS']
-    ccl_table1 = o.ccl_table.drop(columns=['CNO', 'CNS'])
-    o.cl = pd.concat((o.cl, ccl_table1.reset_index())).groupby(
-        'id', as_index=False).sum()
-
-    pcl_table1 = o.pcl_table.drop(columns=['NS0', 'NS'])
-    o.cl = pd.concat((o.cl, pcl_table1.reset_index())).groupby(
-        'id', as_index=False).sum()
-
-    wcl_table1 = o.wcl_table.drop(columns=['WS0', 'WS'])
-    o.cl = pd.concat((o.cl, wcl_table1.reset_index())).groupby(
-        'id', as_index=False).sum()
-
-    eff_table1 = o.eff_table.drop(columns=['Eff0', 'Eff'])
-    o.node_el = pd.concat((o.node_el, eff_table1.reset_index())).groupby(
-        'id', as_index=False).sum()
-
-
-def update_taz(o, event_id, event_damage_df, G_original, g_type,
-               TAZ_nodes, eff_nodes, N, att):
-    G = cleanup_graph(G_original, event_damage_df, g_type)
-
-    # Checking if there is a path between any souce to each demand node.
-    # Some demand nodes and source nodes may have been eliminated from
-    # the network due to damage, so we do not need to check their
-    # functionalities
-    extant_TAZ_nodes = sorted(set(TAZ_nodes) & set(G.nodes))
-    extant_eff_nodes = sorted(set(eff_nodes) & set(G.nodes))
-
-    # If demand nodes are damaged itself (Example, building collapsed where
-    # demand node is considered)
-    o.pcl_table.loc[~o.pcl_table.index.isin(extant_TAZ_nodes), 'NS'] = 0
-    o.wcl_table.loc[~o.wcl_table.index.isin(extant_TAZ_nodes), 'WS'] = 0
-    o.eff_table.loc[~o.eff_table.index.isin(extant_eff_nodes), 'Eff'] = 0
-
-    for i in extant_TAZ_nodes:
-        count = 0
-        for j in extant_TAZ_nodes:
-            if i != j:
-                if nx.has_path(G, j, i):
-                    count = count + 1
-        o.pcl_table.at[i, 'NS'] = count
-
-    o.wcl_table = calc_weighted_connectivity_loss(
-        G, att, extant_TAZ_nodes, extant_TAZ_nodes,
-        o.wcl_table, o.pcl_table, 'WS', 'NS')
-
-    o.eff_table = calc_efficiency(G, N, att, o.eff_table, 'Eff')
-
-    # Connectivity Loss for each node
-    o.pcl_table['PCL_node'] = 1 - (o.pcl_table['NS'] / o.pcl_table['NS0'])
-    o.wcl_table['WCL_node'] = 1 - (o.wcl_table['WS'] / o.wcl_table['WS0'])
-
-    # Computing the mean of the connectivity loss to consider the overall
-    # performance of the area (at global level)
-    PCL_mean_per_event = o.pcl_table['PCL_node'].mean()
-    WCL_mean_per_event = o.wcl_table['WCL_node'].mean()
-    Glo_eff0_per_event = o.eff_table['Eff0'].mean()
-    Glo_eff_per_event = o.eff_table['Eff'].mean()
-    Glo_effloss_per_event = (
-        Glo_eff0_per_event - Glo_eff_per_event)/Glo_eff0_per_event
-
-    # Storing the value of performance indicators for each event
-    o.event_connectivity_loss_pcl = pd.concat(
-        [o.event_connectivity_loss_pcl, pd.DataFrame.from_records(
-            [{'event_id': event_id, 'PCL': PCL_mean_per_event}])],
-        ignore_index=True)
-    o.event_connectivity_loss_wcl = pd.concat(
-        [o.event_connectivity_loss_wcl, pd.DataFrame.from_records(
-            [{'event_id': event_id, 'WCL': WCL_mean_per_event}])],
-        ignore_index=True)
-    o.event_connectivity_loss_eff = pd.concat(
-        [o.event_connectivity_loss_eff, pd.DataFrame.from_records(
-            [{'event_id': event_id, 'EL': Glo_effloss_per_event}])],
-        ignore_index=True)
-
-    # To store the sum of performance indicator at nodal level to calculate
-    # the average afterwards
-    pcl_table1 = o.pcl_table.drop(columns=['NS0', 'NS'])
-    o.cl = pd.concat((o.cl, pcl_table1.reset_index())).groupby(
-        'id', as_index=False).sum()
-
-    wcl_table1 = o.wcl_table.drop(columns=['WS0', 'WS'])
-    o.cl = pd.concat((o.cl, wcl_table1.reset_index())).groupby(
-        'id', as_index=False).sum()
-
-    eff_table1 = o.eff_table.drop(columns=['Eff0', 'Eff'])
-    o.node_el = pd.concat((o.node_el, eff_table1.reset_index())).groupby(
-        'id', as_index=False).sum()
+    graph, targets, res = run_connectivity(
+        dstore, G_original, damage_df, 'demand', source_nodes, demand_nodes)
+    return Out.new(graph, targets, res,
+                   ['Isolation_node', 'PCL_node', 'WCL_node'])
 
 
 def ELWCLPCLloss_TAZ(expo_df, G_original, TAZ_nodes,
-                     eff_nodes, damage_df, g_type):
+                     eff_nodes, damage_df, g_type, dstore):
     # When the nodes acts as both demand and supply.
     # For example, traffic analysis zone in transportation network. This
     # calculates, efficiency loss (EL),
     # weighted connectivity loss (WCL),partial connectivity loss(PCL).
+    graph, targets, res = run_connectivity(
+        dstore, G_original, damage_df, 'taz', TAZ_nodes, TAZ_nodes)
+    return Out.new(graph, targets, res, ['PCL_node', 'WCL_node'])
 
-    # To store the information of the performance indicators at connectivity
-    # level
-    o = Out.new(expo_df, TAZ_nodes, eff_nodes, 'taz')
-
-    # To check the the values for each node before the earthquake event
-
-    # For calculating partial connectivity loss
-    for i in TAZ_nodes:
-        count = 0
-        for j in TAZ_nodes:
-            if i != j:
-                if nx.has_path(G_original, j, i):
-                    count = count + 1
-        o.pcl_table.at[i, 'NS0'] = count
 
-    att = nx.get_edge_attributes(G_original, 'weight')
-    o.wcl_table = calc_weighted_connectivity_loss(
-        G_original, att, TAZ_nodes, TAZ_nodes, o.wcl_table, o.pcl_table, 'WS0',
-        'NS0')
-
-    N = len(G_original)
-    att = nx.get_edge_attributes(G_original, 'weight')
-    o.eff_table = calc_efficiency(G_original, N, att, o.eff_table, 'Eff0')
-
-    logging.info('Checking for every event after earthquake')
-    for event_id, event_damage_df in damage_df.groupby("event_id"):
-        update_taz(o, event_id, event_damage_df, G_original, g_type,
-                   TAZ_nodes, eff_nodes, N, att)
-    return o
-
-
-def EL_node(expo_df, G_original, eff_nodes, damage_df, g_type):
+def EL_node(expo_df, G_original, eff_nodes, damage_df, g_type, dstore):
     # when no information about supply or demand is given or known,
     # only efficiency loss is calculated for all nodes
-
-    # To store the information of the performance indicators at connectivity
-    # level
-    node_el = expo_df[expo_df['type'].str.lower() == 'node'].iloc[:, 0:1]
-
-    eff_table = pd.DataFrame({'id': eff_nodes})
-    eff_table.set_index("id", inplace=True)
-
-    # Create an empty dataframe with columns "event_id" and "EL"
+    graph, _targets, res = run_connectivity(
+        dstore, G_original, damage_df, 'generic')
     event_connectivity_loss_eff = pd.DataFrame(
-        {'event_id': pd.Series(dtype=int), 'EL': pd.Series(dtype=float)})
-
-    # To check the the values for each node before the earthquake event
-
-    N = len(G_original)
-    att = nx.get_edge_attributes(G_original, 'weight')
-    eff_table = calc_efficiency(G_original, N, att, eff_table, 'Eff0')
-
-    logging.info('Checking for every event after earthquake')
-    for event_id, event_damage_df in damage_df.groupby("event_id"):
-        G = cleanup_graph(G_original, event_damage_df, g_type)
-
-        # Checking if there is a path between any souce to each demand node.
-        # Some demand nodes and source nodes may have been eliminated from
-        # the network due to damage, so we do not need to check their
-        # functionalities
-        extant_eff_nodes = sorted(set(eff_nodes) & set(G.nodes))
-
-        # If demand nodes are damaged itself (Example, building collapsed where
-        # demand node is considered)
-        eff_table.loc[~eff_table.index.isin(extant_eff_nodes), 'Eff'] = 0
-
-        # To check the the values for each node after the earthquake event
-        eff_table = calc_efficiency(G, N, att, eff_table, 'Eff')
-
-        # Computing the mean of the connectivity loss to consider the overall
-        # performance of the area (at global level)
-        Glo_eff0_per_event = eff_table['Eff0'].mean()
-        Glo_eff_per_event = eff_table['Eff'].mean()
-        Glo_effloss_per_event = (
-            Glo_eff0_per_event - Glo_eff_per_event)/Glo_eff0_per_event
-
-        # Storing the value of performance indicators for each event
-        event_connectivity_loss_eff = pd.concat(
-            [event_connectivity_loss_eff, pd.DataFrame.from_records(
-                [{'event_id': event_id, 'EL': Glo_effloss_per_event}])],
-            ignore_index=True)
-
-        # To store the sum of performance indicator at nodal level to calulate
-        # the average afterwards
-        eff_table1 = eff_table.drop(columns=['Eff0', 'Eff'])
-        eff_table1 = eff_table1.reset_index()
-        node_el = pd.concat(
-            (node_el, eff_table1)).groupby('id', as_index=False).sum()
-
-    return node_el, event_connectivity_loss_eff
+        {'event_id': res['event_id'], 'EL': res['EL']})
+    return get_node_el(graph, res), event_connectivity_loss_eff
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (C) 2025 GEM Foundation
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import numpy
+import networkx as nx
+from openquake.risklib.connectivity import CompactGraph, get_state
+
+aac = numpy.testing.assert_allclose
+
+
+def build_graph(directed, weighted):
+    # a small network with a parallel edge and a disconnected node
+    G = nx.MultiDiGraph() if directed else nx.MultiGraph()
+    G.add_nodes_from(['A', 'B', 'C', 'D', 'E', 'F'])
+    edges = [('A', 'B', 1.), ('B', 'C', 2.), ('A', 'C', 4.),
+             ('C', 'D', 1.), ('A', 'C', 3.), ('D', 'B', 2.)]
+    for i, (u, v, w) in enumerate(edges):
+        if weighted:
+            G.add_edge(u, v, id='E%d' % i, weight=w)
+        else:
+            G.add_edge(u, v, id='E%d' % i)
+    return G
+
+
+def nx_efficiency(G, N, weighted):
+    # efficiency of each node, computed as in the networkx based version
+    eff = []
+    for node in G.nodes:
+        if weighted:
+            lengths = nx.single_source_dijkstra_path_length(
+                G, node, weight='weight')
+        else:
+            lengths = nx.single_source_shortest_path_length(G, node)
+        eff.append(sum(1 / x for x in lengths.values() if x) / (N - 1))
+    return numpy.array(eff)
+
+
+def nx_reach(G, sources, targets):
+    # number of sources connected to each target
+    return numpy.array([sum(nx.has_path(G, s, t) for s in sources)
+                        for t in targets])
+
+
+class CompactGraphTestCase(unittest.TestCase):
+
+    def check(self, directed, weighted):
+        G = build_graph(directed, weighted)
+        graph = CompactGraph(G)
+        sources = numpy.array([graph.idx['A'], graph.idx['D']])
+        targets = numpy.array([graph.idx[n] for n in 'BCEF'])
+
+        # undamaged network
+        state = get_state(graph, 'demand', sources, targets)
+        aac(state['Eff'], nx_efficiency(G, graph.N, weighted))
+        aac(state['NS'], nx_reach(G, 'AD', 'BCEF'))
+
+        # removing the node C and the edge A-B
+        H = G.copy()
+        H.remove_node('C')
+        H.remove_edges_from([(u, v, k) for u, v, k, data in
+                             H.edges(keys=True, data=True)
+                             if data['id'] == 'E0'])
+        dead_edge = graph.edge_ids.index('E0')
+        state = get_state(graph, 'demand', sources, targets,
+                          numpy.array([graph.idx['C']]),
+                          numpy.array([dead_edge]))
+        eff = state['Eff']
+        self.assertEqual(eff[graph.idx['C']], 0)
+        eff = numpy.delete(eff, graph.idx['C'])
+        aac(eff, nx_efficiency(H, graph.N, weighted))
+        ns = state['NS']
+        self.assertEqual(ns[1], 0)  # C is dead
+        aac(ns[[0, 2, 3]], nx_reach(H, 'AD', 'BEF'))
+
+    def test_undirected(self):
+        self.check(directed=False, weighted=False)
+
+    def test_undirected_weighted(self):
+        self.check(directed=False, weighted=True)
+
+    def test_directed(self):
+        self.check(directed=True, weighted=False)
+
+    def test_directed_weighted(self):
+        self.check(directed=True, weighted=True)
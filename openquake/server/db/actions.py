@@ -18,6 +18,7 @@
 import os
 import getpass
 import operator
+import collections
 from datetime import datetime, timezone
 
 from openquake.baselib import general
@@ -298,6 +299,50 @@ def finish(db, job_id, status):
        job_id)
 
 
+def admit_job(db, job_id, max_jobs, avail_mb):
+    """
+    Decide if a submitted job can start executing. The jobs submitted on
+    the same host are ordered by priority (higher first), then by number
+    of jobs already executing for the same user (fair share), then by ID;
+    the job is admitted if there are less than `max_jobs` executing jobs
+    and it is the first job in the queue requiring less than `avail_mb`.
+    If nothing is executing the first job in the queue is admitted as
+    soon as `avail_mb` is non-negative, to avoid starving the big jobs.
+
+    :param db:
+        a :class:`openquake.commonlib.dbapi.Db` instance
+    :param job_id:
+        ID of a job in status 'submitted'
+    :param max_jobs:
+        maximum number of jobs executing on the same host
+    :param avail_mb:
+        memory available on the host for a new job, in MB
+    :returns:
+        True if the job was admitted and set to 'executing', False otherwise
+    """
+    with db:  # serialize the admissions with an immediate transaction
+        db('BEGIN IMMEDIATE')
+        host = db('SELECT host FROM job WHERE id=?x', job_id, scalar=True)
+        jobs = db("SELECT id, status, user_name, priority, required_mb "
+                  "FROM job WHERE status IN ('executing', 'submitted') "
+                  "AND host IS ?x AND is_running=1 AND pid > 0", host)
+        running = [job for job in jobs if job.status == 'executing']
+        if len(running) >= max_jobs:
+            return False
+        per_user = collections.Counter(job.user_name for job in running)
+        queue = sorted((job for job in jobs if job.status == 'submitted'),
+                       key=lambda job: (-job.priority,
+                                        per_user[job.user_name], job.id))
+        admitted = [job for job in queue if job.required_mb <= avail_mb]
+        if not running and queue and avail_mb >= 0:
+            admitted.insert(0, queue[0])
+        if not admitted or admitted[0].id != job_id:
+            return False
+        db('UPDATE job SET ?D WHERE id=?x',
+           dict(status='executing', start_time=datetime.now(UTC)), job_id)
+    return True
+
+
 def del_calc(db, job_id, user, delete_file=True, force=False):
     """
     Delete a calculation and all associated outputs, if possible.
@@ -375,6 +420,21 @@ def log(db, job_id, timestamp, level, process, message):
        'VALUES (?X)', (job_id, timestamp, level, process, message))
 
 
+def log_many(db, records):
+    """
+    Write several log records in the database with a single statement.
+
+    :param db:
+        a :class:`openquake.commonlib.dbapi.Db` instance
+    :param records:
+        a list of tuples (job_id, timestamp, level, process, message)
+    """
+    with db:  # a single transaction, committed at the end
+        db('BEGIN')
+        db.insert('log', ['job_id', 'timestamp', 'level', 'process',
+                          'message'], records)
+
+
 def get_log(db, job_id):
     """
     Extract the logs as a big string
@@ -0,0 +1,3 @@
+ALTER TABLE job ADD COLUMN priority INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE job ADD COLUMN required_mb INTEGER NOT NULL DEFAULT 0;
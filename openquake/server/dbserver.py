@@ -41,6 +41,11 @@ class DbServer(object):
     def __init__(self, db, address, num_workers=5):
         self.db = db
         self.frontend = 'tcp://%s:%s' % address
+        self.logaddress = logs.get_log_address(address[0])
+        self.notifyaddress = logs.get_notify_address(address[0])
+        self.publisher = None  # PUB socket, set in .start
+        self.lock = threading.Lock()  # zmq sockets are not thread-safe
+        self.stored = {}  # sender -> number of log batches stored
         self.backend = 'inproc://dbworkers'
         self.num_workers = num_workers
         self.pid = os.getpid()
@@ -53,6 +58,9 @@ class DbServer(object):
                 if cmd == 'getpid':
                     sock.send(self.pid)
                     continue
+                elif cmd == 'logs_stored':  # batches stored for the sender
+                    sock.send(self.stored.get(args[0], 0))
+                    continue
                 elif cmd.startswith('workers_'):
                     master = w.WorkerMaster(args[0])  # zworkers
                     msg = getattr(master, cmd[8:])()
@@ -64,6 +72,27 @@ class DbServer(object):
                     sock.send(p.safely_call(self.db, (cmd,) + args))
                 else:  # action
                     sock.send(p.safely_call(func, (self.db,) + args))
+                    if cmd == 'finish':  # a slot is free
+                        self.notify(args[0])
+
+    def notify(self, job_id):
+        """
+        Notify the jobs waiting in the queue that the given job finished
+        """
+        if self.publisher is not None:
+            with self.lock:
+                self.publisher.send_pyobj(job_id)
+
+    def logworker(self, sock):
+        # a database worker storing the batches of log records
+        with sock:
+            for sender, batch_no, records in sock:
+                try:
+                    actions.log_many(self.db, records)
+                except Exception:
+                    logging.exception('Could not store %d log records',
+                                      len(records))
+                self.stored[sender] = batch_no
 
     def start(self):
         """
@@ -77,6 +106,10 @@ class DbServer(object):
             sock = z.Socket(self.backend, z.zmq.REP, 'connect')
             threading.Thread(target=self.dworker, args=(sock,)).start()
             dworkers.append(sock)
+        self.publisher = z.bind(self.notifyaddress, z.zmq.PUB)
+        sock = z.Socket(self.logaddress, z.zmq.PULL, 'bind')
+        threading.Thread(target=self.logworker, args=(sock,)).start()
+        dworkers.append(sock)
         logging.warning('DB server started with %s on %s, pid %d',
                         sys.executable, self.frontend, self.pid)
         # start frontend->backend proxy for the database workers
@@ -96,6 +129,10 @@ class DbServer(object):
         """
         Stop the DbServer
         """
+        if self.publisher is not None:
+            with self.lock:
+                self.publisher.close()
+                self.publisher = None
         self.db.close()
 
 
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright (C) 2025 GEM Foundation
+#
+# OpenQuake is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# OpenQuake is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with OpenQuake. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+from openquake.commonlib.dbapi import Db
+from openquake.server.db import actions
+from openquake.server.db.upgrade_manager import upgrade_db
+
+
+class ActionsTestCase(unittest.TestCase):
+    # the actions are tested against a temporary database with the
+    # same schema as the one used by the DbServer
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.db = Db(sqlite3.connect, self.path, isolation_level=None,
+                     detect_types=sqlite3.PARSE_DECLTYPES)
+        upgrade_db(self.db.conn)
+
+    def tearDown(self):
+        self.db.close()
+        os.remove(self.path)
+
+    def new_job(self, **kw):
+        dic = dict(description='test', user_name='user',
+                   calculation_mode='classical', ds_calc_dir='/tmp/calc')
+        dic.update(kw)
+        return self.db('INSERT INTO job (?S) VALUES (?X)',
+                       dic.keys(), dic.values()).lastrowid
+
+    def test_log_many(self):
+        job_id = self.new_job()
+        now = datetime.now(timezone.utc)
+        records = [(job_id, now, 'INFO', 'MainProcess', 'msg %d' % i)
+                   for i in range(3)]
+        actions.log_many(self.db, records)
+        msgs = self.db('SELECT message FROM log WHERE job_id=?x '
+                       'ORDER BY id', job_id)
+        self.assertEqual([r.message for r in msgs],
+                         ['msg 0', 'msg 1', 'msg 2'])
+
+        # an empty batch does nothing
+        actions.log_many(self.db, [])
+        self.assertEqual(self.db('SELECT count(*) FROM log', scalar=True), 3)
+
+    def submit(self, user_name='user', priority=0, required_mb=0,
+               status='submitted'):
+        return self.new_job(user_name=user_name, priority=priority,
+                            required_mb=required_mb, status=status,
+                            host='localhost', pid=1)
+
+    def status(self, job_id):
+        return self.db('SELECT status FROM job WHERE id=?x', job_id,
+                       scalar=True)
+
+    def test_admit_priority(self):
+        low = self.submit(priority=0)
+        high = self.submit(priority=1)
+        self.assertFalse(actions.admit_job(self.db, low, 2, 1000))
+        self.assertEqual(self.status(low), 'submitted')
+        self.assertTrue(actions.admit_job(self.db, high, 2, 1000))
+        self.assertEqual(self.status(high), 'executing')
+        self.assertTrue(actions.admit_job(self.db, low, 2, 1000))
+        self.assertEqual(self.status(low), 'executing')
+
+    def test_admit_max_jobs(self):
+        self.submit(status='executing')
+        job = self.submit()
+        self.assertFalse(actions.admit_job(self.db, job, 1, 1000))
+        self.assertTrue(actions.admit_job(self.db, job, 2, 1000))
+
+    def test_admit_fair_share(self):
+        self.submit(user_name='alice', status='executing')
+        alice = self.submit(user_name='alice')
+        bob = self.submit(user_name='bob')
+        # bob goes first, since alice has already a job executing
+        self.assertFalse(actions.admit_job(self.db, alice, 3, 1000))
+        self.assertTrue(actions.admit_job(self.db, bob, 3, 1000))
+        self.assertTrue(actions.admit_job(self.db, alice, 3, 1000))
+
+    def test_admit_required_mb(self):
+        self.submit(status='executing')
+        big = self.submit(required_mb=2000)
+        small = self.submit(required_mb=500)
+        # the big job is skipped since there is not enough memory
+        self.assertFalse(actions.admit_job(self.db, big, 3, 1000))
+        self.assertTrue(actions.admit_job(self.db, small, 3, 1000))
+        self.assertEqual(self.status(big), 'submitted')
+
+    def test_admit_starvation_guard(self):
+        # with nothing executing the first job is admitted even if it
+        # requires more than the available memory
+        big = self.submit(required_mb=2000)
+        small = self.submit(required_mb=500)
+        self.assertFalse(actions.admit_job(self.db, small, 3, 1000))
+        self.assertTrue(actions.admit_job(self.db, big, 3, 1000))
+        # but not if the available memory is negative
+        self.db('UPDATE job SET status=?x WHERE id=?x', 'complete', big)
+        other = self.submit(required_mb=2000)
+        self.assertFalse(actions.admit_job(self.db, other, 3, -1))
@@ -0,0 +1,49 @@
+# this is useful to compare the accuracy and speed of fast_poes=true
+# (interpolation of the truncnorm_sf table) with the exact PoEs, by running
+# the given classical calculations twice; examples:
+# python bench_fast_poes.py
+# python bench_fast_poes.py /path/to/job.ini
+
+import os
+import sys
+import numpy
+from openquake.baselib import performance
+from openquake.baselib.python3compat import decode
+from openquake.calculators.base import run_calc
+from openquake.qa_tests_data.classical import case_01, case_12, case_22
+
+QA_CASES = [case_01, case_12, case_22]
+
+
+def get_poes_time(dstore):
+    # total time spent in the get_poes operation, in seconds
+    for op, time_sec, _mem, _counts in performance.performance_view(dstore):
+        if decode(op) == 'get_poes':
+            return time_sec
+    return 0.
+
+
+def get_curves(dstore):
+    key = 'hcurves-stats' if 'hcurves-stats' in dstore else 'hcurves-rlzs'
+    return dstore[key][:]
+
+
+def main(job_inis):
+    for job_ini in job_inis:
+        exact = run_calc(job_ini, fast_poes='false').datastore
+        fast = run_calc(job_ini, fast_poes='true').datastore
+        curves = get_curves(exact)
+        diff = numpy.abs(get_curves(fast) - curves)
+        dt_exact, dt_fast = get_poes_time(exact), get_poes_time(fast)
+        print(job_ini)
+        print('max abs diff: %.2E, max rel diff: %.2E' % (
+            diff.max(), (diff / numpy.maximum(curves, 1E-12)).max()))
+        print('get_poes exact: %.3f s, fast: %.3f s, speedup: %.1fx' % (
+            dt_exact, dt_fast, dt_exact / dt_fast if dt_fast else 0.))
+
+
+if __name__ == '__main__':
+    job_inis = sys.argv[1:] or [
+        os.path.join(os.path.dirname(case.__file__), 'job.ini')
+        for case in QA_CASES]
+    main(job_inis)
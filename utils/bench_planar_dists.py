@@ -0,0 +1,75 @@
+# this is useful to compare the fused kernel get_dists_planar with
+# the previous approach (project + one get_<dist> call per distance);
+# examples:
+# python bench_planar_dists.py 1000 10000
+# python bench_planar_dists.py 100 100000
+
+import sys
+import time
+import numpy
+from openquake.hazardlib.geo import utils as geo_utils
+from openquake.hazardlib.geo.surface import planar
+
+DISTS = ['rjb', 'rx', 'ry0', 'rhypo', 'repi', 'azimuth']
+
+
+def build_planars(U):
+    # build U planar ruptures with random strikes and dips around (10, 45)
+    rng = numpy.random.default_rng(42)
+    planin = numpy.zeros((1, U), planar.planin_dt).view(numpy.recarray)
+    planin['mag'] = 6.
+    planin['strike'] = rng.uniform(0., 360., U)
+    planin['dip'] = rng.uniform(10., 90., U)
+    planin['rake'] = 90.
+    planin['rate'] = 1.
+    planin['area'] = 300.
+    hdd = numpy.array([[1., 10.]])
+    arr = planar.build_planar(planin, hdd, 10., 45., 0., 20., 1.5)
+    return arr.reshape(-1, 3)
+
+
+def build_points(N):
+    rng = numpy.random.default_rng(42)
+    lons = 10. + rng.uniform(-2, 2, N)
+    lats = 45. + rng.uniform(-2, 2, N)
+    return geo_utils.spherical_to_cartesian(lons, lats, 0.)
+
+
+def numpy_path(arr, points):
+    out = [planar.project(arr, points)]
+    for dist in DISTS:
+        out.append(getattr(planar, 'get_' + dist)(arr, points))
+    return out
+
+
+def fused_path(arr, points):
+    codes = numpy.uint8([planar.DIST_CODES[dist] for dist in DISTS])
+    return planar.get_dists_planar(arr, points, codes)
+
+
+def main(U, N):
+    arr, points = build_planars(U), build_points(N)
+    # warm up the compiled functions on a small input
+    numpy_path(arr[:1], points[:1])
+    fused_path(arr[:1], points[:1])
+    t0 = time.time()
+    expected = numpy_path(arr, points)
+    dt_old = time.time() - t0
+    t0 = time.time()
+    dists = fused_path(arr, points)
+    dt_new = time.time() - t0
+    numpy.testing.assert_allclose(dists[:3], expected[0], atol=1E-6)
+    for d, dist in enumerate(DISTS):
+        numpy.testing.assert_allclose(
+            dists[3 + d], expected[1 + d], atol=1E-6, err_msg=dist)
+    print('%d ruptures x %d sites' % (U, N))
+    print('project + get_<dist>: %.3f s' % dt_old)
+    print('get_dists_planar:     %.3f s' % dt_new)
+    print('speedup: %.1fx' % (dt_old / dt_new))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    U = int(args[0]) if args else 1000
+    N = int(args[1]) if len(args) > 1 else 10_000
+    main(U, N)